@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Spreading the loop templates over the attempts of a search
+#
+# ------------------------------------------------------------------------------
+
+import math
+
+# value of --loop that makes mimic-core use a loop-free template
+LOOP_FREE = -2
+# only the best-ranked loop proposals are considered (mimic-core rarely picks any others)
+max_templates_default = 6
+
+def template_name(arm):
+  if arm == LOOP_FREE:
+    return "loop-free"
+  return "loop %d" % (arm + 1)
+
+class LoopBandit(object):
+  """
+  Chooses the loop template (the value of --loop for mimic-core) for every attempt, treating
+  the templates as the arms of a multi-armed bandit (using UCB1).  An attempt that succeeds
+  has reward 1, and one that fails is rewarded by the best score it reached (at most 0.5), so
+  that the attempts shift towards the templates that make the most progress.  Templates that
+  were never tried are handed out first, in the order in which they were ranked.
+  """
+  def __init__(self, loops, max_templates=max_templates_default):
+    self.arms = range(min(loops, max_templates)) + [LOOP_FREE]
+    self.pulls = dict([(a, 0) for a in self.arms])
+    self.rewards = dict([(a, 0.0) for a in self.arms])
+    self.successes = dict([(a, 0) for a in self.arms])
+    self.total = 0
+
+  def next_arm(self):
+    """Return the template to use for the next attempt."""
+    for a in self.arms:
+      if self.pulls[a] == 0:
+        self.pull(a)
+        return a
+    def ucb(a):
+      return self.rewards[a] / self.pulls[a] + math.sqrt(2.0 * math.log(self.total) / self.pulls[a])
+    best = max(self.arms, key=ucb)
+    self.pull(best)
+    return best
+
+  def pull(self, arm):
+    """Count an attempt with the given template (that was not chosen by next_arm)."""
+    if arm in self.pulls:
+      self.pulls[arm] += 1
+      self.total += 1
+
+  def record(self, arm, success, best=None):
+    """Record the outcome of an attempt with the given template, and the best score it reached (if known)."""
+    if arm not in self.rewards:
+      return
+    if success:
+      self.rewards[arm] += 1.0
+      self.successes[arm] += 1
+    elif best is not None:
+      self.rewards[arm] += 0.5 / (1.0 + best)
+
+  def summary(self):
+    return ", ".join(["%s: %d attempts (avg. reward %.2f)" % (template_name(a), self.pulls[a], self.rewards[a] / max(1, self.pulls[a]))
+                      for a in self.arms if self.pulls[a] > 0])
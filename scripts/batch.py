@@ -0,0 +1,277 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Synthesize models for all functions in a manifest, sharing the cores among them
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import json
+import time
+import math
+import shlex
+import argparse
+import threading
+import Queue as queue
+import common
+import colors
+import status
+import run
+import jobs
+import cache
+import ledger
+
+line = "-" * 80
+argv = None # the arguments
+
+# ------------------------------------------
+# main entry point
+# ------------------------------------------
+
+def main():
+  parser = argparse.ArgumentParser(description='Synthesize models for all functions in a manifest (in the format of tests/array.json), and write them to a single file.',
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('manifest', type=str, help='The functions to synthesize models for')
+  parser.add_argument('--out', type=str, help='The file to write the models to', default="models.js")
+  parser.add_argument('--cores', metavar='<n>', type=int, help='Number of cores that all functions together may use',
+                      default=jobs.get_cores())
+  parser.add_argument('--deadline', metavar='<seconds>', type=float,
+                      help='Give up on functions without a model after this many seconds (0 = never; a "deadline" in the manifest takes precedence)',
+                      default=0)
+  parser.add_argument('--metric', metavar="<m>", type=int, help='The metric to use (0 for default, 1 for naive metric)',
+                      default=0)
+  parser.add_argument('--args', metavar='<args>', type=str, help='Arguments to be passed to mimic-core', default="")
+  parser.add_argument('--no-cache', help='Don\'t use (or update) the cache of previously synthesized models',
+                      action='store_true')
+
+  global argv
+  argv = parser.parse_args()
+
+  if argv.args != "":
+    run.core_args = shlex.split(argv.args)
+
+  try:
+    entries = json.loads(open(argv.manifest).read())
+  except (ValueError, IOError) as ex:
+    print "Failed to read manifest: " + str(ex)
+    sys.exit(1)
+
+  # identical functions (with the same inputs) are only synthesized once
+  batch = {} # key -> BatchJob
+  order = []
+  for e in entries:
+    f = common.Function(e, "-")
+    key = cache.model_key(f, argv.metric, run.core_args)
+    if key not in batch:
+      deadline = e.get('deadline', argv.deadline)
+      batch[key] = BatchJob(key, f, deadline if deadline > 0 else None)
+      order.append(key)
+    batch[key].names.append(f.shortname)
+  print "Synthesizing models for %d functions (%d unique) with %d cores" % (len(entries), len(batch), argv.cores)
+  print line
+
+  models = cache.ModelCache()
+  todo = []
+  for key in order:
+    job = batch[key]
+    if not argv.no_cache:
+      job.result = models.get(key)
+    if job.result is not None:
+      print colors.grey("Found a cached model for %s" % ", ".join(job.names))
+    else:
+      job.expected = ledger.get_ledger(job.f, argv.metric, run.core_args).expected_time()
+      todo.append(job)
+
+  scheduler = Scheduler(todo, argv.cores, argv.metric)
+  scheduler.run()
+  for job in todo:
+    if job.result is not None and not argv.no_cache:
+      models.put(job.key, job.result)
+
+  print line
+  failed = [batch[key] for key in order if batch[key].result is None]
+  write_models(argv.out, [batch[key] for key in order])
+  print "Wrote %d models to '%s'" % (len(order) - len(failed), argv.out)
+  if len(failed) > 0:
+    print colors.red("No model for: %s" % ", ".join([", ".join(job.names) for job in failed]))
+    sys.exit(1)
+
+def write_models(fn, batch):
+  """Write all models in batch to a single file, one function per name."""
+  models = []
+  for job in batch:
+    if job.result is None:
+      continue
+    code = job.result.result_code.strip()
+    for name in job.names:
+      # mimic-core always calls the model 'f'
+      models.append(code.replace("function f(", "function %s(" % name, 1))
+  common.fprint(fn, "\n" + "\n\n".join(models) + "\n")
+
+class BatchJob(object):
+  def __init__(self, key, f, deadline):
+    """
+    :type f: common.Function
+    """
+    self.key = key
+    self.f = f
+    self.names = []
+    self.deadline = deadline # in seconds after the start of the batch (or None)
+    self.expected = None # the expected time to find a model on a single thread
+    self.result = None
+    self.threads = 0
+    self.search = None # the run.Search, while the job runs
+    self.started = None
+
+def split(cores, weights):
+  """
+  Split a number of cores in proportion to weights: every share is rounded down, and the cores
+  that remain go to the largest weight.  Returns the number of cores for every weight.
+  """
+  total = float(sum(weights))
+  if len(weights) == 0:
+    return []
+  if total <= 0:
+    weights = [1] * len(weights)
+    total = float(len(weights))
+  shares = [int(math.floor(cores * w / total)) for w in weights]
+  shares[weights.index(max(weights))] += cores - sum(shares)
+  return shares
+
+class Scheduler(object):
+  """
+  Runs mimic for a list of jobs at the same time, on at most a given number of cores in total,
+  with a single pool of mimic-core workers (one per core) for all of them.  Jobs with a deadline
+  go first (earliest deadline first), followed by the others in the order of their expected time
+  (longest first).  Whenever cores are free (at the start, and whenever a job finishes), the next
+  jobs start, as many as there are free cores, and the free cores are then split among all jobs
+  that run in proportion to their expected time (every job that starts gets at least one core),
+  so that the hard functions get most cores, and the cores of jobs that finish are handed to the
+  jobs that are still running once no more jobs wait.  Jobs that miss their deadline are stopped.
+  """
+  def __init__(self, batch, cores, metric):
+    self.batch = batch
+    self.cores = cores
+    self.metric = metric
+    self.waiting = sorted(batch, key=self.order)
+    self.running = []
+    self.free = cores
+
+  def order(self, job):
+    if job.deadline is not None:
+      return (0, job.deadline, -job.expected)
+    return (1, 0, -job.expected)
+
+  def assign(self):
+    """
+    Start the next jobs (as many as there are free cores), and split the free cores among them
+    and the jobs that are already running.  Returns the jobs that were started.
+    """
+    if self.free == 0:
+      return []
+    started = self.waiting[:self.free]
+    del self.waiting[:len(started)]
+    jobs = started + self.running
+    shares = split(self.free - len(started), [j.expected for j in jobs])
+    for job, share in zip(jobs, shares):
+      job.threads += share + (1 if job in started else 0)
+    self.free = 0
+    self.running += started
+    return started
+
+  def release(self, job):
+    """A job finished (or was stopped), and its cores are free again."""
+    self.running.remove(job)
+    self.free += job.threads
+
+  def run(self):
+    start = time.time()
+    pool = run.get_pool(self.cores)
+    stat = status.get_status()
+    stat.set_message("Synthesizing models...")
+    stat.init_progress(len(self.batch))
+    searches = {} # generation of the search -> job
+    # setting up a search (precomputing the bundle, looking for similar models) takes a while, so
+    # it happens on another thread, while the jobs that run already are served
+    setup = queue.Queue() # jobs to set up a search for (None to stop)
+    ready = queue.Queue() # (job, its run.Search or the exception raised while setting it up)
+    def setup_loop():
+      while True:
+        job = setup.get()
+        if job is None:
+          return
+        try:
+          ready.put((job, run.Search(pool, job.f, self.metric, job.threads)))
+        except Exception as ex:
+          ready.put((job, ex))
+    setter = threading.Thread(target=setup_loop)
+    setter.daemon = True
+    setter.start()
+    pending = 0
+    def finish(job, res):
+      job.result = res
+      job.search = None
+      self.release(job)
+      stat.inc_progress(force_update=True)
+      if res is None:
+        stat.writeln(colors.red("No model found for %s" % ", ".join(job.names)))
+      else:
+        stat.writeln("Found a model for %s in %.2f seconds" % (", ".join(job.names), time.time() - job.started))
+    while len(self.waiting) > 0 or len(self.running) > 0:
+      for job in self.assign():
+        job.started = time.time()
+        setup.put(job)
+        pending += 1
+      while True:
+        try:
+          job, search = ready.get_nowait()
+        except queue.Empty:
+          break
+        pending -= 1
+        if job not in self.running:
+          # it missed its deadline while it was set up
+          continue
+        if isinstance(search, Exception):
+          stat.writeln(colors.red("Failed to start %s: %s" % (", ".join(job.names), search)))
+          finish(job, None)
+          continue
+        job.search = search
+        searches[search.generation] = job
+        stat.writeln(colors.grey("Started %s with %d threads" % (", ".join(job.names), job.threads)))
+      for job in self.running:
+        if job.search is not None:
+          # the search picks up any threads it was given since it started
+          job.search.threads = job.threads
+          job.search.fill()
+      # check for searches that are set up more often
+      data = run.next_message(pool, 0.1 if pending > 0 else 1)
+      now = time.time()
+      for job in list(self.running):
+        if job.deadline is not None and now - start > job.deadline:
+          stat.writeln(colors.red("Stopping %s, which missed its deadline" % ", ".join(job.names)))
+          if job.search is not None:
+            job.search.abandon()
+          finish(job, None)
+      if data is None:
+        continue
+      job = searches.get(data[1][0])
+      if job is None or job.search is None:
+        # a late message from a job that is done
+        continue
+      try:
+        res = job.search.handle(data)
+      except run.SearchFailed as ex:
+        stat.writeln(colors.red("%s %s" % (", ".join(job.names), ex)))
+        stat.writeln(ex.output)
+        finish(job, None)
+        continue
+      if res is not None:
+        finish(job, res)
+    setup.put(None)
+    stat.end_progress()
+    run.shutdown_pool()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Benchmark mimic, and compare against earlier results
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import os
+import math
+import argparse
+import numpy as np
+import common
+import colors
+import status
+import experiment
+import jobs
+import journal
+import process
+import topology
+
+line = "-" * 80
+argv = None # the arguments
+
+# the functions in every tier, and the default number of repetitions
+tiers = {
+  'small': (["pop", "forEach", "some", "map"], 5),
+  'medium': (["pop", "forEach", "some", "map", "filter", "reduce", "indexOf", "lastIndexOf", "sum"], 10),
+  'full': (None, 20),
+}
+
+# ------------------------------------------
+# main entry point
+# ------------------------------------------
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark mimic on the examples, and compare the time to find a model against a baseline.')
+  parser.add_argument('tier', type=str, choices=sorted(tiers.keys()), help='Which functions to run')
+  parser.add_argument('-n', type=int, help='Number of repetitions (default depends on the tier)', default=-1)
+  parser.add_argument('-j', '--jobs', type=int, help='Number of runs of mimic to do at the same time', default=1)
+  parser.add_argument('-t', '--threads', type=int, help='Number of threads per run of mimic (-1 = split the cores evenly among the jobs)', default=-1)
+  parser.add_argument('--cores', type=int, help='Number of cores that all jobs together may use', default=jobs.get_cores())
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='How to pin the workers of every job to physical cores of their own (see mimic --help)', default="none")
+  parser.add_argument('--baseline', type=str, metavar='<folder>',
+                      help='Results to compare against (an experiment or an earlier benchmark; "<latest>" for the latest benchmark of this tier, "" for none)',
+                      default="<latest>")
+  parser.add_argument('--results', type=str, metavar='<folder>', help='Don\'t run anything, but compare the results in this folder against the baseline', default="")
+  parser.add_argument('--alpha', type=float, help='Significance level for the test for regressions', default=0.05)
+  parser.add_argument('--tolerance', type=float, help='Slowdowns of the median time of at most this fraction are not regressions', default=0.1)
+
+  global argv
+  argv = parser.parse_args()
+
+  workdir = os.path.abspath(os.path.dirname(__file__) + "/../tests")
+  names, n = tiers[argv.tier]
+  if argv.n > 0:
+    n = argv.n
+  fncs = [f for f in experiment.parse_functions(workdir) if names is None or f.shortname in names]
+
+  outdir = workdir + "/out"
+  baseline = argv.baseline
+  if baseline == "<latest>":
+    baseline = latest_bench(outdir, argv.tier)
+
+  if argv.results != "":
+    out = os.path.abspath(argv.results)
+  else:
+    out = run_bench(outdir, fncs, n)
+
+  data = process.Results(journal.read_results(out))
+  base = None
+  if baseline is not None and baseline != "" and os.path.abspath(baseline) != out:
+    print "Comparing against: %s" % baseline
+    base = process.Results(journal.read_results(baseline))
+  else:
+    print "No baseline to compare against"
+  print ""
+  regressions = compare(data, base, [f.title for f in fncs])
+  if len(regressions) > 0:
+    print colors.red("Regressions: %s" % ", ".join(regressions))
+    sys.exit(1)
+  print colors.green("No regressions")
+
+def latest_bench(outdir, tier):
+  """The folder of the latest benchmark of the given tier, or None."""
+  if not os.path.exists(outdir):
+    return None
+  folders = sorted([f for f in os.listdir(outdir) if f.endswith("_bench_" + tier)])
+  if len(folders) == 0:
+    return None
+  return outdir + "/" + folders[-1]
+
+def run_bench(outdir, fncs, n):
+  """Run mimic n times for all functions, and return the folder with the results."""
+  if not os.path.exists(outdir):
+    os.mkdir(outdir)
+  out = outdir + "/" + common.get_time(True) + "_bench_" + argv.tier
+  os.mkdir(out)
+  threads = jobs.split_cores(argv.cores, argv.jobs, argv.threads)
+  common.fprint(out + "/readme.txt", "Arguments: " + " ".join(sys.argv) + "\n" +
+                "Time: " + common.get_time() + "\n" +
+                "  function(s):        %d\n" % len(fncs) +
+                "  repetitions:        %d\n" % n +
+                "  concurrent jobs:    %d (with %d threads each)\n" % (argv.jobs, threads))
+  print "Running benchmark (%s tier, %d functions, %d repetitions)..." % (argv.tier, len(fncs), n)
+  print line
+  results = journal.Journal(out + "/" + journal.JOURNAL)
+  stat = status.get_status()
+  stat.set_message("Running benchmark...")
+  stat.init_progress(len(fncs) * n)
+  runner = jobs.JobRunner(argv.jobs, threads, argv.placement)
+  lookup = {}
+  c = 0
+  for f in fncs:
+    for i in range(n):
+      runner.submit_independent(c, f, metric=0)
+      lookup[c] = (f, i)
+      c += 1
+  while runner.pending() > 0:
+    c, res = runner.next_result()
+    f, i = lookup[c]
+    stat.inc_progress(force_update=True)
+    if res is None:
+      stat.writeln("Running mimic for %s failed" % f.shortname)
+      continue
+    results.append({'task': (f.title, i, 0), 'result': res})
+  results.close()
+  runner.close()
+  stat.end_progress()
+  print line
+  return out
+
+def compare(data, base, functions):
+  """
+  Print the statistics for every function (compared to the baseline, if any), and return the
+  functions for which the time to find a model regressed significantly.
+  :type data: process.Results
+  :type base: process.Results
+  """
+  regressions = []
+  header = ["Function", "Runs", "Median time", "Baseline", "Change", "p-value", "It/s", "Attempts", "Crashes", "Overhead"]
+  cols = map(lambda x: [], header)
+  for f in functions:
+    times = data.get("total_time", f, 0)
+    if len(times) == 0:
+      continue
+    core = data.get("core_time", f, 0)
+    its = data.get("iterations", f, 0) / np.maximum(core, 1e-3)
+    row = [data.first[f].f.shortname, str(len(times)), "%.2f" % np.median(times)]
+    btimes = base.get("total_time", f, 0) if base is not None and f in base.first else []
+    if len(btimes) > 0:
+      change = (np.median(times) - np.median(btimes)) / np.median(btimes)
+      p = mann_whitney(times, btimes)
+      row += ["%.2f" % np.median(btimes), "%+.1f%%" % (100 * change), "%.3f" % p]
+      if p < argv.alpha and change > argv.tolerance:
+        regressions.append(data.first[f].f.shortname)
+        row[4] += " (!)"
+    else:
+      row += ["n/a", "n/a", "n/a"]
+    # the time that was not spent in the successful search: failed attempts and orchestration
+    overhead = np.mean((times - core) / np.maximum(times, 1e-3))
+    row += ["%.0f" % np.mean(its), "%.1f" % np.mean(data.get("total_searches", f, 0)),
+            "%.1f" % np.mean(data.get("total_crashes", f, 0)), "%.1f%%" % (100 * overhead)]
+    for i in range(len(row)):
+      cols[i].append(row[i])
+  process.print_table(header, cols)
+  print ""
+  return regressions
+
+def mann_whitney(a, b):
+  """
+  One-sided Mann-Whitney U test (with the normal approximation): the p-value for the hypothesis
+  that values in a tend to be larger than those in b.
+  """
+  a = np.asarray(a, dtype=float)
+  b = np.asarray(b, dtype=float)
+  n1 = len(a)
+  n2 = len(b)
+  both = np.concatenate([a, b])
+  # ranks (starting at 1), with ties getting the average rank
+  order = np.argsort(both, kind="mergesort")
+  ranks = np.empty(len(both))
+  sorted_vals = both[order]
+  i = 0
+  while i < len(both):
+    j = i
+    while j + 1 < len(both) and sorted_vals[j+1] == sorted_vals[i]:
+      j += 1
+    ranks[order[i:j+1]] = (i + j) / 2.0 + 1
+    i = j + 1
+  u = np.sum(ranks[:n1]) - n1 * (n1 + 1) / 2.0
+  _, counts = np.unique(both, return_counts=True)
+  n = n1 + n2
+  var = n1 * n2 / 12.0 * ((n + 1) - np.sum(counts ** 3 - counts) / float(n * (n - 1)))
+  if var <= 0:
+    return 1.0
+  z = (u - n1 * n2 / 2.0 - 0.5) / math.sqrt(var)
+  return 0.5 * math.erfc(z / math.sqrt(2))
+
+if __name__ == '__main__':
+  main()
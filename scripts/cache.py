@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Cache of synthesized models
+#
+# ------------------------------------------------------------------------------
+
+import os
+import cPickle
+import common
+
+# default bound on the size of the cache (in megabytes)
+max_size_default = 100
+
+def model_key(f, metric, core_args=[]):
+  """
+  The key for a model: everything that influences the search, and the build of mimic-core.
+  :type f: common.Function
+  """
+  return common.hash_key(f.argnames, f.code, f.arguments, f.loop, metric, core_args, common.get_core_build())
+
+class ModelCache(object):
+  """
+  Models (as common.MimicResult) stored on disk by key.  The least recently used models are
+  evicted once the cache grows beyond max_size megabytes.
+  """
+  def __init__(self, max_size=max_size_default):
+    self.dir = common.get_data_dir("models")
+    self.max_size = max_size * 1024 * 1024
+
+  def get(self, key):
+    """
+    :rtype: common.MimicResult
+    """
+    fn = self.dir + "/" + key + ".pickle"
+    if not os.path.exists(fn):
+      return None
+    try:
+      res = cPickle.loads(open(fn).read())
+    except Exception:
+      # corrupt or from an incompatible version
+      os.remove(fn)
+      return None
+    # mark as recently used
+    os.utime(fn, None)
+    return res
+
+  def put(self, key, result):
+    fn = self.dir + "/" + key + ".pickle"
+    tmp = "%s.%d.tmp" % (fn, os.getpid())
+    common.fprint(tmp, cPickle.dumps(result))
+    os.rename(tmp, fn)
+    self.evict()
+
+  def evict(self):
+    entries = []
+    for f in os.listdir(self.dir):
+      if f.endswith(".pickle"):
+        st = os.stat(self.dir + "/" + f)
+        entries.append((st.st_mtime, st.st_size, f))
+    entries.sort()
+    total = sum([e[1] for e in entries])
+    while total > self.max_size and len(entries) > 1:
+      mtime, size, f = entries.pop(0)
+      os.remove(self.dir + "/" + f)
+      total -= size
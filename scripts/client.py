@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Client for the mimic service (see service.py)
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import socket
+import common
+
+def get_socket_path():
+  """The Unix socket the service listens on (can be changed with $MIMIC_SERVICE)."""
+  return os.environ.get("MIMIC_SERVICE", common.get_data_dir() + "/service.sock")
+
+class ServiceError(Exception):
+  pass
+
+class Client(object):
+  """
+  A connection to the mimic service.  Requests and responses are JSON objects, one per line.
+  """
+  def __init__(self, path=None):
+    self.path = path if path is not None else get_socket_path()
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(self.path)
+    self.f = self.sock.makefile("rw")
+
+  def request(self, msg):
+    self.f.write(json.dumps(msg) + "\n")
+    self.f.flush()
+    l = self.f.readline()
+    if l == "":
+      raise ServiceError("the service closed the connection")
+    res = json.loads(l)
+    if not res['ok']:
+      raise ServiceError(res['error'])
+    return res
+
+  def submit(self, f, metric, options, core_args, priority=0):
+    """
+    Queue a job to synthesize a model for f, and return its id.
+    :type f: common.Function
+    """
+    return self.request({
+      'cmd': 'submit',
+      'argnames': f.argnames,
+      'function': f.code,
+      'arguments': f.arguments,
+      'loop': f.loop,
+      'metric': metric,
+      'options': options,
+      'args': core_args,
+      'priority': priority,
+    })['id']
+
+  def status(self, id=None):
+    """The status of a job (or of all jobs, if id is None)."""
+    return self.request({'cmd': 'status', 'id': id})
+
+  def wait(self, id):
+    """Wait for a job to finish, and return its status."""
+    return self.request({'cmd': 'wait', 'id': id})
+
+  def cancel(self, id):
+    return self.request({'cmd': 'cancel', 'id': id})
+
+  def shutdown(self):
+    return self.request({'cmd': 'shutdown'})
+
+  def close(self):
+    self.f.close()
+    self.sock.close()
+
+def connect(path=None):
+  """Connect to the service, or return None if it is not running."""
+  path = path if path is not None else get_socket_path()
+  if not os.path.exists(path):
+    return None
+  try:
+    return Client(path)
+  except socket.error:
+    return None
+
+def to_result(f, status):
+  """
+  The model of a finished job as a common.MimicResult (with no result file), or None if the
+  job did not succeed.
+  """
+  if status['state'] != "done":
+    return None
+  r = status['result']
+  return common.MimicResult(f, r['metric'], r['total_time'], r['iterations'], r['core_time'], r['total_searches'],
+                            r['total_crashes'], r['loop_index'], None, r['result_code'], r['threads'],
+                            r.get('cpu_time'), r.get('max_rss'), r.get('attempts'), r.get('configuration'),
+                            r.get('precompute_time'), r.get('restart_policy'))
+
+def from_result(result):
+  """The information in a common.MimicResult that is sent to clients."""
+  return {
+    'metric': result.metric,
+    'total_time': result.total_time,
+    'iterations': result.iterations,
+    'core_time': result.core_time,
+    'total_searches': result.total_searches,
+    'total_crashes': result.total_crashes,
+    'loop_index': result.loop_index,
+    'result_code': result.result_code,
+    'threads': result.threads,
+    'cpu_time': result.cpu_time,
+    'max_rss': result.max_rss,
+    'configuration': result.configuration,
+    'precompute_time': result.precompute_time,
+    'restart_policy': result.restart_policy,
+    'attempts': result.attempts,
+  }
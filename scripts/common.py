@@ -9,7 +9,11 @@
 #
 # ------------------------------------------------------------------------------
 
+import os
 import time
+import json
+import hashlib
+import signal
 import subprocess
 
 # print a string to a file
@@ -32,6 +36,41 @@ def get_time(no_space = False):
 def flatten(l):
   return [item for sublist in l for item in sublist]
 
+def flatten_iter(l):
+  for sublist in l:
+    for item in sublist:
+      yield item
+
+# directory where mimic keeps information between runs (can be changed with $MIMIC_HOME)
+def get_data_dir(sub=None):
+  d = os.environ.get("MIMIC_HOME", os.path.expanduser("~/.mimic"))
+  if sub is not None:
+    d = d + "/" + sub
+  if not os.path.exists(d):
+    os.makedirs(d)
+  return d
+
+core_build = None
+
+# a hash of the compiled mimic-core, to tell apart information computed by different builds
+def get_core_build():
+  global core_build
+  if core_build is None:
+    h = hashlib.sha1()
+    bin = os.path.abspath(os.path.dirname(__file__) + "/../bin")
+    for root, dirs, files in os.walk(bin):
+      dirs.sort()
+      for fn in sorted(files):
+        if fn.endswith(".js"):
+          h.update(fn)
+          h.update(open(root + "/" + fn).read())
+    core_build = h.hexdigest()
+  return core_build
+
+# a stable hash of a list of (json-serializable) values
+def hash_key(*parts):
+  return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
 # a function that we might want to synthesize
 class Function(object):
   def __init__(self, data, category):
@@ -76,7 +115,16 @@ def escapeCommandArg(s):
   return s.replace("\"", "\\\"")
 
 class MimicResult(object):
-  def __init__(self, f, metric, total_time, iterations, core_time, total_searches, total_crashes, loop_index, result_file, result_code):
+  threads = None # not available for results from older versions
+  cpu_time = None
+  max_rss = None
+  attempts = None
+  configuration = None
+  precompute_time = None
+  restart_policy = None
+
+  def __init__(self, f, metric, total_time, iterations, core_time, total_searches, total_crashes, loop_index, result_file, result_code, threads=None,
+               cpu_time=None, max_rss=None, attempts=None, configuration=None, precompute_time=None, restart_policy=None):
     self.f = f
     """:type : common.Function"""
     self.total_time = total_time
@@ -88,29 +136,70 @@ class MimicResult(object):
     self.result_code = result_code
     self.total_crashes = total_crashes
     self.metric = metric
+    self.threads = threads
+    self.cpu_time = cpu_time # of all attempts that reported back, in seconds
+    self.max_rss = max_rss # the peak over all attempts, in kilobytes
+    self.attempts = attempts # a record of every attempt (see run.attempt_record)
+    self.configuration = configuration # the search configuration that found the model (see portfolio.py)
+    self.precompute_time = precompute_time # to load or compute the bundle (not included in total_time)
+    self.restart_policy = restart_policy # that chose the timeouts of the attempts (see restart.py)
 
   def get_status(self, indent):
     s = ""
     s +=        indent + "Total time required:    %.2f seconds" % self.total_time
+    if self.precompute_time is not None:
+      s += "\n" + indent + "Precomputation:         %.2f seconds" % self.precompute_time
+    if self.threads is not None:
+      s += "\n" + indent + "Threads:                %d" % self.threads
+    if self.cpu_time is not None:
+      s += "\n" + indent + "CPU time:               %.2f seconds" % self.cpu_time
+      s += "\n" + indent + "Peak memory:            %.1f MB" % (self.max_rss / 1024.0)
+    stopped = self.count_attempts("stopped")
+    cancelled = self.count_attempts("cancelled")
     s += "\n" + indent + "Attempted searches:     %d" % self.total_searches
     s += "\n" + indent + "  Successful:           1"
-    s += "\n" + indent + "  Timeouts:             %d" % (self.total_searches-1-self.total_crashes)
+    s += "\n" + indent + "  Timeouts:             %d" % (self.total_searches-1-self.total_crashes-stopped-cancelled)
     s += "\n" + indent + "  Crashes:              %d" % (self.total_crashes)
+    if self.attempts is not None:
+      s += "\n" + indent + "  Stopped early:        %d" % stopped
+      s += "\n" + indent + "  Cancelled:            %d" % cancelled
     s += "\n" + indent + "Successful search:"
     s += "\n" + indent + "  Time:                 %.2f seconds" % self.core_time
     s += "\n" + indent + "  Iterations:           %d" % self.iterations
+    if self.configuration is not None:
+      s += "\n" + indent + "  Configuration:        %s" % self.configuration
+      s += "\n" + indent + "  Metric:               %d" % self.metric
+    if self.restart_policy is not None:
+      s += "\n" + indent + "  Restart policy:       %s" % self.restart_policy
     if self.loop_index == -1:
       s += "\n" + indent + "  using a loop-free template"
     else:
       s += "\n" + indent + "  using loop template with index %d" % self.loop_index
     return s
 
+  def count_attempts(self, outcome):
+    """The number of attempts with the given outcome (0 if the attempts were not recorded)."""
+    if self.attempts is None:
+      return 0
+    return len([r for r in self.attempts if r['outcome'] == outcome])
+
   def __repr__(self):
     return "%.2f seconds" % self.total_searches
 
 def execute(cmd, timeout=100000000):
+  """
+  Run cmd (with a timeout) and return (status, output).  The command runs in its own process
+  group, which is killed as a whole if we are interrupted.
+  """
+  p = subprocess.Popen("timeout " + str(timeout) + "s " + cmd, shell=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT, preexec_fn=os.setsid)
   try:
-    out = subprocess.check_output("timeout " + str(timeout) + "s " + cmd, shell=True, stderr=subprocess.STDOUT)
-    return (0, out)
-  except subprocess.CalledProcessError as ex:
-    return (ex.returncode, ex.output)
+    out, _ = p.communicate()
+  except BaseException:
+    try:
+      os.killpg(p.pid, signal.SIGKILL)
+    except OSError:
+      pass
+    p.wait()
+    raise
+  return (p.returncode, out)
@@ -0,0 +1,337 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Long-running mimic-core workers
+#
+# ------------------------------------------------------------------------------
+
+import os
+import re
+import gzip
+import json
+import time
+import select
+import signal
+import subprocess
+from collections import deque
+from distutils.spawn import find_executable
+
+# every line that mimic-core writes for us (rather than as a log) starts with this prefix
+MSG_PREFIX = "@mimic "
+
+# how long to wait past the timeout for a worker to report back before we kill it
+GRACE = 10
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+# bounds on the output of a job that is kept in memory (the rest only goes to the log, if any)
+tail_lines_default = 100
+max_errors = 10
+max_line = 4096
+
+ANSI_CODE = re.compile(r"\x1b\[[0-9;]*m")
+
+# used to pin workers to cores (python 2 cannot set the affinity of a process itself)
+TASKSET = find_executable("taskset")
+
+def kill_group(pid, sig):
+  """Send a signal to the process group led by pid (that is, a worker and all its children)."""
+  try:
+    os.killpg(pid, sig)
+  except OSError:
+    pass
+
+def read_usage(pid):
+  """
+  Return (cpu time in seconds, peak resident set size in kilobytes) of a running process, as
+  reported by /proc (or None if that is not available).
+  """
+  try:
+    with open("/proc/%d/stat" % pid) as fl:
+      # the command name in parentheses may contain spaces
+      fields = fl.read().rsplit(")", 1)[1].split()
+    cpu = float(int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    rss = 0
+    with open("/proc/%d/status" % pid) as fl:
+      for l in fl:
+        if l.startswith("VmHWM:"):
+          rss = int(l.split()[1])
+    return (cpu, rss)
+  except (IOError, IndexError, ValueError):
+    return None
+
+def reset_peak_rss(pid):
+  """Reset the peak resident set size of a process, so that it can be measured per job."""
+  try:
+    with open("/proc/%d/clear_refs" % pid, "w") as fl:
+      fl.write("5")
+  except IOError:
+    pass
+
+class OutputTail(object):
+  """
+  The output of a job, of which only the last lines are kept in memory, together with the first
+  few error messages (wherever they occur).  Optionally, the complete output is written to a
+  compressed log file.
+  """
+  def __init__(self, lines=tail_lines_default, log=None):
+    self.tail = deque(maxlen=lines)
+    self.errors = []
+    self.total = 0 # number of lines seen
+    self.log = gzip.open(log, "wb") if log is not None else None
+
+  def append(self, l):
+    if self.log is not None:
+      self.log.write(l + "\n")
+    if len(l) > max_line:
+      l = l[:max_line] + "..."
+    self.total += 1
+    if len(self.errors) < max_errors and ANSI_CODE.sub("", l).lstrip().startswith("Error"):
+      self.errors.append((self.total, l))
+    self.tail.append((self.total, l))
+
+  def close(self):
+    if self.log is not None:
+      self.log.close()
+      self.log = None
+
+  def text(self):
+    """The output that was kept (with a note for every gap)."""
+    lines = [e for e in self.errors if e[0] <= self.total - len(self.tail)] + list(self.tail)
+    res = []
+    last = 0
+    for n, l in lines:
+      if n > last + 1:
+        res.append("[... %d lines omitted ...]" % (n - last - 1))
+      res.append(l)
+      last = n
+    return "\n".join(res)
+
+class CoreWorker(object):
+  """
+  A mimic-core process started with the 'worker' subcommand.  It reads one job per line
+  on stdin and stays alive between jobs, so that we only pay for starting node once.  The
+  worker runs in its own process group, so that it is killed together with any processes it
+  started.  If cpus is given, the worker only runs on those logical CPUs (if taskset is available).
+  """
+  def __init__(self, command, cpus=None):
+    self.command = command
+    if cpus is not None and TASKSET is not None:
+      self.command = [TASKSET, "-c", ",".join([str(c) for c in cpus])] + command
+    self.proc = None
+    self.buf = ""
+    self.usage_start = None # cpu time of the worker when the current job started
+    self.exit_usage = None # (cpu time, peak rss) of the worker, once it exited
+    self.deadline = None # when the current job has to be finished
+    self.output = None # the output of the current job
+
+  def is_alive(self):
+    return self.proc is not None and self.proc.poll() is None
+
+  def pid(self):
+    return self.proc.pid
+
+  def start(self):
+    self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, close_fds=True, preexec_fn=os.setsid)
+    self.buf = ""
+
+  def stop(self):
+    """Kill the worker and its process group (if necessary), and return its exit status."""
+    if self.proc is None:
+      return 0
+    kill_group(self.proc.pid, signal.SIGKILL)
+    if self.proc.returncode is None:
+      # wait4 (rather than Popen.wait) to learn how many resources the worker used
+      try:
+        _, st, ru = os.wait4(self.proc.pid, 0)
+        self.proc.returncode = -os.WTERMSIG(st) if os.WIFSIGNALED(st) else os.WEXITSTATUS(st)
+        self.exit_usage = (ru.ru_utime + ru.ru_stime, ru.ru_maxrss)
+      except OSError:
+        self.proc.wait()
+    status = self.proc.returncode
+    self.proc.stdin.close()
+    self.proc.stdout.close()
+    self.proc = None
+    return status
+
+  def submit(self, job):
+    """Hand a job to the worker, (re)starting it if it is not running."""
+    if not self.is_alive():
+      self.stop()
+      self.start()
+    try:
+      self.proc.stdin.write(json.dumps(job) + "\n")
+      self.proc.stdin.flush()
+    except IOError:
+      # the worker died since we last checked
+      self.stop()
+      self.start()
+      self.proc.stdin.write(json.dumps(job) + "\n")
+      self.proc.stdin.flush()
+    reset_peak_rss(self.proc.pid)
+    usage = read_usage(self.proc.pid)
+    self.usage_start = usage[0] if usage is not None else None
+    self.exit_usage = None
+
+  def job_usage(self):
+    """
+    Return (cpu time in seconds, peak rss in kilobytes) of the job that was last submitted (or
+    None if not known), whether the worker is still alive or not.
+    """
+    if self.usage_start is None:
+      return None
+    usage = self.exit_usage
+    if usage is None and self.is_alive():
+      usage = read_usage(self.proc.pid)
+    if usage is None:
+      return None
+    return (max(0.0, usage[0] - self.usage_start), usage[1])
+
+  def fileno(self):
+    return self.proc.stdout.fileno()
+
+  def read(self):
+    """
+    Read the output that is available, and return all complete lines (or None if the worker
+    closed its output).
+    """
+    data = os.read(self.fileno(), 65536)
+    if data == "":
+      return None
+    lines = (self.buf + data).split("\n")
+    self.buf = lines.pop()
+    if len(self.buf) > max_line:
+      # don't buffer arbitrarily long lines
+      lines.append(self.buf)
+      self.buf = ""
+    return lines
+
+  def begin(self, job, timeout, log=None):
+    """
+    Hand a job to the worker (see submit).  The job itself should contain the timeout for
+    mimic-core, and if the worker does not report back within the given timeout (plus some
+    grace period), then the worker is killed.  Only the end of the output (and the first errors)
+    are kept, see OutputTail; the complete output is written to the compressed file log, if given.
+    """
+    self.submit(job)
+    self.deadline = time.time() + timeout + GRACE
+    self.output = OutputTail(log=log)
+
+  def handle(self, lines, on_progress=None):
+    """
+    Process the output of the current job (lines as returned by read, or [] to only check the
+    deadline).  Progress reports of the job (see the 'progress' option) are passed to on_progress.
+    Once the job is finished, returns a tuple (status, output, msg), where msg is the result
+    reported by mimic-core (or None if the worker crashed or was killed), and None before.
+    """
+    if lines is None:
+      status = self.stop()
+      return self.end(status if status != 0 else 1, None)
+    for l in lines:
+      if l.startswith(MSG_PREFIX):
+        msg = json.loads(l[len(MSG_PREFIX):])
+        if msg["type"] == "result":
+          return self.end(msg["status"], msg)
+        if msg["type"] == "progress" and on_progress is not None:
+          on_progress(msg)
+      else:
+        self.output.append(l)
+    if time.time() >= self.deadline:
+      self.stop()
+      return self.end(124, None)
+    return None
+
+  def end(self, status, msg):
+    self.output.close()
+    res = (status, self.output.text(), msg)
+    self.output = None
+    return res
+
+class WorkerPool(object):
+  """
+  A fixed number of workers, all driven from the calling process: jobs are handed to idle
+  workers (or queued until a worker becomes idle), and the output of all busy workers is read
+  with a single select.  Jobs are identified by a tag chosen by the caller.  If placement is
+  given, the i-th worker is pinned to the logical CPUs placement[i] (see topology.placement).
+  """
+  def __init__(self, command, size, placement=None):
+    self.workers = [CoreWorker(command, placement[i] if placement is not None else None) for i in range(size)]
+    self.busy = {} # index of the worker -> tag of its job
+    self.queued = deque() # (tag, job, timeout, log) of the jobs waiting for an idle worker
+    self.events = []
+
+  def size(self):
+    return len(self.workers)
+
+  def submit(self, tag, job, timeout, log=None):
+    """Run a job (see CoreWorker.begin) as soon as a worker is idle."""
+    self.queued.append((tag, job, timeout, log))
+    self.dispatch()
+
+  def discard_queued(self, which=None):
+    """Forget about the jobs that did not start yet (only those whose tag satisfies which, if given)."""
+    if which is None:
+      self.queued.clear()
+      return
+    for q in [q for q in self.queued if which(q[0])]:
+      self.queued.remove(q)
+
+  def dispatch(self):
+    for i in range(len(self.workers)):
+      if len(self.queued) == 0:
+        return
+      if i in self.busy:
+        continue
+      w = self.workers[i]
+      tag, job, timeout, log = self.queued.popleft()
+      fresh = not w.is_alive()
+      w.begin(job, timeout, log)
+      self.busy[i] = tag
+      self.events.append((tag, "started", (i, w.pid(), fresh)))
+
+  def poll(self, timeout=None):
+    """
+    Wait until something happens (or at most timeout seconds), and return the list of events.
+    Events are tuples (tag, kind, data), where kind is one of
+      'started'   data is (index of the worker, its pid, whether the worker was (re)started)
+      'progress'  data is the progress report
+      'done'      data is (status, output, msg, usage), see CoreWorker.handle and CoreWorker.job_usage
+    """
+    end = time.time() + timeout if timeout is not None else None
+    while len(self.events) == 0:
+      now = time.time()
+      if end is not None and now >= end:
+        break
+      if len(self.busy) == 0:
+        if end is None:
+          break
+        time.sleep(end - now)
+        continue
+      wait = min([self.workers[i].deadline for i in self.busy]) - now
+      if end is not None:
+        wait = min(wait, end - now)
+      fds = dict([(self.workers[i].fileno(), i) for i in self.busy])
+      ready, _, _ = select.select(fds.keys(), [], [], max(0, wait))
+      ready = set([fds[fd] for fd in ready])
+      for i in sorted(self.busy.keys()):
+        tag = self.busy[i]
+        w = self.workers[i]
+        on_progress = lambda m: self.events.append((tag, "progress", m))
+        res = w.handle(w.read() if i in ready else [], on_progress)
+        if res is not None:
+          del self.busy[i]
+          self.events.append((tag, "done", res + (w.job_usage(),)))
+      self.dispatch()
+    events = self.events
+    self.events = []
+    return events
+
+  def close(self):
+    """Kill all workers."""
+    for w in self.workers:
+      w.stop()
+    self.busy.clear()
+    self.queued.clear()
@@ -11,14 +11,17 @@
 
 import sys
 import os
+import math
 import argparse
 import json
 import re
 import status
 from random import shuffle
 import common
-import run
-import cPickle
+import jobs
+import journal
+import restart
+import topology
 
 line = "-" * 80
 q = None # the queue used for communication
@@ -32,12 +35,23 @@ base_command = './mimic synth --iterations 100000000'
 
 def main():
   parser = argparse.ArgumentParser(description='Run synthesis experiment.')
-  parser.add_argument('-n', type=int, help='Number of repetitions', default=10)
+  parser.add_argument('-n', type=int, help='Number of repetitions (the maximum number, with --precision)', default=10)
+  parser.add_argument('--precision', type=float, metavar='<fraction>',
+                      help='Only repeat runs until the 95%% confidence interval of the mean time (and of the slowdown compared to the first metric) is within this fraction of the mean (0 = always do all repetitions; requires numpy)',
+                      default=0)
+  parser.add_argument('--min-runs', type=int, help='Minimal number of repetitions with --precision', default=5)
   parser.add_argument('--filter', type=str, help='Filter which experiments to run', default="")
   parser.add_argument('--exclude', type=str, help='Exclude some experiments', default="")
   parser.add_argument('--exp_name', type=str, help='Name of this experiment', default="")
   parser.add_argument('--args', type=str, help='Arguments to be passed to mimic', default="")
+  parser.add_argument('--restart-policy', type=str, choices=restart.POLICIES, help='How mimic chooses the timeouts of its attempts', default="geometric")
   parser.add_argument('--metric', type=str, help='Which metric should be used during search?  Comma-separated list', default="0")
+  parser.add_argument('-j', '--jobs', type=int, help='Number of runs of mimic to do at the same time', default=1)
+  parser.add_argument('-t', '--threads', type=int, help='Number of threads per run of mimic (-1 = split the cores evenly among the jobs)', default=-1)
+  parser.add_argument('--cores', type=int, help='Number of cores that all jobs together may use', default=jobs.get_cores())
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='How to pin the workers of every job to physical cores of their own (see mimic --help)', default="none")
+  parser.add_argument('--resume', type=str, metavar='<folder>', help='Continue an interrupted experiment (with the same arguments), skipping all tasks that have finished already', default="")
 
   global argv
   argv = parser.parse_args()
@@ -55,58 +69,225 @@ def main():
 
   # create a directory to store information
   global out
-  out = workdir + "/out"
-  if not os.path.exists(out):
+  done = set()
+  if argv.resume != "":
+    out = os.path.abspath(argv.resume)
+    if not os.path.exists(out + "/" + journal.JOURNAL):
+      print "ERROR, no experiment to resume in: " + out
+      sys.exit(1)
+    for record in journal.read(out + "/" + journal.JOURNAL):
+      done.add(record['task'])
+  else:
+    out = workdir + "/out"
+    if not os.path.exists(out):
+      os.mkdir(out)
+    timefordir = common.get_time(True)
+    out = out + "/" + timefordir
+    if argv.exp_name != "":
+      out = out + "_" + argv.exp_name
+    if os.path.exists(out):
+      print "ERROR, out directory exists already: " + out
+      sys.exit(1)
     os.mkdir(out)
-  timefordir = common.get_time(True)
-  out = out + "/" + timefordir
-  if argv.exp_name != "":
-    out = out + "_" + argv.exp_name
-  if os.path.exists(out):
-    print "ERROR, out directory exists already: " + out
-    sys.exit(1)
-  os.mkdir(out)
   logfile = out + "/readme.txt"
 
   # run the experiment
   tasks = []
   c = 0
   print ""
-  for f, i, m in [(f, i, m) for f in fncs for i in range(n) for m in metrics]:
-    tasks.append((c, f, i, m))
-    c += 1
-  shuffle(tasks) # shuffle tasks
-  results = []
+  if argv.precision <= 0:
+    for f, i, m in [(f, i, m) for f in fncs for i in range(n) for m in metrics]:
+      if (f.title, i, m) not in done:
+        tasks.append((c, f, i, m))
+      c += 1
+    shuffle(tasks) # shuffle tasks
   print "Running experiment..."
+  threads = jobs.split_cores(argv.cores, argv.jobs, argv.threads)
+  if argv.jobs * threads > argv.cores:
+    print "ERROR, %d jobs with %d threads each do not fit into %d cores" % (argv.jobs, threads, argv.cores)
+    sys.exit(1)
   def get_details():
     s = ""
     s += "  function(s):        %d" % len(fncs)
-    s += "\n  repetitions:        %d" % n
+    if argv.precision > 0:
+      s += "\n  repetitions:        %d to %d (until within %g%% of the mean)" % (min(argv.min_runs, n), n, 100 * argv.precision)
+    else:
+      s += "\n  repetitions:        %d" % n
+    s += "\n  concurrent jobs:    %d (with %d threads each)" % (argv.jobs, threads)
+    s += "\n  restart policy:     %s" % argv.restart_policy
     s += "\n  output directory:   %s" % out[out.find("/tests/")+1:]
     return s
   print get_details()
-  common.fprint(logfile, "Arguments: " + " ".join(sys.argv) + "\n")
+  if len(done) > 0:
+    print "  already finished:   %d" % len(done)
+  if argv.resume == "":
+    common.fprint(logfile, "Arguments: " + " ".join(sys.argv) + "\n")
+  else:
+    common.fprinta(logfile, "Resumed with arguments: " + " ".join(sys.argv) + "\n")
   common.fprinta(logfile, "Time: " + common.get_time() + "\n")
   common.fprinta(logfile, get_details() + "\n" + line + "\n")
+  results = journal.Journal(out + "/" + journal.JOURNAL)
   print line
   stat = status.get_status()
   stat.set_message("Running experiment...")
-  stat.init_progress(len(tasks))
-  for c, f, i, m in tasks:
-    stat.writeln("Running mimic for %s..." % (f.shortname))
-    res = run.mimic(f, metric=m, cleanup=0)
-    stat.writeln("  done in %.2f seconds and %d searches" % (res.total_time, res.total_searches))
+  runner = jobs.JobRunner(argv.jobs, threads, argv.placement)
+  def submit(c, f, i, m):
+    runner.submit_independent(c, f, metric=m, restart_policy=argv.restart_policy)
+    lookup[c] = (f, i, m)
+  def finish():
+    c, res = runner.next_result()
+    f, i, m = lookup[c]
     stat.inc_progress(force_update=True)
-    results.append(res)
-    jn = cPickle.dumps(results)
-    common.fprint(out + "/result.pickle", jn)
+    if res is None:
+      stat.writeln("Running mimic for %s failed" % f.shortname)
+    else:
+      stat.writeln("Ran mimic for %s:" % f.shortname)
+      stat.writeln("  done in %.2f seconds and %d searches" % (res.total_time, res.total_searches))
+      results.append({'task': (f.title, i, m), 'result': res})
+    return (f, m, res)
+  lookup = {}
+  if argv.precision <= 0:
+    stat.init_progress(len(tasks))
+    for c, f, i, m in tasks:
+      submit(c, f, i, m)
+    while runner.pending() > 0:
+      finish()
+  else:
+    cells = Cells(fncs, metrics, n, argv.min_runs, argv.precision)
+    if argv.resume != "":
+      for record in journal.read(out + "/" + journal.JOURNAL):
+        title, i, m = record['task']
+        cells.add_done(title, m, i, record['result'])
+    stat.init_progress(cells.remaining())
+    c = 0
+    while True:
+      # only keep as many runs queued as can run at the same time, so that every decision which
+      # cell to run next is based on all results so far
+      while runner.pending() < argv.jobs:
+        cell = cells.next()
+        if cell is None:
+          break
+        f, m = cell
+        submit(c, f, cells.start(f, m), m)
+        c += 1
+      if runner.pending() == 0:
+        break
+      f, m, res = finish()
+      cells.finish(f, m, res)
+  results.close()
+  runner.close()
   stat.end_progress()
+  if argv.precision > 0:
+    print cells.summary()
   print line
   print "Finished experiment:"
   print get_details()
   common.fprinta(logfile, "Time: " + common.get_time() + "\n")
 
 
+class Cells(object):
+  """
+  The runs for every function and metric (a cell), for experiments that stop repeating the runs
+  of a cell once the confidence interval of its mean time (and of its slowdown compared to the
+  first metric) is narrow enough.  Runs go to the cell whose confidence interval is expected to
+  be the widest once the runs in progress finish.
+  """
+  def __init__(self, fncs, metrics, n, min_runs, precision):
+    self.fncs = dict([(f.title, f) for f in fncs])
+    self.metrics = metrics
+    self.n = n
+    self.min_runs = min(min_runs, n)
+    self.precision = precision
+    self.times = {} # cell -> times of the successful runs
+    self.started = {} # cell -> number of runs started (including failed ones)
+    self.running = {} # cell -> number of runs in progress
+    self.indices = {} # cell -> repetition indices in use
+    for f in fncs:
+      for m in metrics:
+        self.times[(f.title, m)] = []
+        self.started[(f.title, m)] = 0
+        self.running[(f.title, m)] = 0
+        self.indices[(f.title, m)] = set()
+
+  def add_done(self, title, m, i, res):
+    """Add a run from an earlier (interrupted) experiment."""
+    cell = (title, m)
+    if cell not in self.times:
+      return
+    self.times[cell].append(res.total_time)
+    self.started[cell] += 1
+    self.indices[cell].add(i)
+
+  def start(self, f, m):
+    """Record that another run of the cell starts, and return its repetition index."""
+    cell = (f.title, m)
+    i = 0
+    while i in self.indices[cell]:
+      i += 1
+    self.indices[cell].add(i)
+    self.started[cell] += 1
+    self.running[cell] += 1
+    return i
+
+  def finish(self, f, m, res):
+    cell = (f.title, m)
+    self.running[cell] -= 1
+    if res is not None:
+      self.times[cell].append(res.total_time)
+
+  def width(self, cell):
+    """
+    The half-width of the confidence interval of the mean time of a cell (relative to the mean),
+    or of the slowdowns that depend on the cell (compared to the first metric), whichever is larger.
+    """
+    import process # requires numpy
+    times = self.times[cell]
+    if len(times) < 2:
+      return float("inf")
+    lo, hi = process.bootstrap_ci(times)
+    w = (hi - lo) / 2.0 / max(sum(times) / len(times), 1e-3)
+    title, m = cell
+    base = self.times[(title, self.metrics[0])]
+    for alt in self.metrics[1:]:
+      if m != self.metrics[0] and m != alt:
+        continue
+      times = self.times[(title, alt)]
+      if len(base) < 2 or len(times) < 2:
+        return float("inf")
+      lo, hi = process.bootstrap_slowdown_ci(base, times)
+      w = max(w, (hi - lo) / 2.0)
+    return w
+
+  def next(self):
+    """The function and metric that should be run next, or None if no more runs are needed."""
+    best = None
+    for cell in sorted(self.times.keys()):
+      if self.started[cell] >= self.n:
+        continue
+      if self.started[cell] < self.min_runs:
+        score = float("inf")
+      else:
+        done = len(self.times[cell])
+        # the width shrinks with the square root of the number of runs
+        score = self.width(cell) * math.sqrt(float(done) / (done + self.running[cell])) if done > 0 else float("inf")
+        if score <= self.precision:
+          continue
+      if best is None or score > best[0] or (score == best[0] and self.started[cell] < self.started[best[1]]):
+        best = (score, cell)
+    if best is None:
+      return None
+    title, m = best[1]
+    return (self.fncs[title], m)
+
+  def remaining(self):
+    """The maximal number of runs that are still to come."""
+    return sum([self.n - min(self.n, s) for s in self.started.values()])
+
+  def summary(self):
+    runs = sum(self.started.values())
+    precise = len([c for c in self.times if len(self.times[c]) >= self.min_runs and self.width(c) <= self.precision])
+    return "Did %d of at most %d runs, %d of %d cells are within %g%% of the mean" % (runs, self.n * len(self.times), precise, len(self.times), 100 * self.precision)
+
 def send_msg(id, msg, color=False):
   global q
   q.put((2 if color else 1, id, msg))
@@ -130,18 +311,27 @@ def parse_functions(workdir, filter="", exclude=""):
       categories.append(f)
 
   for e in categories:
-    category = e[0:-5].replace("/", "-")
-    try:
-      examples = json.loads(open(workdir + "/" + e).read())
-    except ValueError as ex:
-      print "Failed to parse configuration: " + str(ex)
-      sys.exit(1)
-    for example in examples:
-      if filter != "" and re.search(filter, example['name'], re.UNICODE) is None:
-        continue
-      if exclude != "" and re.search(exclude, example['name'], re.UNICODE) is not None:
-        continue
-      result.append(common.Function(example, category))
+    result += parse_file(workdir + "/" + e, filter, exclude)
+  return result
+
+def parse_file(fn, filter="", exclude=""):
+  """
+  The functions in a single file (such as tests/array.json) whose name matches filter (and not exclude).
+  :rtype : list[common.Function]
+  """
+  category = os.path.basename(fn)[0:-5].replace("/", "-")
+  try:
+    examples = json.loads(open(fn).read())
+  except ValueError as ex:
+    print "Failed to parse configuration: " + str(ex)
+    sys.exit(1)
+  result = []
+  for example in examples:
+    if filter != "" and re.search(filter, example['name'], re.UNICODE) is None:
+      continue
+    if exclude != "" and re.search(exclude, example['name'], re.UNICODE) is not None:
+      continue
+    result.append(common.Function(example, category))
   return result
 
 
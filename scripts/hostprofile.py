@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Per-host profiles: the search parameters tuned for a machine (see tune.py)
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import socket
+import common
+
+# the parameters of a profile for run.mimic, and for mimic-core, respectively.  alpha is not among
+# them: it only matters when mimic-core chooses the loop template itself, but the loop bandit
+# (see bandit.py) chooses the template of every attempt.
+MIMIC_PARAMETERS = ["parallel_t0", "parallel_f"]
+CORE_PARAMETERS = ["beta", "gamma"]
+
+def get_file(host=None):
+  """The file with the profile of a host (by default, this one)."""
+  if host is None:
+    host = socket.gethostname()
+  return common.get_data_dir("profiles") + "/" + host + ".json"
+
+def load(host=None):
+  """Return the profile of a host (a dictionary), or None if it was never tuned."""
+  fn = get_file(host)
+  if not os.path.exists(fn):
+    return None
+  try:
+    with open(fn) as fl:
+      return json.load(fl)
+  except ValueError:
+    return None
+
+def save(profile, host=None):
+  common.fprint(get_file(host), json.dumps(profile, indent=2, sort_keys=True) + "\n")
+
+def core_options(profile, core_args=[]):
+  """The options for mimic-core in a profile, except those that are given explicitly in core_args."""
+  if profile is None:
+    return {}
+  return dict([(k, profile[k]) for k in CORE_PARAMETERS if k in profile and "--" + k not in core_args])
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Running several instances of mimic at once
+#
+# ------------------------------------------------------------------------------
+
+import time
+import traceback
+import multiprocessing
+from multiprocessing import Process
+from multiprocessing import Queue
+from multiprocessing import Array
+import Queue as queue
+import run
+
+# the arguments to run.mimic for runs that have to be independent of each other (in experiments,
+# benchmarks and tuning): run.mimic never looks at the model cache, and with these, it also doesn't
+# reuse seeds from earlier runs, start from models in the library or clean up the model, so that
+# the timing data is honest
+INDEPENDENT = {'cleanup': 0, 'use_ledger': False, 'warm_start': 0}
+
+def independent(**kwargs):
+  """The arguments to run.mimic for an independent run, with the given further arguments."""
+  return dict(INDEPENDENT, **kwargs)
+
+def get_cores():
+  return multiprocessing.cpu_count()
+
+def split_cores(cores, jobs, threads=-1):
+  """
+  Return the number of threads for each of the given number of concurrent jobs, so that all
+  jobs together use (at most) the given number of cores.
+  """
+  if threads > 0:
+    return threads
+  if jobs == 1:
+    return min(cores, run.get_default_threads())
+  return max(1, cores / jobs)
+
+def runner_loop(index, tasks, results, current, cancelled, withdrawn, threads, placement):
+  # if the workers are pinned, every process gets cores of its own
+  run.placement = placement
+  run.first_core = index * threads
+  while True:
+    task = tasks.get()
+    if task is None:
+      break
+    key, f, threads, kwargs = task
+    # only now look for cancelled jobs, as JobRunner.cancel only stops jobs it sees running
+    current[index] = key
+    if key in withdrawn:
+      current[index] = -1
+      results.put((key, None))
+      continue
+    res = None
+    try:
+      res = run.mimic(f, threads=threads, stop=lambda: cancelled[index] == key, **kwargs)
+    except SystemExit:
+      pass
+    except Exception:
+      traceback.print_exc()
+    current[index] = -1
+    results.put((key, res))
+  run.shutdown_pool()
+
+class JobRunner(object):
+  """
+  A fixed number of processes that each run one call to run.mimic at a time, all with the same
+  number of threads.  Every process keeps its pool of mimic-core workers between jobs.  Keys
+  of jobs are non-negative integers.  With a placement other than 'none' (see topology.ORDERS),
+  the workers of every process are pinned to physical cores that no other process uses.
+  """
+  def __init__(self, jobs, threads, placement="none"):
+    self.jobs = jobs
+    self.threads = threads
+    self.tasks = Queue()
+    self.results = Queue()
+    self.outstanding = 0
+    self.submitted = set() # the keys of the jobs that did not finish yet
+    self.started = {} # key -> when the job was first seen running (see cancel_overdue)
+    self.processes = []
+    # the key of the job every process is running (or -1), and the job it should cancel
+    self.current = Array('i', [-1] * jobs)
+    self.cancelled = Array('i', [-1] * jobs)
+    # the keys of cancelled jobs, which are skipped if they did not start yet
+    self.manager = multiprocessing.Manager()
+    self.withdrawn = self.manager.dict()
+    for i in range(jobs):
+      # not daemonic, as run.mimic starts processes of its own
+      p = Process(target=runner_loop, args=(i, self.tasks, self.results, self.current, self.cancelled, self.withdrawn, threads, placement))
+      p.start()
+      self.processes.append(p)
+
+  def submit(self, key, f, **kwargs):
+    """Run mimic for the function f (kwargs are passed on to run.mimic)."""
+    self.tasks.put((key, f, self.threads, kwargs))
+    self.submitted.add(key)
+    self.outstanding += 1
+
+  def submit_independent(self, key, f, **kwargs):
+    """Run mimic for the function f, independently of all other runs (see INDEPENDENT)."""
+    self.submit(key, f, **independent(**kwargs))
+
+  def pending(self):
+    return self.outstanding
+
+  def running(self):
+    """The keys of the jobs that are running right now."""
+    return [k for k in self.current if k >= 0]
+
+  def cancel(self, key):
+    """
+    Stop the job with the given key (it finishes with result None): a running job is stopped,
+    and a job that did not start yet is skipped.  Returns False if there is no such job.
+    """
+    if key not in self.submitted:
+      return False
+    # before looking for the job among the running ones, so that a process that starts it in the
+    # meantime skips it (see runner_loop)
+    self.withdrawn[key] = True
+    for i in range(self.jobs):
+      if self.current[i] == key:
+        self.cancelled[i] = key
+    return True
+
+  def cancel_overdue(self, cap):
+    """Stop the running jobs that have been running for more than cap seconds."""
+    now = time.time()
+    for key in self.running():
+      self.started.setdefault(key, now)
+      if now - self.started[key] > cap:
+        self.cancel(key)
+
+  def next_result(self, timeout=None):
+    """
+    Wait for the next job to finish, and return a tuple (key, result).  The result is None if
+    mimic failed (or was cancelled).  Returns None if no job finished within the timeout.
+    """
+    try:
+      key, res = self.results.get(True, timeout)
+    except queue.Empty:
+      return None
+    self.outstanding -= 1
+    self.submitted.discard(key)
+    self.withdrawn.pop(key, None)
+    self.started.pop(key, None)
+    return (key, res)
+
+  def close(self):
+    for p in self.processes:
+      self.tasks.put(None)
+    for p in self.processes:
+      p.join()
+    self.manager.shutdown()
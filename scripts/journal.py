@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Append-only journal of experiment results
+#
+# ------------------------------------------------------------------------------
+
+import os
+import struct
+import cPickle
+
+# name of the journal in an experiment folder
+JOURNAL = "results.journal"
+# name of the file that older versions of experiment.py wrote all results to
+LEGACY = "result.pickle"
+
+class Journal(object):
+  """
+  A file of pickled records, each preceded by its length.  Every record is flushed to disk
+  before append returns, and a record that was only partially written (e.g., because the
+  experiment was killed) is ignored when reading.
+  """
+  def __init__(self, fn):
+    self.fn = fn
+    self.f = open(fn, "ab")
+    # drop a partially written record at the end, so that new records can be read again
+    end = 0
+    for end, record in scan(fn):
+      pass
+    self.f.truncate(end)
+
+  def append(self, record):
+    data = cPickle.dumps(record, cPickle.HIGHEST_PROTOCOL)
+    self.f.write(struct.pack(">I", len(data)) + data)
+    self.f.flush()
+    os.fsync(self.f.fileno())
+
+  def close(self):
+    self.f.close()
+
+def scan(fn):
+  """Iterate over pairs (end, record) for all (completely written) records in a journal."""
+  f = open(fn, "rb")
+  try:
+    while True:
+      header = f.read(4)
+      if len(header) < 4:
+        return
+      n = struct.unpack(">I", header)[0]
+      data = f.read(n)
+      if len(data) < n:
+        return
+      yield (f.tell(), cPickle.loads(data))
+  finally:
+    f.close()
+
+def read(fn):
+  """Iterate over all (completely written) records in a journal."""
+  for end, record in scan(fn):
+    yield record
+
+def read_results(folder):
+  """
+  Iterate over all results (common.MimicResult) of an experiment, from its journal or (for
+  experiments run with older versions) from its pickled list of results.
+  """
+  if os.path.exists(folder + "/" + JOURNAL):
+    for record in read(folder + "/" + JOURNAL):
+      yield record['result']
+  else:
+    for res in cPickle.loads(open(folder + "/" + LEGACY).read()):
+      yield res
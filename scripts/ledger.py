@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Seed ledger: which random seeds have been tried for a function, and how they did
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import random
+import common
+
+# the range from which seeds for mimic-core are drawn
+MAX_SEED = 2**31 - 1
+
+# the expected time to find a model for a function without any history
+expected_time_default = 60
+
+def get_ledger(f, metric, core_args=[], core_options=None):
+  """
+  Return the ledger for a function and search configuration (the metric, the arguments to
+  mimic-core, and the options that every attempt passes to mimic-core).
+  :type f: common.Function
+  """
+  parts = [f.argnames, f.code, f.arguments, f.loop, metric, core_args]
+  if core_options:
+    parts.append(core_options)
+  key = common.hash_key(*parts)
+  return SeedLedger(common.get_data_dir("ledger") + "/" + key + ".json")
+
+def failed_time(e):
+  """
+  How long the seed of a failed attempt (an entry of a ledger) had: its timeout, or only the
+  time it ran if it was stopped early.  Seeds that crashed fail for any timeout.
+  """
+  if e['outcome'] == "crash":
+    return float("inf")
+  if e['outcome'] == "stopped" and e.get('time') is not None:
+    return e['time']
+  return e['timeout']
+
+class SeedLedger(object):
+  """
+  The seeds handed out for a given function (and search configuration), together with the
+  outcome of every attempt (stored as one JSON object per line).  What an attempt does is
+  determined by its seed and the loop template it was given (None if mimic-core chose one
+  itself), so outcomes are kept per seed and loop.  Seeds that previously succeeded are handed
+  out first, and seeds that already failed are not handed out again for a timeout at which they
+  are known to fail (that is, one that is not larger than the time they had).  Without a file,
+  the ledger only makes sure that seeds are unique within one run.
+  """
+  def __init__(self, file=None):
+    self.file = file
+    self.entries = []
+    if file is not None and os.path.exists(file):
+      for l in open(file):
+        try:
+          self.entries.append(json.loads(l))
+        except ValueError:
+          # partially written line
+          pass
+    self.used = set() # the seeds handed out during this run
+    self.failed = {} # (seed, loop) -> the longest time it had without succeeding
+    for e in self.entries:
+      if e['outcome'] != "success":
+        self.add_failure(e)
+    self.successful = sorted([e for e in self.entries if e['outcome'] == "success"], key=lambda e: e['iterations'])
+
+  def add_failure(self, e):
+    key = (e['seed'], e.get('loop'))
+    self.failed[key] = max(self.failed.get(key, 0), failed_time(e))
+
+  def next_seed(self, timeout=None, loop=None, reuse=True):
+    """
+    Return a seed that has not been handed out before (during this run), and that is not known
+    to fail with the given loop template within the given timeout (in seconds, or None for any
+    timeout).  With reuse, seeds that succeeded with the loop template come first.
+    """
+    if reuse:
+      for e in self.successful:
+        if e.get('loop') == loop and e['seed'] not in self.used:
+          self.successful.remove(e)
+          self.used.add(e['seed'])
+          return e['seed']
+    while True:
+      seed = random.randint(0, MAX_SEED)
+      if seed in self.used:
+        continue
+      failed = self.failed.get((seed, loop))
+      if failed is not None and (timeout is None or failed >= timeout):
+        continue
+      self.used.add(seed)
+      return seed
+
+  def expected_time(self, default=expected_time_default):
+    """
+    The expected time (in seconds of a single attempt) to find a model: the time spent on all
+    recorded attempts per success, or default if no attempt has ever succeeded.
+    """
+    successes = len([e for e in self.entries if e['outcome'] == "success"])
+    if successes == 0:
+      return default
+    return float(sum([e['timeout'] for e in self.entries])) / successes
+
+  def record(self, seed, timeout, outcome, iterations, time=None, loop=None):
+    """
+    Record the outcome ('success', 'timeout', 'stopped' or 'crash') of an attempt (that ran for
+    time seconds, with the given loop template).
+    """
+    e = {
+      'seed': seed,
+      'timeout': timeout,
+      'outcome': outcome,
+      'iterations': iterations,
+      'time': time,
+      'loop': loop,
+    }
+    self.entries.append(e)
+    if outcome != "success":
+      self.add_failure(e)
+    if self.file is not None:
+      common.fprinta(self.file, json.dumps(e) + "\n")
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# A library of previously found models, to start new searches from similar ones
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import shutil
+import difflib
+import common
+
+core = os.path.abspath(os.path.dirname(__file__) + '/../mimic-core')
+INDEX = "index.json"
+
+# models that are less similar than this are not used
+min_similarity_default = 0.5
+
+def function_key(f):
+  """
+  :type f: common.Function
+  """
+  return common.hash_key(f.argnames, f.code, f.arguments)
+
+signatures = {} # function key -> signature
+
+def get_signature(f):
+  """
+  The signature of a function: the kinds of events in its traces on all initial inputs (see
+  'mimic-core record --skeleton'), or None if recording fails.
+  """
+  key = function_key(f)
+  if key not in signatures:
+    sig = []
+    for arg in f.arguments:
+      g = common.Function({'name': f.title, 'function': [f.code], 'argnames': f.argnames, 'arguments': [arg]}, f.category)
+      status, output = common.execute('%s record --colors 0 --skeleton 1 %s' % (core, g.get_command_args()), 60)
+      if status != 0:
+        return None
+      sig.append(output.strip())
+    signatures[key] = sig
+  return signatures[key]
+
+def similarity(a, b):
+  """How similar two signatures are (between 0 and 1)."""
+  if len(a) == 0 or len(b) == 0:
+    return 0.0
+  total = 0.0
+  for s in a:
+    total += max([difflib.SequenceMatcher(None, s, t).ratio() for t in b])
+  return total / len(a)
+
+class ModelLibrary(object):
+  """
+  Models found by mimic, stored as programs mimic-core can continue from (see the 'resume' option)
+  together with the signature of the function and the loop template that was used.  The index
+  contains one JSON object per line.
+  """
+  def __init__(self, folder=None):
+    self.folder = folder if folder is not None else common.get_data_dir("library")
+    self.entries = []
+    fn = self.folder + "/" + INDEX
+    if os.path.exists(fn):
+      for l in open(fn):
+        try:
+          self.entries.append(json.loads(l))
+        except ValueError:
+          # partially written line
+          pass
+    self.keys = set([e['key'] for e in self.entries])
+
+  def add(self, f, program, loop_index):
+    """Add the model for f (a file written by mimic-core with the 'program' option)."""
+    key = function_key(f)
+    sig = get_signature(f)
+    if key in self.keys or sig is None:
+      return
+    fn = self.folder + "/" + key + ".json"
+    shutil.copyfile(program, fn)
+    e = {
+      'key': key,
+      'title': f.title,
+      'signature': sig,
+      'loop_index': loop_index,
+      'program': fn,
+    }
+    self.entries.append(e)
+    self.keys.add(key)
+    common.fprinta(self.folder + "/" + INDEX, json.dumps(e) + "\n")
+
+  def closest(self, f, n, min_similarity=min_similarity_default):
+    """Return (at most) n models of other functions that are structurally closest to f, closest first."""
+    key = function_key(f)
+    sig = get_signature(f)
+    if sig is None:
+      return []
+    cands = []
+    for e in self.entries:
+      if e['key'] == key or not os.path.exists(e['program']):
+        continue
+      sim = similarity(sig, e['signature'])
+      if sim >= min_similarity:
+        cands.append((sim, e))
+    cands.sort(key=lambda c: -c[0])
+    return [e for sim, e in cands[:n]]
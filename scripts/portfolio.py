@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Spreading search configurations over the attempts of a search
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import random
+import common
+
+# the search configurations of the default portfolio: a name, and the options for mimic-core (on
+# top of the ones of the search).  mimic-core uses beta 9 and gamma 6 by default; a lower beta
+# and gamma accepts worse programs more often (a higher temperature).
+CONFIGURATIONS = [
+  ("default", {}),
+  ("naive metric", {'metric': 1}),
+  ("hot", {'beta': 6, 'gamma': 4}),
+  ("cold", {'beta': 12, 'gamma': 8}),
+  ("naive metric, hot", {'metric': 1, 'beta': 6, 'gamma': 4}),
+  ("accept equal cost", {'alwaysAcceptEqualCost': True}),
+]
+
+def get_portfolio(persistent=True):
+  """
+  Return the default portfolio, with the win statistics of all earlier searches (which are also
+  updated) if persistent.
+  """
+  return Portfolio(CONFIGURATIONS, common.get_data_dir() + "/portfolio.json" if persistent else None)
+
+class Portfolio(object):
+  """
+  Chooses the search configuration for every attempt.  The share of the attempts that a
+  configuration gets follows its win statistics, accumulated over all searches (stored as one
+  JSON object per line): every attempt draws a success rate for every configuration from its
+  posterior (a beta distribution, Thompson sampling), and goes to the configuration with the
+  highest draw.  Configurations with little history are thus still tried regularly.
+  """
+  def __init__(self, configurations, file=None):
+    self.configurations = configurations
+    self.options = dict(configurations)
+    self.file = file
+    self.attempts = dict([(c, 0) for c, o in configurations])
+    self.wins = dict([(c, 0) for c, o in configurations])
+    self.used = dict([(c, 0) for c, o in configurations]) # attempts in this search
+    if file is not None and os.path.exists(file):
+      for l in open(file):
+        try:
+          e = json.loads(l)
+        except ValueError:
+          # partially written line
+          continue
+        if e['configuration'] in self.attempts:
+          self.attempts[e['configuration']] += 1
+          if e['success']:
+            self.wins[e['configuration']] += 1
+
+  def next_configuration(self):
+    """Return the name of the configuration to use for the next attempt."""
+    def draw(c):
+      return random.betavariate(1 + self.wins[c], 1 + self.attempts[c] - self.wins[c])
+    best = max([c for c, o in self.configurations], key=draw)
+    self.used[best] += 1
+    return best
+
+  def get_options(self, name):
+    """The options for mimic-core of a configuration."""
+    return self.options[name]
+
+  def record(self, name, success):
+    """Record whether an attempt with the given configuration found a model."""
+    self.attempts[name] += 1
+    if success:
+      self.wins[name] += 1
+    if self.file is not None:
+      common.fprinta(self.file, json.dumps({'configuration': name, 'success': success}) + "\n")
+
+  def summary(self):
+    return ", ".join(["%s: %d attempts (%d of %d won overall)" % (c, self.used[c], self.wins[c], self.attempts[c])
+                      for c, o in self.configurations if self.used[c] > 0])
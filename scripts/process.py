@@ -13,8 +13,9 @@ import codecs
 import sys
 import os
 import argparse
-import cPickle
+import numpy as np
 import common
+import journal
 
 line = "-" * 80
 argv = None # the arguments
@@ -26,34 +27,33 @@ out = None # the output folder
 
 def main():
   parser = argparse.ArgumentParser(description='Process the data from the synthesize experiment.')
-  parser.add_argument('--folder', type=str, help='The folder to process', default="<latest>")
+  parser.add_argument('--folder', type=str, nargs='+', help='The folder(s) to process (results from several folders are merged)', default=["<latest>"])
   parser.add_argument('--out', type=str, help='The file to store the LaTeX table', default="../paper/table.tex")
+  parser.add_argument('--percentiles', type=str, help='Which percentiles of the time to report (comma-separated)', default="25,75,90")
+  parser.add_argument('--bootstrap', type=int, help='Number of bootstrap samples for the confidence intervals', default=2000)
+  parser.add_argument('--max-threads', type=int, help='Predict the time to find a model for up to this many threads (0 = the most threads in the results)', default=0)
 
   global argv
   argv = parser.parse_args()
 
   workdir = os.path.abspath(os.path.dirname(__file__) + "/../tests/out")
 
-  folder = argv.folder
-  if folder == "<latest>":
-    folders = sorted([workdir + "/" + f for f in os.listdir(workdir) if os.path.isdir(workdir + "/" + f)])
-    folder = folders[-1]
+  folders = []
+  for folder in argv.folder:
+    if folder == "<latest>":
+      folder = sorted([workdir + "/" + f for f in os.listdir(workdir) if os.path.isdir(workdir + "/" + f)])[-1]
+    folders.append(folder)
 
   try:
-    data = cPickle.loads(open(folder + "/result.pickle").read())
-    """:type : list[common.MimicResult] """
-  except ValueError as ex:
+    data = Results(common.flatten_iter(map(journal.read_results, folders)))
+  except (ValueError, IOError) as ex:
     print "Failed to parse configuration: " + str(ex)
     sys.exit(1)
 
-  lookup = {}
-  metrics = {}
-  for res in data:
-    lookup[res.f.title] = res
-    metrics[res.metric] = True
-  functions = sorted(lookup.keys())
+  functions = data.functions()
   functions = functions[3:] + functions[0:3]
-  metrics = sorted(metrics.keys())
+  metrics = data.metrics()
+  percentiles = map(lambda x: float(x), argv.percentiles.split(","))
 
   slowdowns = []
   averages = []
@@ -73,18 +73,15 @@ def main():
   header.append("Loop rank")
   cols = map(lambda x: [], header)
   for f in functions:
-    fdata = filter_data(data, f)
-    cols[0].append(fdata[0].f.shortname)
+    cols[0].append(data.first[f].f.shortname)
     c = 1
     raw = range(len(metrics))
     for m in metrics:
-      fmdata = filter_data(data, f, m)
-      if m == 0 and len(fmdata) > 0:
-        its_per_sec.append((fdata[0].f.shortname, 1000.0/avg(map(lambda x: float(x.iterations)/x.core_time, fmdata))))
-      # dd = sum(map(lambda x: x.total_crashes, fmdata))
-      # if dd > 0: print ("%.3f" % (float(dd)/sum(map(lambda x: x.total_searches, fmdata)))), fmdata[0].f.title
-      times = map(lambda x: x.total_time, fmdata)
-      raw[m] = avg(times) if len(times) > 0 else None
+      times = data.get("total_time", f, m)
+      if m == 0 and len(times) > 0:
+        ips = data.get("iterations", f, m) / data.get("core_time", f, m)
+        its_per_sec.append((data.first[f].f.shortname, 1000.0/np.mean(ips)))
+      raw[m] = np.mean(times) if len(times) > 0 else None
       if m == 0 and raw[m] is not None:
         averages.append(raw[m])
       cols[c].append(avg_stats(times))
@@ -100,14 +97,38 @@ def main():
           cols[c].append("%.2f%%" % (sd))
           slowdowns.append(sd)
         c += 1
-    cols[c].append(index_to_str(fdata[0].loop_index))
+    cols[c].append(index_to_str(data.first[f].loop_index))
 
   print_table(header, cols)
+  threads = sorted(set(data.threads[data.threads >= 0]))
+  print ""
+  print "Threads per run: %s" % (", ".join(map(str, threads)) if len(threads) > 0 else "unknown")
+  if len(folders) > 1:
+    print "Merged %d results from %d folders" % (len(data), len(folders))
+
+  # more detailed statistics on the time to find a model
+  header = ["Function", "Metric", "Runs", "Mean", "95% CI", "Median"] + map(lambda p: "P%g" % p, percentiles)
+  cols = map(lambda x: [], header)
+  for f in functions:
+    for m in metrics:
+      times = data.get("total_time", f, m)
+      if len(times) == 0:
+        continue
+      lo, hi = bootstrap_ci(times, argv.bootstrap)
+      row = [data.first[f].f.shortname, str(m), str(len(times)), "%.2f" % np.mean(times), "%.2f - %.2f" % (lo, hi),
+             "%.2f" % np.median(times)] + map(lambda v: "%.2f" % v, np.percentile(times, percentiles))
+      for i in range(len(row)):
+        cols[i].append(row[i])
+  print ""
+  print_table(header, cols)
+
   print ""
   print "Overall average: %s seconds" % (avg_stats(averages))
   print "Overall minimum: %.2f seconds" % (min(averages))
   print "Overall maximum: %.2f seconds" % (max(averages))
 
+  runtime_distributions(data, functions, argv.max_threads if argv.max_threads > 0 else max(threads + [1]))
+
   if len(slowdowns) > 0:
     print ""
     print "Slowdown average: %s percent" % (avg_stats(slowdowns))
@@ -139,17 +160,16 @@ def main():
     s += "\n" + "\\textbf{%s} %s" % (hr[-1], endline)
   s += "\n" + "\\midrule"
   for k in functions:
-    fdata = filter_data(data, k, 0)
-    if len(fdata) > 0:
-      nm = fdata[0].f.shortname
+    times = data.get("total_time", k, 0)
+    if len(times) > 0:
+      nm = data.first[k].f.shortname
       # if nm in ["max", "min", "sum", "shift"]:
       #   nm += "$^*$"
       s += "\n" + nm
       s += "\n" + space
-      times = map(lambda x: x.total_time, fdata)
       s += "\n" + avg_stats(times)
       s += "\n" + space
-      index = fdata[0].loop_index
+      index = data.first[k].loop_index
       s += "\n" + index_to_str(index)
       s += "\n" + endline
   s += "\n" + "\\bottomrule"
@@ -168,46 +188,204 @@ def index_to_str(i):
     return "loop-free"
   return str(i)
 
-def filter_data(data, f, m=None):
+class Results(object):
+  """
+  The results of one or more experiments, stored column-wise (as numpy arrays) and grouped by
+  function and metric, so that the statistics for a function don't require a pass over all results.
+  """
+  def __init__(self, results):
+    """
+    :type results: collections.Iterable[common.MimicResult]
+    """
+    self.first = {} # function -> first result seen for it
+    rows = {}
+    for c in COLUMNS:
+      rows[c] = []
+    groups = {}
+    self.attempts = {} # (function, metric) -> records of all attempts (see run.attempt_record)
+    n = 0
+    for res in results:
+      if res.f.title not in self.first:
+        self.first[res.f.title] = res
+      if res.attempts is not None:
+        # with a portfolio, the attempts of a run may use different metrics
+        for r in res.attempts:
+          self.attempts.setdefault((res.f.title, r.get('metric', res.metric)), []).append(r)
+      for c in COLUMNS:
+        rows[c].append(getattr(res, c))
+      groups.setdefault((res.f.title, res.metric), []).append(n)
+      n += 1
+    self.n = n
+    for c in COLUMNS:
+      setattr(self, c, np.array(rows[c], dtype=float))
+    self.threads = np.array(map(lambda t: -1 if t is None else t, rows["threads"]), dtype=int)
+    self.groups = {}
+    for k in groups:
+      self.groups[k] = np.array(groups[k], dtype=int)
+
+  def __len__(self):
+    return self.n
+
+  def functions(self):
+    return sorted(self.first.keys())
+
+  def metrics(self):
+    return sorted(set(map(lambda k: k[1], self.groups.keys())))
+
+  def get(self, column, f, m=None):
+    """Return the values of a column for the function f (and metric m, or all metrics)."""
+    if m is not None:
+      idx = self.groups.get((f, m), np.array([], dtype=int))
+    else:
+      idx = np.concatenate([self.groups[k] for k in self.groups if k[0] == f])
+    return getattr(self, column)[idx]
+
+# the columns stored for every result
+COLUMNS = ["total_time", "iterations", "core_time", "total_searches", "total_crashes", "loop_index", "metric", "threads"]
+
+def bootstrap_ci(values, samples=2000, confidence=0.95):
+  """A bootstrap confidence interval for the mean of values."""
+  values = np.asarray(values, dtype=float)
+  if len(values) < 2:
+    return (np.mean(values), np.mean(values))
+  rng = np.random.RandomState(0)
+  means = values[rng.randint(0, len(values), size=(samples, len(values)))].mean(axis=1)
+  alpha = (1.0 - confidence) / 2.0
+  lo, hi = np.percentile(means, [100.0 * alpha, 100.0 * (1.0 - alpha)])
+  return (lo, hi)
+
+def bootstrap_slowdown_ci(base, alt, samples=2000, confidence=0.95):
+  """
+  A bootstrap confidence interval for the slowdown of alt compared to base, that is
+  (mean(alt) - mean(base)) / mean(base), as a fraction.
+  """
+  base = np.asarray(base, dtype=float)
+  alt = np.asarray(alt, dtype=float)
+  rng = np.random.RandomState(0)
+  mb = base[rng.randint(0, len(base), size=(samples, len(base)))].mean(axis=1)
+  ma = alt[rng.randint(0, len(alt), size=(samples, len(alt)))].mean(axis=1)
+  slowdowns = (ma - mb) / mb
+  alpha = (1.0 - confidence) / 2.0
+  lo, hi = np.percentile(slowdowns, [100.0 * alpha, 100.0 * (1.0 - alpha)])
+  return (lo, hi)
+
+def runtime_distributions(data, functions, max_threads):
+  """
+  Fit the distribution of the runtime of single attempts (for the default metric) for every
+  function, and print what it predicts about restarts and parallelism, compared to the results.
+  :type data: Results
+  """
+  counts = [1]
+  while counts[-1] * 2 <= max_threads:
+    counts.append(counts[-1] * 2)
+  if counts[-1] != max_threads:
+    counts.append(max_threads)
+  header = ["Function", "Attempts", "Shape", "Scale", "Offset", "Best cutoff"] + map(lambda p: "E[T] (%d)" % p, counts)
+  cols = map(lambda x: [], header)
+  speedup_header = ["Function", "Threads", "Runs", "Measured", "Predicted", "Measured speedup", "Predicted speedup"]
+  speedup_cols = map(lambda x: [], speedup_header)
+  for f in functions:
+    # attempts that were stopped early are censored at the time they ran (like timeouts), but
+    # attempts that were cancelled (because another one found a model) are left out: their time
+    # counts from when they were queued rather than started
+    records = [r for r in data.attempts.get((f, 0), []) if r['outcome'] in ["success", "timeout", "stopped"]]
+    if len(records) == 0:
+      continue
+    fit = fit_weibull([r['wall'] for r in records], [r['outcome'] == "success" for r in records])
+    if fit is None:
+      continue
+    name = data.first[f].f.shortname
+    predicted = {}
+    cutoff = None
+    for p in counts + [t for t in set(data.get("threads", f, 0)) if t > 0]:
+      if p not in predicted:
+        c, predicted[p] = optimal_cutoff(fit, p)
+        if p == 1:
+          cutoff = c
+    row = [name, str(len(records)), "%.2f" % fit[0], "%.2f" % fit[1], "%.2f" % fit[2],
+           "%.2f" % cutoff if cutoff is not None else "none"] + map(lambda p: "%.2f" % predicted[p], counts)
+    for i in range(len(row)):
+      cols[i].append(row[i])
+    # the time measured with every number of threads, against the prediction
+    threads = data.get("threads", f, 0)
+    times = data.get("total_time", f, 0)
+    measured = {}
+    for p in sorted(set(threads)):
+      if p > 0:
+        measured[p] = np.mean(times[threads == p])
+    for p in sorted(measured.keys()):
+      row = [name, str(p), str(np.sum(threads == p)), "%.2f" % measured[p], "%.2f" % predicted[p],
+             "%.2f" % (measured[1] / measured[p]) if 1 in measured else "n/a", "%.2f" % (predicted[1] / predicted[p])]
+      for i in range(len(row)):
+        speedup_cols[i].append(row[i])
+  if len(cols[0]) == 0:
+    return
+  print ""
+  print "Runtime distribution of single attempts (Weibull fit), and the expected time to find a model"
+  print "with the best fixed cutoff for 1 to %d threads:" % max_threads
+  print_table(header, cols)
+  print ""
+  print "Measured time to find a model compared to the prediction (with the best fixed cutoff):"
+  print_table(speedup_header, speedup_cols)
+
+def fit_weibull(times, successes):
+  """
+  Fit a (shifted) Weibull distribution to the runtimes of attempts by maximum likelihood, where
+  an attempt that did not succeed only tells us that its runtime is larger than the time it ran
+  (it is censored).  The offset accounts for the time every attempt needs to get started.
+  Returns (shape, scale, offset), or None if no attempt succeeded.
+  """
+  times = np.asarray(times, dtype=float)
+  successes = np.asarray(successes, dtype=bool)
+  d = np.sum(successes)
+  if d == 0:
+    return None
+  offset = 0.95 * np.min(times[successes])
+  t = np.maximum(times - offset, 1e-6)
+  logt = np.sum(np.log(t[successes]))
+  best = None
+  for k in np.exp(np.linspace(np.log(0.05), np.log(20), 400)):
+    # with the scale that maximizes the likelihood for this shape (in closed form)
+    lamk = np.sum(t ** k) / d
+    ll = d * np.log(k) - d * np.log(lamk) + (k - 1) * logt - d
+    if best is None or ll > best[0]:
+      best = (ll, k, lamk ** (1.0 / k))
+  return (best[1], best[2], offset)
+
+def expected_time(fit, cutoff, p):
+  """
+  The expected time to find a model with p threads that each restart their attempt after cutoff
+  seconds (or never, if cutoff is None), for the runtime distribution fit (see fit_weibull).
+  """
+  k, lam, offset = fit
+  # the survival function is 1 until the offset, and Weibull afterwards
+  upper = lam * 50 ** (1.0 / k) if cutoff is None else cutoff - offset
+  t = np.concatenate([[0], np.geomspace(1e-6, 1, 2000) * max(upper, 1e-6)])
+  surv = np.exp(-(t / lam) ** k) ** p
+  total = offset + np.trapz(surv, t)
+  if cutoff is None:
+    return total
+  return total / (1 - surv[-1])
+
+def optimal_cutoff(fit, p):
   """
-  :type data: list[common.MimicResult]
-  :type f: str
-  :type m: int
-  :rtype: list[common.MimicResult]
+  The fixed cutoff for p threads that minimizes the expected time to find a model (None for not
+  restarting at all), together with that expected time.
   """
-  res = []
-  for d in data:
-    if d.f.title != f: continue
-    if m is not None and m != d.metric: continue
-    res.append(d)
-  return res
-
-
-def avg(l):
-  assert len(l) > 0
-  return float(sum(l)) / float(len(l))
-
-def _ss(data):
-    """Return sum of square deviations of sequence data."""
-    c = avg(data)
-    ss = sum((x-c)**2 for x in data)
-    return ss
-
-def pstdev(data):
-    """Calculates the population standard deviation."""
-    n = len(data)
-    if n < 2:
-        raise ValueError('variance requires at least two data points')
-    ss = _ss(data)
-    pvar = ss/n # the population variance
-    return pvar**0.5
+  k, lam, offset = fit
+  best = (None, expected_time(fit, None, p))
+  for c in offset + lam * np.geomspace(1e-3, 1e3, 300):
+    e = expected_time(fit, c, p)
+    if e < best[1]:
+      best = (c, e)
+  return best
 
 def avg_stats(l):
   if len(l) == 0:
     return u"n/a"
   if len(l) == 1:
-    return u"%.2f" % avg(l)
-  return u"%.2f ± %.2f" % (avg(l), pstdev(l))
+    return u"%.2f" % np.mean(l)
+  return u"%.2f ± %.2f" % (np.mean(l), np.std(l))
 
 
 def percent(a, b):
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Racing of concurrent attempts: stop attempts early that make little progress
+#
+# ------------------------------------------------------------------------------
+
+# by default, keep the best third of the attempts at every rung
+eta_default = 3
+# the number of rungs (at 1/eta^rungs, ..., 1/eta of the timeout of an attempt)
+rungs_default = 2
+# stop an attempt if its best score did not improve for this fraction of its timeout
+stall_default = 0.5
+
+class Race(object):
+  """
+  Decides, based on the progress reports of mimic-core, which attempts to stop before their
+  timeout (in the style of asynchronous successive halving).  Every attempt passes a number of
+  rungs at fixed fractions of its timeout, and at every rung its best score so far is compared
+  to the scores of all earlier attempts at the same rung: unless it is among the best 1/eta of
+  them, it is stopped.  Independently, attempts whose best score did not improve for a fraction
+  stall of their timeout are stopped (stall = 0 disables this).
+
+  Scores are only compared within the same phase of the search (see Search.Progress) and the
+  same group of attempts (such as the ones with the same search configuration, whose scores may
+  use different metrics), and attempts that reached the cleanup phase (i.e., found a correct
+  program) are never stopped.
+  """
+  def __init__(self, eta=eta_default, rungs=rungs_default, stall=stall_default):
+    self.eta = eta
+    self.fractions = [pow(eta, -k) for k in range(rungs, 0, -1)]
+    self.stall = stall
+    self.attempts = {} # id -> AttemptProgress
+    self.scores = {} # (group, rung, phase) -> best scores of attempts at that rung
+    self.stopped = 0
+
+  def update(self, id, timeout, msg, group=None):
+    """
+    Process a progress report of the attempt id (with the given timeout, in the given group), and
+    return a reason for stopping it, or None if it should keep running.
+    """
+    a = self.attempts.get(id)
+    if a is None or a.phase != msg['phase']:
+      a = AttemptProgress(msg['phase'], msg['elapsed'])
+      self.attempts[id] = a
+    if a.phase == "cleanup":
+      return None
+    elapsed = msg['elapsed']
+    if msg['best'] < a.best:
+      a.best = msg['best']
+      a.improved = elapsed
+    reason = None
+    while a.rung < len(self.fractions) and elapsed >= self.fractions[a.rung] * timeout:
+      scores = self.scores.setdefault((group, a.rung, a.phase), [])
+      scores.append(a.best)
+      # only decide once there are enough attempts to compare against
+      if reason is None and len(scores) >= self.eta:
+        cut = sorted(scores)[len(scores) / self.eta]
+        if a.best > cut:
+          reason = "score %.2f at %d%% of the timeout, %d attempts did better" % (a.best, round(100 * self.fractions[a.rung]), len([s for s in scores if s < a.best]))
+      a.rung += 1
+    if reason is None and self.stall > 0 and elapsed - a.improved > self.stall * timeout:
+      reason = "no improvement over %.2f for %.1f seconds" % (a.best, elapsed - a.improved)
+    if reason is not None:
+      self.stopped += 1
+    return reason
+
+  def finish(self, id):
+    """Forget about a finished attempt."""
+    self.attempts.pop(id, None)
+
+class AttemptProgress(object):
+  def __init__(self, phase, elapsed):
+    self.phase = phase
+    self.best = float("inf")
+    self.improved = elapsed # time of the last improvement
+    self.rung = 0
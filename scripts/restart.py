@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Restart policies: the timeouts of the attempts of a search
+#
+# ------------------------------------------------------------------------------
+
+# the names of all policies (see get_policy)
+POLICIES = ["geometric", "luby", "fixed", "learned"]
+
+# the minimal number of successful attempts in the history of a function to learn a cutoff
+min_successes = 3
+
+def get_policy(name, t0, f, history=None):
+  """
+  Return the restart policy with the given name.  t0 is the timeout of the first phase (for the
+  geometric policy), the unit (for the luby policy) or the cutoff (for the fixed policy), and f
+  is the factor of the geometric policy.  The learned policy chooses its cutoff from the history
+  of a function (entries of its ledger.SeedLedger), and behaves like the geometric policy if
+  there is not enough history.
+  """
+  if name == "geometric":
+    return RestartPolicy(t0, f)
+  if name == "luby":
+    return Luby(t0)
+  if name == "fixed":
+    return Fixed(t0)
+  if name == "learned":
+    cutoff = learn_cutoff(history if history is not None else [])
+    if cutoff is None:
+      return RestartPolicy(t0, f)
+    return Fixed(cutoff, "learned")
+  raise ValueError("unknown restart policy '%s' (expected one of %s)" % (name, ", ".join(POLICIES)))
+
+class RestartPolicy(object):
+  """
+  Decides the timeout of every attempt.  Attempts are started in phases of one attempt per
+  thread, and the n-th attempt (starting at 0) belongs to phase n / threads.  By default (the
+  geometric policy), the timeout grows by a constant factor from phase to phase.  The factor f
+  is the one for a single thread, and is scaled for more threads (as more attempts run per
+  phase).  The other policies override timeout.
+  """
+  name = "geometric"
+
+  def __init__(self, t0, f):
+    self.t0 = t0
+    self.f = f
+
+  def timeout(self, n, threads):
+    """The timeout (in seconds) of the n-th attempt."""
+    return round(self.t0 * pow(pow(self.f, threads), n / threads))
+
+  def __repr__(self):
+    return self.name
+
+def luby(i):
+  """The i-th element (starting at 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ..."""
+  k = 1
+  while (1 << k) - 1 < i:
+    k += 1
+  if i == (1 << k) - 1:
+    return 1 << (k - 1)
+  return luby(i - (1 << (k - 1)) + 1)
+
+class Luby(RestartPolicy):
+  """
+  The universal restart strategy of Luby et al.: the timeouts follow the Luby sequence (scaled
+  by a unit), on every thread.  It is within a logarithmic factor of the optimal strategy for
+  any runtime distribution.
+  """
+  name = "luby"
+
+  def __init__(self, unit):
+    self.unit = unit
+
+  def timeout(self, n, threads):
+    return self.unit * luby(n / threads + 1)
+
+class Fixed(RestartPolicy):
+  """The same timeout for every attempt (optimal if the runtime distribution is known)."""
+  name = "fixed"
+
+  def __init__(self, cutoff, name=None):
+    self.cutoff = cutoff
+    if name is not None:
+      self.name = name
+
+  def timeout(self, n, threads):
+    return self.cutoff
+
+  def __repr__(self):
+    return "%s (%d seconds)" % (self.name, self.cutoff)
+
+def learn_cutoff(history):
+  """
+  The fixed timeout that minimizes the expected time to find a model for the runtime
+  distribution seen in the history of a function (entries of its ledger.SeedLedger), or None if
+  there is not enough history.  An attempt that did not succeed within t seconds only tells us
+  that its runtime exceeds t, so every candidate cutoff is evaluated on the attempts whose outcome
+  at that cutoff is known.
+  """
+  runs = [(e['time'], e['outcome'] == "success") for e in history
+          if e.get('time') is not None and e['outcome'] in ["success", "timeout", "stopped"]]
+  if len([r for r in runs if r[1]]) < min_successes:
+    return None
+  best = None
+  for t in sorted(set([time for time, success in runs if success])):
+    known = [(time, success) for time, success in runs if success or time >= t]
+    solved = len([1 for time, success in known if success and time <= t])
+    if solved < min_successes:
+      # too noisy
+      continue
+    # the expected time is the total time spent (with every attempt stopped at t) per success
+    expected = sum([min(time, t) for time, success in known]) / solved
+    if best is None or expected < best[0]:
+      best = (expected, t)
+  # leave some slack for the variation in the time mimic-core needs to start up
+  return max(1, int(round(best[1] * 1.1)))
@@ -11,34 +11,67 @@
 
 import os
 import time
+import json
 import argparse
-import re
 import colors
 import multiprocessing
-from multiprocessing import Pool
-from multiprocessing import Queue
+from collections import deque
 import tempfile
 import common
 import sys
 import shutil
+import shlex
+import signal
+import atexit
+import coreworker
+import ledger
+import cache
+import race
+import restart
+import bandit
+import portfolio
+import hostprofile
+import topology
+import library
+import tracing
+import client
 
 line = colors.grey("-" * 80)
-q = None # the queue used for communication
+pool = None # the mimic-core workers (a coreworker.WorkerPool)
+generation = 0 # incremented for every call to mimic, to recognize messages from earlier calls
+messages = deque() # messages about attempts that were not processed yet (see next_message)
 argv = None # the arguments
-out = None # the output folder
-base_command = os.path.abspath(os.path.dirname(__file__) + '/../mimic-core') + ' synth --iterations 100000000'
+tracer = None # records where the time goes (see --trace)
+core = os.path.abspath(os.path.dirname(__file__) + '/../mimic-core')
+base_command = core + ' synth --iterations 100000000'
+worker_command = [core, 'worker', '--iterations', '100000000', '--colors', '0']
+core_args = [] # additional arguments for mimic-core
+placement = "none" # the order in which the workers are pinned to physical cores (see topology.ORDERS)
+first_core = 0 # the first physical core for the workers (when several runs of mimic share a machine)
 parallel_t0_default = 8
 parallel_f_default = 1.025
+progress_interval = 1 # seconds between progress reports of mimic-core
+resume_default = 0.5
+warm_start_default = 0.25
 
 # ------------------------------------------
 # main entry point
 # ------------------------------------------
 
 def main():
+  # the defaults of some options come from the profile of this host (see scripts/tune.py)
+  pre = argparse.ArgumentParser(add_help=False)
+  pre.add_argument('--no-profile', action='store_true')
+  profile = None if pre.parse_known_args()[0].no_profile else hostprofile.load()
+  defaults = profile if profile is not None else {}
+
   parser = argparse.ArgumentParser(description='Run Mimic to compute models for opaque code',
                                    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-  parser.add_argument('-t', '--threads', metavar="<n>", type=int,
-                      help='Number of threads (-1 = number of cores available)', default=-1)
+  parser.add_argument('-t', '--threads', metavar="<n>", type=threads_arg,
+                      help='Number of threads (-1 = half the number of logical CPUs, auto = number of physical cores)', default=-1)
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='Pin every worker to a physical core of its own, filling one socket after the other (compact) or alternating between the sockets (spread), or let the workers run anywhere (none)',
+                      default="none")
   parser.add_argument('--function', type=str,
                       metavar="<body>",
                       help='The function body of the opaque code (as JavaScript source code)', required=True)
@@ -59,18 +92,62 @@ def main():
   parser.add_argument('--nocolor', help='Don\'t use any color in the output', action='store_true')
   parser.add_argument('--debug', help='Output debug information, and only do a single run of mimic-core',
                       action='store_true')
-  parser.add_argument('--parallel_t0', metavar="<t0>", type=int, help='The timeout to be used in the first phase',
-                      default=parallel_t0_default)
+  parser.add_argument('--restart-policy', metavar="<policy>", type=str, choices=restart.POLICIES,
+                      help='How to choose the timeouts of the attempts (one of %s)' % ", ".join(restart.POLICIES),
+                      default="geometric")
+  parser.add_argument('--parallel_t0', metavar="<t0>", type=int,
+                      help='The timeout to be used in the first phase (the unit of the luby policy, and the timeout of the fixed policy)',
+                      default=defaults.get('parallel_t0', parallel_t0_default))
   parser.add_argument('--parallel_f', metavar="<f>", type=float,
                       help='The factor with which to increase the timeout (based on a single thread, and scaled appropriately for more threads)',
-                      default=parallel_f_default)
+                      default=defaults.get('parallel_f', parallel_f_default))
+  parser.add_argument('--no-profile', help='Don\'t take the defaults of --parallel_t0, --parallel_f and the search parameters of mimic-core from the profile of this host (written by scripts/tune.py)',
+                      action='store_true')
+  parser.add_argument('--no-cache', help='Don\'t use (or update) the cache of previously synthesized models',
+                      action='store_true')
+  parser.add_argument('--refresh-cache', help='Synthesize a new model even if one is cached (and cache the new one)',
+                      action='store_true')
+  parser.add_argument('--cache-size', metavar="<mb>", type=int, help='Maximal size of the model cache in megabytes',
+                      default=cache.max_size_default)
+  parser.add_argument('--no-ledger', help='Don\'t use (or update) the history of random seeds tried for this function',
+                      action='store_true')
+  parser.add_argument('--no-early-stop', help='Let every attempt run until its timeout, even if it makes little progress',
+                      action='store_true')
+  parser.add_argument('--race-eta', metavar="<eta>", type=int,
+                      help='Stop attempts that are not among the best 1/eta at the checkpoints during their timeout',
+                      default=race.eta_default)
+  parser.add_argument('--stall', metavar="<fraction>", type=float,
+                      help='Stop attempts whose score did not improve for this fraction of their timeout (0 to disable)',
+                      default=race.stall_default)
+  parser.add_argument('--resume-fraction', metavar="<fraction>", type=float,
+                      help='Fraction of the attempts that continue from the best program of an attempt that timed out (0 to always start from scratch)',
+                      default=resume_default)
+  parser.add_argument('--warm-start', metavar="<fraction>", type=float,
+                      help='Fraction of the first attempts that start from models found for similar functions (0 to disable)',
+                      default=warm_start_default)
+  parser.add_argument('--no-loop-bandit', help='Let every attempt choose its loop template randomly, rather than spreading the templates over the attempts',
+                      action='store_true')
+  parser.add_argument('--portfolio', help='Give the attempts a spread of search configurations (metric and temperature, see scripts/portfolio.py), in proportion to how often each one found a model before',
+                      action='store_true')
+  parser.add_argument('--no-service', help='Don\'t hand the job to the mimic service (see scripts/service.py), even if it is running',
+                      action='store_true')
+  parser.add_argument('--priority', metavar="<p>", type=int, help='Priority of the job for the mimic service (higher runs first)',
+                      default=0)
+  parser.add_argument('--logs', metavar="<folder>", type=str,
+                      help='Keep the complete output of every attempt (compressed) in this folder',
+                      default="")
+  parser.add_argument('--trace', metavar="<file>", type=str,
+                      help='Write a trace of the attempts and the orchestration (in the Chrome trace event format) to this file',
+                      default="")
 
   global argv
   argv = parser.parse_args()
 
-  global base_command
+  global base_command, core_args, placement
+  placement = argv.placement
   if argv.args != "":
     base_command = base_command + " " + argv.args
+    core_args = shlex.split(argv.args)
 
   if argv.nocolor:
     colors.no_color = True
@@ -85,149 +162,721 @@ def main():
   print colors.grey(line)
   print colors.grey("Configuration:")
   print colors.grey("  Number of threads: %d" % (argv.threads if argv.threads > 0 else get_default_threads()))
+  if placement != "none":
+    print colors.grey("  Placement:         %s" % placement)
+  if profile is not None:
+    print colors.grey("  Host profile:      %s" % hostprofile.get_file())
   print line
 
+  core_options = hostprofile.core_options(profile, core_args)
+
   if argv.debug:
     print colors.grey("Running in debug mode")
     print colors.grey(line)
-    run_mimic_core((0, f, 1200, argv.metric, 1000), debug=True, filename=argv.out)
+    run_mimic_core(((0, 0), f, 1200, argv.metric, 1000, argv.out, core_options, None))
     return
 
-  result = mimic(f, argv.metric, argv.threads, False, argv.parallel_t0, argv.parallel_f)
+  models = cache.ModelCache(argv.cache_size)
+  key = cache.model_key(f, argv.metric, core_args)
+  result = None
+  if not argv.no_cache and not argv.refresh_cache:
+    result = models.get(key)
+  if result is not None:
+    print "Found a cached model (use --refresh-cache to synthesize a new one)"
+    print result.get_status("  ")
+    print ""
+    print "Model (also stored in '%s'):" % out_file
+    print colors.green(result.result_code)
+    common.fprint(out_file, result.result_code)
+    return
+
+  options = {
+    'parallel_t0': argv.parallel_t0,
+    'parallel_f': argv.parallel_f,
+    'restart_policy': argv.restart_policy,
+    'use_ledger': not argv.no_ledger,
+    'early_stop': not argv.no_early_stop,
+    'race_eta': argv.race_eta,
+    'stall': argv.stall,
+    'loop_bandit': not argv.no_loop_bandit,
+    'portfolio': argv.portfolio,
+    'resume': argv.resume_fraction,
+    'warm_start': argv.warm_start,
+    'logs': os.path.abspath(argv.logs) if argv.logs != "" else None,
+    'core_options': core_options,
+  }
+  result = None
+  service = None
+  if not argv.no_service and argv.trace == "":
+    service = client.connect()
+  if service is not None:
+    result = mimic_on_service(service, f, argv.metric, options)
+  else:
+    if argv.trace != "":
+      global tracer
+      tracer = tracing.Tracer()
+    result = mimic(f, argv.metric, argv.threads, **mimic_kwargs(dict(options, silent=False)))
+  if not argv.no_cache:
+    models.put(key, result)
   print colors.grey(line)
   print "Successfully found a model"
   print result.get_status("  ")
+  if tracer is not None:
+    traced("shutdown pool", shutdown_pool)
+    tracer.write(argv.trace)
+    print ""
+    print "Where the time went (trace written to '%s'):" % argv.trace
+    print trace_summary(result, "  ")
   print ""
   print "Model (also stored in '%s'):" % out_file
   print colors.green(result.result_code)
-  shutil.move(result.result_file, out_file)
+  if result.result_file is not None:
+    shutil.move(result.result_file, out_file)
+  else:
+    common.fprint(out_file, result.result_code)
+
+def mimic_kwargs(options):
+  """The keyword arguments for mimic corresponding to the options given on the command line."""
+  racing = None
+  if options.get('early_stop', True):
+    racing = race.Race(options.get('race_eta', race.eta_default), stall=options.get('stall', race.stall_default))
+  return {
+    'silent': options.get('silent', True),
+    'parallel_t0': options.get('parallel_t0', parallel_t0_default),
+    'parallel_f': options.get('parallel_f', parallel_f_default),
+    'restart_policy': options.get('restart_policy', "geometric"),
+    'use_ledger': options.get('use_ledger', True),
+    'racing': racing,
+    'loop_bandit': options.get('loop_bandit', True),
+    'use_portfolio': options.get('portfolio', False),
+    'core_options': options.get('core_options'),
+    'resume': options.get('resume', resume_default),
+    'warm_start': options.get('warm_start', warm_start_default),
+    'logs': options.get('logs'),
+  }
+
+def mimic_on_service(service, f, metric, options):
+  """
+  Compute a model for f on the mimic service (see scripts/service.py).
+  :type service: client.Client
+  """
+  try:
+    id = service.submit(f, metric, options, core_args, argv.priority)
+  except client.ServiceError as ex:
+    print colors.red("The mimic service cannot run this job: %s" % ex)
+    sys.exit(1)
+  print colors.grey("Running as job %d on the mimic service..." % id)
+  try:
+    status = service.wait(id)
+  except KeyboardInterrupt:
+    # the service only reads the next request on this connection once the wait is over, so the
+    # job is cancelled over a connection of its own
+    canceller = client.Client(service.path)
+    try:
+      canceller.cancel(id)
+    finally:
+      canceller.close()
+    raise
+  except client.ServiceError as ex:
+    print colors.red("The mimic service did not finish job %d: %s" % (id, ex))
+    sys.exit(1)
+  result = client.to_result(f, status)
+  if result is None:
+    print colors.red("The mimic service did not find a model (job %s)" % status['state'])
+    sys.exit(1)
+  return result
 
 def get_default_threads():
   return int(round(float(multiprocessing.cpu_count()) / 2.0))
 
+def threads_arg(s):
+  """Parse the value of --threads ('auto' is the number of physical cores)."""
+  if s == "auto":
+    return max(1, len(topology.physical_cores()))
+  try:
+    return int(s)
+  except ValueError:
+    raise argparse.ArgumentTypeError("expected a number or 'auto', got '%s'" % s)
+
+def get_pool(threads):
+  """
+  Return a pool of the given number of long-running mimic-core workers, all driven from this
+  process.  The pool is kept around between phases (and calls to mimic), so that the workers
+  stay warm.
+  """
+  global pool
+  if pool is not None and pool.size() == threads:
+    return pool
+  shutdown_pool()
+  pool = coreworker.WorkerPool(worker_command + core_args, threads, topology.placement(threads, placement, first_core))
+  try:
+    # the workers run in their own process groups (see coreworker.CoreWorker), so they have to be
+    # killed explicitly when we are terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+  except ValueError:
+    # not the main thread
+    pass
+  return pool
+
+def shutdown_pool():
+  global pool
+  if pool is None:
+    return
+  pool.close()
+  pool = None
+
+atexit.register(shutdown_pool)
+
+def traced(name, fn, *args):
+  """Call fn (with the given arguments), recording how long it takes if we are tracing."""
+  if tracer is None:
+    return fn(*args)
+  return tracer.timed(name, "orchestration", fn, *args)
+
+def trace_attempt(id, seed, timeout, core_result):
+  """Add the spans of a finished attempt (and of the message that reported it) to the trace."""
+  t = core_result.timing
+  tid = t['worker']
+  tracer.track(tid, "worker %d" % tid)
+  status = "success" if core_result.success else ("timeout" if core_result.timeout else "failure (%d)" % core_result.status)
+  tracer.span("attempt %d" % id[1], "attempt", t['start'], t['end'], tid,
+              {'seed': seed, 'timeout': timeout, 'outcome': status, 'iterations': core_result.iterations})
+  search_start = t['start']
+  if t['spawned'] is not None:
+    tracer.span("start mimic-core", "worker start", t['start'], t['spawned'], tid)
+    search_start = t['spawned']
+  if t['first_progress'] is not None:
+    # until the first progress report, the worker computes (or loads) inputs, traces and loops
+    tracer.span("setup", "setup", search_start, t['first_progress'], tid)
+    search_start = t['first_progress']
+  tracer.span("search", "search", search_start, t['end'], tid)
+  tracer.span("queue", "queue", t['sent'], time.time(), tid)
+
+def trace_summary(result, indent):
+  """Summarize how busy the workers were (versus waiting for the orchestration) in the trace."""
+  wall = time.time() - tracer.start
+  capacity = wall * result.threads
+  busy = tracer.total("search")
+  s = ""
+  s +=        indent + "Wall time:                %.2f seconds (%d threads)" % (wall, result.threads)
+  s += "\n" + indent + "Workers searching:        %.2f seconds (%.1f%%)" % (busy, 100 * busy / capacity)
+  s += "\n" + indent + "Workers in setup:         %.2f seconds" % tracer.total("setup")
+  s += "\n" + indent + "Starting mimic-core:      %.2f seconds" % tracer.total("worker start")
+  s += "\n" + indent + "Queue latency:            %.2f seconds" % tracer.total("queue")
+  s += "\n" + indent + "Orchestration:            %.2f seconds" % tracer.total("orchestration")
+  idle = capacity - tracer.total("attempt")
+  s += "\n" + indent + "Workers idle:             %.2f seconds (%.1f%%)" % (idle, 100 * idle / capacity)
+  return s
+
+def cancel(running):
+  """Kill the mimic-core workers of all running tasks (the pool will restart them when needed)."""
+  for pid in running.values():
+    coreworker.kill_group(pid, signal.SIGTERM)
+
+def is_stopped(core_result):
+  """Was the attempt stopped by us (rather than crashing)?"""
+  return core_result.status == -signal.SIGTERM
+
+
+class SearchFailed(Exception):
+  """mimic-core keeps failing (rather than timing out) for a search; output is its last output."""
+  def __init__(self, message, output):
+    Exception.__init__(self, message)
+    self.output = output
 
 def mimic(f, metric=0, threads=-1, silent=True, parallel_t0=parallel_t0_default, parallel_f=parallel_f_default,
-          cleanup=1000):
+          cleanup=1000, use_ledger=True, racing=True, loop_bandit=True, resume=resume_default,
+          warm_start=warm_start_default, stop=None, logs=None, restart_policy="geometric", use_portfolio=False,
+          core_options=None):
+  """
+  Compute a model for f.  The timeouts of the attempts are chosen by the restart policy with the
+  given name (see restart.get_policy).  Every attempt gets a unique seed; with use_ledger, the seeds are chosen
+  based on (and their outcomes are added to) the history for f, see ledger.SeedLedger.  Attempts
+  that make little progress are stopped early as decided by racing (a race.Race, True for the
+  default policy, or None to let every attempt run until its timeout).  With loop_bandit, the
+  loop templates are spread over the attempts by a bandit.LoopBandit (unless f fixes the loop).
+  With use_portfolio, the attempts get different search configurations (overriding the metric), as
+  chosen by a portfolio.Portfolio, and the model found is tagged with the winning configuration
+  (the seed ledger, the racing and the checkpoints are then separate for every configuration).
+  core_options are further options for mimic-core (such as beta), for all attempts (but a
+  portfolio takes precedence).
+  Attempts that time out leave a checkpoint with their best program, and the given fraction of
+  the attempts continue from the best of these checkpoints (rather than starting from scratch).
+  With warm_start, that fraction of the first attempts starts from the models of the most similar
+  functions in the library.ModelLibrary (and the model found is added to the library).  If stop
+  is given, it is called regularly, and the search is abandoned (returning None) once it returns
+  True.  Only the end of the output of every attempt is kept; with logs, the complete output is
+  written to a compressed file per attempt in that folder.
+  """
   if threads < 0:
     threads = get_default_threads()
-  t0 = parallel_t0
-  factor = pow(parallel_f, threads)
-  # create a directory to store information
-  global out
-  out = tempfile.mkdtemp()
-  success = False
-  rep = 0
-  total_attempts = 0
-  total_crashes = 0
-  start = time.time()
-  error_count = 0
-  error_out = ""
-  while success == False:
-    timeout = round(t0 * pow(factor, rep))
-    if not silent:
-      print colors.grey("Starting phase %d with a timeout of %d seconds..." % (rep + 1, timeout))
-    tasks = []
-    total_attempts += threads
-    for i in range(threads):
-      tasks.append((i, f, timeout, metric, cleanup))
-    global q
-    q = Queue()
-    pool = Pool(processes=threads, maxtasksperchild=1)
-    pool.map_async(run_mimic_core, tasks)
-    done_count = 0
+  pool = traced("create pool", get_pool, threads)
+  # attempts of an earlier call that were abandoned before they started
+  pool.discard_queued()
+  search = Search(pool, f, metric, threads, silent, parallel_t0, parallel_f, cleanup, use_ledger, racing, loop_bandit,
+                  resume, warm_start, logs, restart_policy, use_portfolio, core_options)
+  try:
     while True:
-      data = q.get()
-      if data[0] == 0 and data[2] == "done":
-        done_count += 1
-        if done_count == len(tasks):
-          break
+      search.fill()
+      data = next_message(pool, None if stop is None else 1)
+      if stop is not None and stop():
+        search.abandon()
+        return None
+      if data is None or data[1][0] != search.generation:
+        # nothing happened, or a late message from a task we cancelled during an earlier call
         continue
-      if data[0] == 1:
-        # process result
-        id = data[1]
-        core_result = data[2]
-        if core_result.success:
-          success = True
-          # kill all other tasks
-          pool.close()
-          pool.terminate()
-          pool.join()
-          # return result
-          code = ""
-          with open(core_result.code) as fl:
-            code = "".join(fl.readlines())
-          result = common.MimicResult(f, core_result.metric, time.time() - start, core_result.iterations, core_result.core_time,
-                                      total_attempts, total_crashes, core_result.loop_index, core_result.code, code)
-          return result
-        else:
-          if not core_result.timeout:
-            total_crashes += 1
-          if core_result.status == 2:
-            # definitely a user error
-            print colors.red("Error in mimic-core:")
-            print core_result.output
-            pool.close()
-            pool.terminate()
-            pool.join()
-            exit(1)
-          if not core_result.timeout:
-            error_count += 1
-            error_out = core_result.output
+      result = search.handle(data)
+      if result is not None:
+        return result
+  except SearchFailed as ex:
+    print colors.red(str(ex))
+    print ex.output
+    shutdown_pool()
+    sys.exit(1)
+
+class Search(object):
+  """
+  A search for a model (see mimic for the parameters), which keeps a given number of attempts
+  running on a coreworker.WorkerPool.  The search is driven from the outside: fill starts new
+  attempts, and handle processes the messages about them (see next_message).  This way, several
+  searches can share a pool, and the number of threads of a search can grow while it runs (the
+  timeouts still follow the phases of the number of threads it started with).
+  """
+  def __init__(self, pool, f, metric, threads, silent=True, parallel_t0=parallel_t0_default, parallel_f=parallel_f_default,
+               cleanup=1000, use_ledger=True, racing=True, loop_bandit=True, resume=resume_default,
+               warm_start=warm_start_default, logs=None, restart_policy="geometric", use_portfolio=False,
+               core_options=None):
+    global generation
+    generation += 1
+    self.generation = generation # the ids of the attempts are (generation, n)
+    self.pool = pool
+    self.f = f
+    self.metric = metric
+    self.threads = threads
+    self.schedule_threads = threads # the number of attempts per phase of the timeouts
+    self.silent = silent
+    self.cleanup = cleanup
+    self.resume = resume
+    self.logs = logs
+    self.core_options = core_options
+    history = ledger.get_ledger(f, metric, core_args, core_options).entries if restart_policy == "learned" else None
+    self.policy = restart.get_policy(restart_policy, parallel_t0, parallel_f, history)
+    if not silent and restart_policy != "geometric":
+      print colors.grey("Restart policy: %s" % self.policy)
+    # create a directory to store information
+    self.out = tempfile.mkdtemp()
+    if logs is not None and not os.path.exists(logs):
+      os.makedirs(logs)
+    self.total_attempts = 0
+    self.total_crashes = 0
+    self.total_cpu = 0.0
+    self.max_rss = 0
+    self.error_count = 0
+    self.use_ledger = use_ledger
+    self.ledgers = {} # search configuration (None without a portfolio) -> ledger.SeedLedger
+    self.attempts = {} # id -> (seed, timeout)
+    # id -> the loop template forced on the attempt (or None), for the attempts that do not continue
+    # from a program, and whose outcome thus only depends on their seed and loop (see ledger.SeedLedger)
+    self.replayable = {}
+    self.submitted = {} # id -> when the attempt was started
+    self.records = [] # what happened in every attempt (see attempt_record)
+    self.racing = race.Race() if racing is True else racing
+    if tracer is not None:
+      tracer.track(0, "orchestrator")
+    # the precomputation is not part of the time of the search (it is cached, so only the first
+    # search for a function would pay for it)
+    precompute_start = time.time()
+    self.bundle = traced("precompute bundle", get_bundle, f, silent)
+    self.start = time.time()
+    self.precompute_time = self.start - precompute_start
+    self.templates = None
+    if loop_bandit and f.loop is None and self.bundle is not None:
+      self.templates = bandit.LoopBandit(get_loop_count(self.bundle))
+    self.configurations = None
+    if use_portfolio:
+      self.configurations = portfolio.get_portfolio(use_ledger)
+    self.progress = {} # id -> the last progress report
+    self.arms = {} # id -> loop template
+    self.configs = {} # id -> search configuration
+    # search configuration (None without a portfolio) -> the best checkpoints (score, file, loop), best first
+    self.checkpoints = {}
+    self.lib = None
+    self.warm = [] # library entries to start from
+    if warm_start > 0:
+      self.lib = library.ModelLibrary()
+      self.warm = traced("find similar models", self.lib.closest, f, int(round(threads * warm_start)))
+      if not silent and len(self.warm) > 0:
+        print colors.grey("Starting from the models of similar functions: %s" % ", ".join([e['title'] for e in self.warm]))
+    # rather than running in lock-step phases, we start a new attempt as soon as one finishes.  the
+    # timeouts still grow as before: the n-th attempt gets the timeout of phase n / threads.
+    self.outstanding = 0
+    self.running = {} # id -> pid of the worker
+    self.phase_start = None # (phase, timeout, time) of the current phase
+
+  def fill(self):
+    """Start attempts until the search has as many as it has threads."""
+    while self.outstanding < self.threads:
+      self.start_attempt()
+
+  def start_attempt(self):
+    threads = self.schedule_threads
+    n = self.total_attempts
+    rep = n / threads
+    timeout = self.policy.timeout(n, threads)
+    if n % threads == 0:
+      if not self.silent:
+        print colors.grey("Starting phase %d with a timeout of %d seconds..." % (rep + 1, timeout))
+      if tracer is not None:
+        self.end_phase()
+        self.phase_start = (rep, timeout, time.time())
+    id = (self.generation, n)
+    opts = dict(self.core_options) if self.core_options is not None else {}
+    if self.racing is not None or self.templates is not None or tracer is not None:
+      opts['progress'] = progress_interval
+    if self.resume > 0:
+      opts['checkpoint'] = "%s/checkpoint-%d.json" % (self.out, n)
+    if self.lib is not None:
+      opts['program'] = "%s/program-%d.json" % (self.out, n)
+    config = None
+    if self.configurations is not None:
+      config = self.configs[id] = self.configurations.next_configuration()
+    # only continue from the checkpoints of attempts with the same configuration
+    checkpoints = self.checkpoints.get(config, [])
+    if len(self.warm) > 0:
+      opts['resume'] = self.warm.pop(0)['program']
+      # the loop index of a model of another function refers to that function's loop proposals
+      opts['foreign'] = True
+      if self.templates is not None:
+        # the loop templates of another function are not comparable
+        self.arms[id] = None
+    elif len(checkpoints) > 0 and n % threads < round(threads * self.resume):
+      score, opts['resume'], loop = checkpoints.pop(0)
+      if self.templates is not None:
+        self.arms[id] = loop if loop >= 0 else bandit.LOOP_FREE
+        self.templates.pull(self.arms[id])
+    elif self.templates is not None:
+      opts['loop'] = self.arms[id] = self.templates.next_arm()
+    metric = self.metric
+    if config is not None:
+      opts.update(self.configurations.get_options(config))
+      # the configuration may use another metric, which the model found is attributed to
+      metric = opts.get('metric', metric)
+    if 'resume' not in opts:
+      self.replayable[id] = opts.get('loop')
+    seed = self.get_seeds(config).next_seed(timeout, opts.get('loop'), id in self.replayable)
+    opts['seed'] = seed
+    self.attempts[id] = (seed, timeout)
+    self.submitted[id] = time.time()
+    if self.bundle is not None:
+      opts['bundle'] = self.bundle
+    log = "%s/attempt-%d-%d.log.gz" % (self.logs, self.generation, n) if self.logs is not None else None
+    task = (id, self.f, timeout, metric, self.cleanup, "%s/result-%d.js" % (self.out, n), opts, log)
+    start_attempt(self.pool, task)
+    self.total_attempts += 1
+    self.outstanding += 1
+
+  def end_phase(self):
+    if tracer is not None and self.phase_start is not None:
+      tracer.span("phase %d" % (self.phase_start[0] + 1), "phase", self.phase_start[2], time.time(), 0, {'timeout': self.phase_start[1]})
+
+  def abandon(self):
+    """Stop all attempts of the search."""
+    traced("cancel attempts", cancel, self.running)
+    self.pool.discard_queued(lambda tag: tag[0][0][0] == self.generation)
+
+  def handle(self, data):
+    """
+    Process a message about an attempt of this search (see next_message).  Returns the
+    common.MimicResult once a model is found (and None before), and raises SearchFailed if
+    mimic-core keeps failing.
+    """
+    if data[0] == 2:
+      self.running[data[1]] = data[2]
+      return None
+    if data[0] == 3:
+      id = data[1]
+      if id not in self.running or id not in self.attempts:
+        return None
+      self.progress[id] = data[2]
+      if self.racing is None:
+        return None
+      # the scores of different configurations are not comparable
+      reason = self.racing.update(id, self.attempts[id][1], data[2], self.configs.get(id))
+      if reason is not None:
+        if not self.silent:
+          print colors.grey("Stopping attempt with seed %d early: %s" % (self.attempts[id][0], reason))
+        cancel({id: self.running.pop(id)})
+      return None
+    if data[0] == 0 and data[2] == "done":
+      self.running.pop(data[1], None)
+      self.outstanding -= 1
+      return None
+    if data[0] == 1:
+      return self.finish_attempt(data[1], data[2])
+    print data
+    print "unexpected message format"
+    assert False
+
+  def finish_attempt(self, id, core_result):
+    seed, timeout = self.attempts.pop(id)
+    if core_result.cpu_time is not None:
+      self.total_cpu += core_result.cpu_time
+      self.max_rss = max(self.max_rss, core_result.max_rss)
+    if tracer is not None:
+      trace_attempt(id, seed, timeout, core_result)
+    if self.racing is not None:
+      self.racing.finish(id)
+    last = self.progress.pop(id, None)
+    if self.templates is not None:
+      self.templates.record(self.arms.pop(id), core_result.success, last['best'] if last is not None else None)
+    config = self.configs.pop(id, None)
+    if config is not None:
+      self.configurations.record(config, core_result.success)
+    self.submitted.pop(id)
+    self.records.append(attempt_record(seed, timeout, core_result, last, config))
+    if core_result.success:
+      return self.found(id, seed, timeout, core_result, config)
+    if is_stopped(core_result):
+      self.record_seed(id, seed, timeout, config, "stopped", core_result)
+      return None
+    if not core_result.timeout:
+      self.total_crashes += 1
+    if core_result.status == 2:
+      # definitely a user error
+      cancel(self.running)
+      raise SearchFailed("Error in mimic-core:", core_result.output)
+    self.record_seed(id, seed, timeout, config, "timeout" if core_result.timeout else "crash", core_result)
+    if core_result.checkpoint is not None:
+      checkpoints = self.checkpoints.setdefault(config, [])
+      checkpoints.append(core_result.checkpoint)
+      checkpoints.sort(key=lambda c: c[0])
+      del checkpoints[self.threads:]
+    if not core_result.timeout:
+      self.error_count += 1
+      if self.total_attempts > 5 and float(self.error_count) / float(self.total_attempts) >= 0.5:
+        cancel(self.running)
+        raise SearchFailed("Found too many errors recently.  Output from mimic-core:", core_result.output)
+    return None
+
+  def get_seeds(self, config):
+    """The seed ledger of the attempts with the given search configuration (None without a portfolio)."""
+    if config not in self.ledgers:
+      metric = self.metric
+      options = dict(self.core_options) if self.core_options is not None else {}
+      if config is not None:
+        options.update(self.configurations.get_options(config))
+        metric = options.pop('metric', metric)
+      self.ledgers[config] = ledger.get_ledger(self.f, metric, core_args, options) if self.use_ledger else ledger.SeedLedger()
+    return self.ledgers[config]
+
+  def record_seed(self, id, seed, timeout, config, outcome, core_result):
+    """Record the outcome of an attempt in the ledger, unless it continued from a program."""
+    if id in self.replayable:
+      self.get_seeds(config).record(seed, timeout, outcome, core_result.iterations, attempt_time(core_result),
+                                    self.replayable.pop(id))
+
+  def found(self, id, seed, timeout, core_result, config):
+    """A model was found by the given attempt: stop all others, and return the common.MimicResult."""
+    self.record_seed(id, seed, timeout, config, "success", core_result)
+    # kill all other tasks
+    self.running.pop(id, None)
+    self.abandon()
+    for other in self.attempts:
+      if other in self.configs:
+        # lost the race
+        self.configurations.record(self.configs[other], False)
+      other_config = self.configs.get(other)
+      self.records.append({'seed': self.attempts[other][0], 'timeout': self.attempts[other][1], 'outcome': "cancelled",
+                           'wall': time.time() - self.submitted[other], 'core': None, 'iterations': None, 'loop_index': None,
+                           'metric': self.configurations.get_options(other_config).get('metric', self.metric) if other_config is not None else self.metric,
+                           'configuration': other_config})
+    self.end_phase()
+    if self.templates is not None and not self.silent:
+      print colors.grey("Found a model using the %s template" % (bandit.template_name(template_of(core_result))))
+      print colors.grey("Loop templates tried: %s" % self.templates.summary())
+    if self.configurations is not None and not self.silent:
+      print colors.grey("Found a model using the '%s' configuration" % config)
+      print colors.grey("Configurations tried: %s" % self.configurations.summary())
+    if self.lib is not None and core_result.program is not None and os.path.exists(core_result.program):
+      self.lib.add(self.f, core_result.program, core_result.loop_index)
+    code = traced("read model", read_file, core_result.code)
+    return common.MimicResult(self.f, core_result.metric, time.time() - self.start, core_result.iterations, core_result.core_time,
+                              self.total_attempts, self.total_crashes, core_result.loop_index, core_result.code, code, self.threads,
+                              self.total_cpu, self.max_rss, self.records, config, self.precompute_time, str(self.policy))
+
+def read_file(fn):
+  with open(fn) as fl:
+    return "".join(fl.readlines())
+
+def attempt_record(seed, timeout, core_result, last, configuration=None):
+  """
+  The record of a finished attempt for common.MimicResult: its seed, timeout, outcome ('success',
+  'timeout', 'stopped', 'crash' or 'cancelled'), wall and cpu time (in seconds), iterations, loop
+  index (-1 for loop-free, or None if not known), metric and search configuration (see
+  portfolio.py, or None without a portfolio).  last is its last progress report.
+  """
+  if core_result.success:
+    outcome = "success"
+    loop_index = core_result.loop_index
+  else:
+    outcome = "stopped" if is_stopped(core_result) else ("timeout" if core_result.timeout else "crash")
+    loop_index = last['loop_index'] if last is not None else None
+  return {
+    'seed': seed,
+    'timeout': timeout,
+    'outcome': outcome,
+    'wall': attempt_time(core_result),
+    'core': core_result.cpu_time,
+    'iterations': core_result.iterations,
+    'loop_index': loop_index,
+    'metric': core_result.metric,
+    'configuration': configuration,
+  }
+
+def attempt_time(core_result):
+  """How long an attempt ran (in seconds)."""
+  return core_result.timing['end'] - core_result.timing['start']
+
+def template_of(core_result):
+  """The --loop value corresponding to the template reported by a successful attempt."""
+  if core_result.loop_index < 0:
+    return bandit.LOOP_FREE
+  return core_result.loop_index - 1
+
+def start_attempt(pool, task):
+  """Hand an attempt to the pool of workers (see run_mimic_core for the format of task)."""
+  timeout, log = task[2], task[7]
+  pool.submit((task, {'start': time.time()}), make_job(task), timeout, log)
+
+def next_message(pool, timeout=None):
+  """
+  Wait for the next message about the attempts in the pool (at most timeout seconds, if given),
+  and return it (or None).  Messages are tuples (kind, id, data):
+    (2, id, pid)       the attempt started on the mimic-core worker with the given pid
+    (3, id, progress)  a progress report of the attempt
+    (1, id, result)    the attempt finished with the given CoreResult
+    (0, id, "done")    the worker of the attempt is available again
+  """
+  while len(messages) == 0:
+    events = pool.poll(timeout)
+    if len(events) == 0:
+      return None
+    for (task, timing), kind, data in events:
+      id = task[0]
+      if kind == "started":
+        index, pid, fresh = data
+        timing['worker'] = index + 1
+        timing['spawned'] = time.time() if fresh else None
+        timing['first_progress'] = None
+        messages.append((2, id, pid))
+      elif kind == "progress":
+        if timing['first_progress'] is None:
+          timing['first_progress'] = time.time()
+        messages.append((3, id, data))
       else:
-        print data
-        print "unexpected message format"
-        assert False
-    if total_attempts > 5 and float(error_count) / float(total_attempts) >= 0.5:
-      print colors.red("Found too many errors recently.  Output from mimic-core:")
-      print error_out
-      sys.exit(1)
-    if not success:
-      pool.close()
-      pool.join()
-    rep += 1
-
-def send_result(id, result):
-  q.put((1, id, result))
-
-def send_done(id):
-  q.put((0, id, "done"))
-
-def run_mimic_core(data, debug=False, filename=None):
-  id, f, timeout, metric, cleanup = data
-  fn = "%s/result-%d.js" % (out, id)
-  if filename is not None:
-    fn = filename
-  t = time.time()
-  col = "--colors 0"
-  if debug:
-    col = "--verbose"
-  command = '%s %s --metric %d --cleanup %d --out "%s" %s' % (base_command, col, metric, cleanup, fn, f.get_command_args())
-  if debug:
-    print colors.grey("Command to run")
-    print command
-    print colors.grey("Handing control to a single instance of mimic-core, which may or may not succeed")
-    print colors.grey(line)
-    sys.exit(os.system(command))
-  exitstatus, output = common.execute(command, timeout)
-  elapsed_time = time.time() - t
+        timing['end'] = time.time()
+        res = make_result(task, data)
+        timing['sent'] = time.time()
+        res.timing = timing
+        messages.append((1, id, res))
+        messages.append((0, id, "done"))
+  return messages.popleft()
+
+def get_bundle(f, silent=True):
+  """
+  Return a file with the inputs and loop proposals for f (see 'mimic-core precompute'), so that
+  they are only computed once rather than by every attempt.  Bundles are cached by content, and
+  None is returned if the precomputation fails (in which case every attempt does it itself).
+  """
+  key = common.hash_key(f.argnames, f.code, f.arguments, common.get_core_build())
+  fn = common.get_data_dir("bundles") + "/" + key + ".json"
+  if os.path.exists(fn):
+    return fn
+  if not silent:
+    print colors.grey("Precomputing inputs and loop proposals...")
+  tmp = "%s.%d.tmp" % (fn, os.getpid())
+  status, output = common.execute('%s precompute --colors 0 --out "%s" %s' % (core, tmp, f.get_command_args()), 600)
+  if status != 0:
+    if not silent:
+      print colors.grey("Precomputation failed, every attempt will compute this information itself")
+    if os.path.exists(tmp):
+      os.remove(tmp)
+    return None
+  os.rename(tmp, fn)
+  return fn
+
+def get_loop_count(bundle):
+  """The number of loop proposals in a bundle (see get_bundle)."""
+  try:
+    with open(bundle) as fl:
+      return len(json.load(fl)['loops'])
+  except (IOError, ValueError, KeyError):
+    return 0
+
+def run_mimic_core(data):
+  """
+  Run a single attempt of mimic-core in the foreground (for debugging).  data is a tuple (id, f,
+  timeout, metric, cleanup, fn, opts, log), where fn is the file for the model, opts are further
+  options for mimic-core (such as the seed), and log is the file for the output of mimic-core
+  (or None).
+  """
+  id, f, timeout, metric, cleanup, fn, opts, log = data
+  command = '%s --verbose --metric %d --cleanup %d --out "%s" %s' % (base_command, metric, cleanup, fn, f.get_command_args())
+  for k in sorted(opts.keys()):
+    command += ' --%s "%s"' % (k, opts[k])
+  print colors.grey("Command to run")
+  print command
+  print colors.grey("Handing control to a single instance of mimic-core, which may or may not succeed")
+  print colors.grey(line)
+  sys.exit(os.system(command))
+
+def make_job(data):
+  """The job for a mimic-core worker corresponding to an attempt (see run_mimic_core)."""
+  id, f, timeout, metric, cleanup, fn, opts, log = data
+  job = {
+    'argnames': f.argnames,
+    'function': f.code,
+    'arguments': f.arguments,
+    'metric': metric,
+    'cleanup': cleanup,
+    'timeout': timeout,
+    'out': fn,
+  }
+  if f.loop is not None:
+    job['loop'] = f.loop
+  job.update(opts)
+  return job
+
+def make_result(data, done):
+  """
+  The CoreResult of an attempt (see run_mimic_core), given what the worker reported when it was
+  done (see coreworker.WorkerPool.poll).
+  """
+  id, f, timeout, metric, cleanup, fn, opts, log = data
+  exitstatus, output, msg, usage = done
   if exitstatus == 0:
-    iters = int([m.group(1) for m in re.finditer('Found in ([0-9]+) iterations', output)][-1])
-    core_time = float([m.group(1) for m in re.finditer('and ([0-9.]+) seconds', output)][-1])
-    loop_index = -1
-    if "loop-free" not in output:
-      loop_index = int(re.search('using the loop template with index: ([0-9]+)', output).group(1))
-    # res = "%s: success after %.2f seconds and %d iterations [%.1f iterations/second]" % (f.shortname, elapsed_time, iters, float(iters)/elapsed_time)
-    res = CoreSuccess(output, metric, fn, iters, core_time, loop_index)
+    res = CoreSuccess(output, metric, fn, msg['iterations'], msg['time'], msg['loop_index'])
+    res.program = opts.get('program')
   else:
-    res = CoreFailure(output, metric, exitstatus)
-  send_result(id, res)
-  send_done(id)
+    res = CoreFailure(output, metric, exitstatus, msg['iterations'] if msg is not None and 'iterations' in msg else 0)
+    # the programs of the category phases are only scored on a subset of the inputs, so they cannot
+    # be compared to (or continued as) programs for all inputs
+    if msg is not None and 'checkpoint' in msg and msg['checkpoint']['phase'] in ["main", "cleanup"]:
+      c = msg['checkpoint']
+      # a search in the cleanup phase has already found a correct program
+      res.checkpoint = (0 if c['phase'] == "cleanup" else c['score'], opts['checkpoint'], c['loop'])
+  if usage is not None:
+    res.cpu_time, res.max_rss = usage
+  return res
 
 class CoreResult(object):
   def __init__(self, output, success, metric):
     self.output = output
     self.success = success
     self.metric = metric
+    self.timing = None # when the attempt started, finished, etc. (see run_mimic_core)
+    self.cpu_time = None # cpu time of mimic-core in seconds (if known)
+    self.max_rss = None # peak resident set size of mimic-core in kilobytes (if known)
 
 class CoreSuccess(CoreResult):
   def __init__(self, output, metric, code, iterations, core_time, loop_index):
@@ -236,14 +885,17 @@ class CoreSuccess(CoreResult):
     self.iterations = iterations
     self.core_time = core_time
     self.loop_index = loop_index
+    self.program = None # the model in the format of mimic-core checkpoints (if requested)
 
   def __repr__(self):
     return "Success()"
 
 class CoreFailure(CoreResult):
-  def __init__(self, output, metric, status):
+  def __init__(self, output, metric, status, iterations=0):
     self.status = status
     self.timeout = status == 124
+    self.iterations = iterations
+    self.checkpoint = None # (score, file, loop) of the best program, if the attempt timed out
     CoreResult.__init__(self, output, False, metric)
 
   def __repr__(self):
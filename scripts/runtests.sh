@@ -1,3 +1,9 @@
 #!/bin/bash
 
 mocha --harmony-proxies --timeout 100000 bin/test/Test.js #--reporter progress
+status=$?
+
+# the unit tests of the python scripts
+(cd scripts && python -m unittest discover -s test -t .) || status=1
+
+exit $status
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Measure how the time to find a model scales with the number of threads
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import os
+import math
+import random
+import argparse
+import status
+import run
+import experiment
+import jobs
+import topology
+
+line = "-" * 80
+argv = None # the arguments
+
+# ------------------------------------------
+# main entry point
+# ------------------------------------------
+
+def main():
+  parser = argparse.ArgumentParser(description='Run mimic for some functions at 1, 2, 4, ... threads, and report the speedup and efficiency.',
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('--tests', type=str, help='The functions to run',
+                      default=os.path.abspath(os.path.dirname(__file__) + "/../tests/array.json"))
+  parser.add_argument('--filter', type=str, help='Only run some of the functions', default="")
+  parser.add_argument('--exclude', type=str, help='Exclude some of the functions', default="")
+  parser.add_argument('-n', type=int, help='Number of repetitions for every number of threads', default=5)
+  parser.add_argument('--max-threads', metavar='<n>', type=run.threads_arg, help='The largest number of threads (auto = number of physical cores)', default="auto")
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='How to pin the workers to the physical cores (see mimic --help)', default="compact")
+  parser.add_argument('--metric', metavar="<m>", type=int, help='The metric to use (0 for default, 1 for naive metric)', default=0)
+
+  global argv
+  argv = parser.parse_args()
+
+  fncs = experiment.parse_file(argv.tests, argv.filter, argv.exclude)
+  if len(fncs) == 0:
+    print "ERROR, no functions to run"
+    sys.exit(1)
+  counts = thread_counts(argv.max_threads)
+  run.placement = argv.placement
+  print "Running %d function(s) at %s threads, %d times each" % (len(fncs), ", ".join([str(t) for t in counts]), argv.n)
+  print line
+
+  # the order of the runs is shuffled, so that slow drifts of the machine (e.g., its temperature)
+  # don't favor some of the thread counts
+  tasks = [(f, t) for f in fncs for t in counts for i in range(argv.n)]
+  random.shuffle(tasks)
+  times = dict([((f.title, t), []) for f in fncs for t in counts])
+  cpu = dict([((f.title, t), []) for f in fncs for t in counts])
+  stat = status.get_status()
+  stat.set_message("Running mimic...")
+  stat.init_progress(len(tasks))
+  for f, t in tasks:
+    res = run.mimic(f, argv.metric, t, **jobs.independent())
+    times[(f.title, t)].append(res.total_time)
+    if res.cpu_time is not None:
+      cpu[(f.title, t)].append(res.cpu_time)
+    stat.inc_progress(force_update=True)
+  stat.end_progress()
+  run.shutdown_pool()
+
+  speedups = dict([(t, []) for t in counts])
+  for f in fncs:
+    print "%s:" % f.title
+    print "  threads     time    cpu time   speedup   efficiency"
+    base = mean(times[(f.title, 1)])
+    for t in counts:
+      tm = mean(times[(f.title, t)])
+      speedup = base / tm
+      speedups[t].append(speedup)
+      c = cpu[(f.title, t)]
+      print "  %7d  %7.2fs  %9s  %7.2fx  %10.0f%%" % (t, tm, "%.2fs" % mean(c) if len(c) > 0 else "-", speedup, 100.0 * speedup / t)
+  if len(fncs) > 1:
+    print "All functions (geometric mean):"
+    print "  threads   speedup   efficiency"
+    for t in counts:
+      speedup = math.exp(mean([math.log(s) for s in speedups[t]]))
+      print "  %7d  %7.2fx  %10.0f%%" % (t, speedup, 100.0 * speedup / t)
+
+def thread_counts(n):
+  """1, 2, 4, ... up to n (and n itself)."""
+  res = []
+  t = 1
+  while t < n:
+    res.append(t)
+    t *= 2
+  res.append(max(1, n))
+  return res
+
+def mean(l):
+  return sum(l) / float(len(l))
+
+if __name__ == '__main__':
+  main()
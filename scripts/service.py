@@ -0,0 +1,280 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Long-running mimic service: a queue of synthesis jobs that share warm workers
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import heapq
+import shlex
+import argparse
+import threading
+import traceback
+import SocketServer
+import common
+import run
+import jobs
+import client
+import topology
+
+line = "-" * 80
+argv = None # the arguments
+
+# states of a job that will not change anymore
+FINAL = ["done", "failed", "cancelled"]
+
+# ------------------------------------------
+# main entry point
+# ------------------------------------------
+
+def main():
+  parser = argparse.ArgumentParser(description='Run mimic as a service that synthesizes models for jobs submitted by the mimic command (or stop it, or show its status).',
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('command', type=str, choices=["start", "stop", "status"], nargs='?', default="start",
+                      help='What to do')
+  parser.add_argument('--socket', metavar='<path>', type=str, help='The Unix socket to listen on',
+                      default=client.get_socket_path())
+  parser.add_argument('--cores', metavar='<n>', type=int, help='Number of cores that all jobs together may use',
+                      default=jobs.get_cores())
+  parser.add_argument('-j', '--jobs', metavar='<n>', type=int, help='Number of jobs to run at the same time', default=1)
+  parser.add_argument('-t', '--threads', metavar='<n>', type=int,
+                      help='Number of threads per job (-1 = split the cores evenly among the jobs)', default=-1)
+  parser.add_argument('--args', metavar='<args>', type=str, help='Arguments to be passed to mimic-core (jobs have to use the same)',
+                      default="")
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='How to pin the workers of every job to physical cores of their own (see mimic --help)', default="none")
+
+  global argv
+  argv = parser.parse_args()
+
+  c = client.connect(argv.socket)
+  if argv.command == "stop":
+    if c is None:
+      print "The mimic service is not running"
+      sys.exit(1)
+    c.shutdown()
+    print "Stopped the mimic service"
+    return
+  if argv.command == "status":
+    if c is None:
+      print "The mimic service is not running"
+      sys.exit(1)
+    for s in c.status()['jobs']:
+      print "%4d  %-10s  priority %3d  %s" % (s['id'], s['state'], s['priority'], s['title'])
+    return
+  if c is not None:
+    print "The mimic service is already running (at %s)" % argv.socket
+    sys.exit(1)
+  if os.path.exists(argv.socket):
+    # left behind by a service that did not shut down cleanly
+    os.remove(argv.socket)
+
+  if argv.args != "":
+    run.core_args = shlex.split(argv.args)
+  threads = jobs.split_cores(argv.cores, argv.jobs, argv.threads)
+  service = Service(jobs.JobRunner(argv.jobs, threads, argv.placement))
+  server = Server(argv.socket, RequestHandler)
+  server.service = service
+  print "mimic service listening on %s" % argv.socket
+  print "  %d concurrent jobs with %d threads each" % (argv.jobs, threads)
+  print line
+  t = threading.Thread(target=service.dispatch_loop)
+  t.daemon = True
+  t.start()
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    service.close()
+    os.remove(argv.socket)
+
+class Job(object):
+  def __init__(self, id, f, metric, options, priority):
+    """
+    :type f: common.Function
+    """
+    self.id = id
+    self.f = f
+    self.metric = metric
+    self.options = options
+    self.priority = priority
+    self.state = "queued"
+    self.submitted = time.time()
+    self.started = None
+    self.finished = None
+    self.result = None
+
+  def get_status(self):
+    s = {
+      'id': self.id,
+      'title': self.f.title,
+      'state': self.state,
+      'priority': self.priority,
+      'waiting': (self.started if self.started is not None else time.time()) - self.submitted,
+    }
+    if self.started is not None:
+      s['running'] = (self.finished if self.finished is not None else time.time()) - self.started
+    if self.result is not None:
+      s['result'] = client.from_result(self.result)
+    return s
+
+class Service(object):
+  """
+  The jobs submitted to the service.  Jobs are run in the order of their priority (highest
+  first, and in the order they were submitted among equal priorities) by a fixed number of
+  processes, so that all jobs together never use more than the given cores.
+  """
+  def __init__(self, runner):
+    """
+    :type runner: jobs.JobRunner
+    """
+    self.runner = runner
+    self.lock = threading.Condition()
+    self.jobs = {} # id -> Job
+    self.queue = [] # heap of (-priority, id) of the queued jobs
+    self.next_id = 0
+    self.stopping = False
+
+  def submit(self, f, metric, options, priority):
+    with self.lock:
+      id = self.next_id
+      self.next_id += 1
+      self.jobs[id] = Job(id, f, metric, options, priority)
+      heapq.heappush(self.queue, (-priority, id))
+      self.lock.notify_all()
+      return id
+
+  def get(self, id):
+    if id not in self.jobs:
+      raise client.ServiceError("no job with id %s" % id)
+    return self.jobs[id]
+
+  def status(self, id):
+    with self.lock:
+      if id is None:
+        return {'jobs': [self.jobs[k].get_status() for k in sorted(self.jobs.keys())]}
+      return self.get(id).get_status()
+
+  def wait(self, id):
+    with self.lock:
+      job = self.get(id)
+      while job.state not in FINAL:
+        if self.stopping:
+          raise client.ServiceError("the service is stopping")
+        # wake up regularly, so that the thread notices if the service is stopped
+        self.lock.wait(1)
+      return job.get_status()
+
+  def cancel(self, id):
+    with self.lock:
+      job = self.get(id)
+      if job.state == "queued":
+        self.queue.remove((-job.priority, id))
+        heapq.heapify(self.queue)
+        self.finish(job, "cancelled")
+      elif job.state == "running":
+        # the runner stops the job (or skips it, if it did not start yet), and reports it as failed
+        job.state = "cancelling"
+        self.runner.cancel(id)
+      return job.get_status()
+
+  def finish(self, job, state, result=None):
+    job.state = state
+    job.result = result
+    job.finished = time.time()
+    self.lock.notify_all()
+
+  def dispatch_loop(self):
+    """Hand queued jobs to the runner whenever one of its processes is free, and collect the results."""
+    while not self.stopping:
+      with self.lock:
+        while len(self.queue) > 0 and self.runner.pending() < self.runner.jobs:
+          _, id = heapq.heappop(self.queue)
+          job = self.jobs[id]
+          job.state = "running"
+          job.started = time.time()
+          kwargs = run.mimic_kwargs(job.options)
+          self.runner.submit(id, job.f, metric=job.metric, **kwargs)
+        if self.runner.pending() == 0:
+          self.lock.wait(1)
+          continue
+      res = self.runner.next_result(1)
+      if res is None:
+        continue
+      id, result = res
+      with self.lock:
+        job = self.jobs[id]
+        if job.state == "cancelling":
+          self.finish(job, "cancelled")
+        elif result is None:
+          self.finish(job, "failed")
+        else:
+          self.finish(job, "done", result)
+
+  def close(self):
+    with self.lock:
+      self.stopping = True
+      for id in self.runner.running():
+        self.runner.cancel(id)
+      self.lock.notify_all()
+    self.runner.close()
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+  daemon_threads = True
+  service = None
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+  """Handles the requests of one client (one JSON object per line, see client.Client)."""
+  def handle(self):
+    service = self.server.service
+    while True:
+      l = self.rfile.readline()
+      if l == "":
+        break
+      try:
+        msg = json.loads(l)
+        res = self.process(service, msg)
+        res['ok'] = True
+      except client.ServiceError as ex:
+        res = {'ok': False, 'error': str(ex)}
+      except Exception as ex:
+        traceback.print_exc()
+        res = {'ok': False, 'error': "internal error: %s" % ex}
+      self.wfile.write(json.dumps(res) + "\n")
+      self.wfile.flush()
+      if res['ok'] and msg['cmd'] == "shutdown":
+        threading.Thread(target=self.server.shutdown).start()
+        break
+
+  def process(self, service, msg):
+    cmd = msg.get('cmd')
+    if cmd == "submit":
+      if msg.get('args', []) != run.core_args:
+        raise client.ServiceError("the service passes different arguments to mimic-core: '%s'" % " ".join(run.core_args))
+      f = common.Function({
+        'name': msg.get('name', 'anon'),
+        'function': [msg['function']],
+        'argnames': msg['argnames'],
+        'arguments': msg['arguments'],
+        'loop': msg.get('loop'),
+      }, "-")
+      return {'id': service.submit(f, msg.get('metric', 0), msg.get('options', {}), msg.get('priority', 0))}
+    if cmd == "status":
+      return service.status(msg.get('id'))
+    if cmd == "wait":
+      return service.wait(msg['id'])
+    if cmd == "cancel":
+      return service.cancel(msg['id'])
+    if cmd == "shutdown":
+      return {}
+    raise client.ServiceError("unknown command '%s'" % cmd)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# A stand-in for the worker of mimic-core in the tests, which runs jobs of the form
+#   {"lines": <lines of output>, "progress": <progress reports>, "sleep": <seconds>,
+#    "child": <start a child process>, "exit": <crash instead of reporting a result>}
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import json
+import time
+import subprocess
+
+for l in iter(sys.stdin.readline, ""):
+  job = json.loads(l)
+  if job.get('child', False):
+    p = subprocess.Popen(["sleep", "60"])
+    print "child %d" % p.pid
+  for i in range(job.get('lines', 0)):
+    print "line %d" % i
+  for i in range(job.get('progress', 0)):
+    print "@mimic " + json.dumps({'type': "progress", 'best': i})
+  sys.stdout.flush()
+  time.sleep(job.get('sleep', 0))
+  if job.get('exit', False):
+    sys.exit(3)
+  print "@mimic " + json.dumps({'type': "result", 'status': 0})
+  sys.stdout.flush()
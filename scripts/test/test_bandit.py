@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for spreading the loop templates over the attempts
+#
+# ------------------------------------------------------------------------------
+
+import unittest
+import bandit
+
+class LoopBanditTest(unittest.TestCase):
+  def test_arms(self):
+    self.assertEqual(bandit.LoopBandit(3).arms, [0, 1, 2, bandit.LOOP_FREE])
+    self.assertEqual(bandit.LoopBandit(10, 2).arms, [0, 1, bandit.LOOP_FREE])
+    self.assertEqual(bandit.LoopBandit(0).arms, [bandit.LOOP_FREE])
+
+  def test_untried_first(self):
+    b = bandit.LoopBandit(3)
+    self.assertEqual([b.next_arm() for i in range(4)], [0, 1, 2, bandit.LOOP_FREE])
+
+  def test_best(self):
+    b = bandit.LoopBandit(2)
+    for a in [b.next_arm() for i in range(3)]:
+      b.record(a, a == 1, 10)
+    # the template that succeeded gets the next attempt
+    self.assertEqual(b.next_arm(), 1)
+
+  def test_rewards(self):
+    b = bandit.LoopBandit(2)
+    b.record(0, True)
+    b.record(1, False, 0)
+    b.record(1, False, 3)
+    b.record(bandit.LOOP_FREE, False)
+    self.assertEqual(b.rewards, {0: 1.0, 1: 0.5 + 0.125, bandit.LOOP_FREE: 0.0})
+    self.assertEqual(b.successes[0], 1)
+
+  def test_pull(self):
+    b = bandit.LoopBandit(2)
+    # attempts that continue from a checkpoint count for the template they used
+    b.pull(0)
+    self.assertEqual(b.next_arm(), 1)
+    # others (such as the templates of another function) are ignored
+    b.pull(None)
+    b.record(None, True)
+    self.assertEqual(b.total, 2)
+
+  def test_summary(self):
+    b = bandit.LoopBandit(2)
+    b.next_arm()
+    b.record(0, True)
+    self.assertEqual(b.summary(), "loop 1: 1 attempts (avg. reward 1.00)")
+
+if __name__ == '__main__':
+  unittest.main()
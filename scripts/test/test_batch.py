@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for sharing the cores among the functions of a batch
+#
+# ------------------------------------------------------------------------------
+
+import unittest
+import batch
+
+def job(expected, deadline=None):
+  j = batch.BatchJob(None, None, deadline)
+  j.expected = expected
+  return j
+
+class SplitTest(unittest.TestCase):
+  def test_proportional(self):
+    self.assertEqual(batch.split(8, [3, 1]), [6, 2])
+
+  def test_remainder(self):
+    # the cores that remain after rounding down go to the largest weight
+    self.assertEqual(batch.split(5, [1, 1, 1]), [3, 1, 1])
+    self.assertEqual(batch.split(6, [1, 4, 2]), [0, 5, 1])
+
+  def test_bounded(self):
+    for cores in range(10):
+      for weights in [[1], [1, 1, 1], [10, 1, 1, 1], [0.5, 100]]:
+        shares = batch.split(cores, weights)
+        self.assertEqual(sum(shares), cores)
+        self.assertTrue(min(shares) >= 0)
+
+  def test_no_weights(self):
+    self.assertEqual(batch.split(4, [0, 0]), [2, 2])
+    self.assertEqual(batch.split(4, []), [])
+
+class SchedulerTest(unittest.TestCase):
+  def test_order(self):
+    a, b, c = job(10), job(100), job(1, 50)
+    s = batch.Scheduler([a, b, c], 2, 0)
+    # deadlines first, then the longest expected time
+    self.assertEqual(s.assign(), [c, b])
+    self.assertEqual(s.waiting, [a])
+
+  def test_share(self):
+    a, b = job(30), job(10)
+    s = batch.Scheduler([a, b], 8, 0)
+    self.assertEqual(s.assign(), [a, b])
+    # every job gets a core, and the other 6 are split 4.5 : 1.5 (rounded down, and the remainder
+    # to the longest job)
+    self.assertEqual([a.threads, b.threads], [6, 2])
+    self.assertEqual(s.free, 0)
+    self.assertEqual(s.assign(), [])
+
+  def test_rebalance(self):
+    a, b, c = job(30), job(10), job(10)
+    s = batch.Scheduler([a, b, c], 4, 0)
+    s.assign()
+    self.assertEqual([a.threads, b.threads, c.threads], [2, 1, 1])
+    # the cores of a job that is done go to the jobs that still run
+    s.release(a)
+    self.assertEqual(s.assign(), [])
+    self.assertEqual([b.threads, c.threads], [2, 2])
+    self.assertEqual(b.threads + c.threads, 4)
+
+  def test_more_jobs_than_cores(self):
+    jobs = [job(t) for t in [5, 4, 3, 2]]
+    s = batch.Scheduler(jobs, 2, 0)
+    self.assertEqual(s.assign(), jobs[:2])
+    self.assertEqual([j.threads for j in jobs[:2]], [1, 1])
+    s.release(jobs[0])
+    self.assertEqual(s.assign(), [jobs[2]])
+    self.assertEqual([j.threads for j in jobs[1:3]], [1, 1])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for the cache of synthesized models
+#
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+import cache
+
+class ModelCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.home = os.environ.get("MIMIC_HOME")
+    self.dir = tempfile.mkdtemp()
+    os.environ["MIMIC_HOME"] = self.dir
+    self.cache = cache.ModelCache()
+
+  def tearDown(self):
+    if self.home is None:
+      del os.environ["MIMIC_HOME"]
+    else:
+      os.environ["MIMIC_HOME"] = self.home
+    shutil.rmtree(self.dir)
+
+  def age(self, key, t):
+    os.utime(self.cache.dir + "/" + key + ".pickle", (t, t))
+
+  def test_get(self):
+    self.assertIsNone(self.cache.get("a"))
+    self.cache.put("a", {'code': "function f() {}"})
+    self.assertEqual(self.cache.get("a"), {'code': "function f() {}"})
+
+  def test_corrupt(self):
+    with open(self.cache.dir + "/a.pickle", "w") as fl:
+      fl.write("not a pickle")
+    self.assertIsNone(self.cache.get("a"))
+    self.assertFalse(os.path.exists(self.cache.dir + "/a.pickle"))
+
+  def test_evict(self):
+    self.cache.max_size = 250
+    self.cache.put("a", "x" * 100)
+    self.cache.put("b", "x" * 100)
+    self.age("a", 1000)
+    self.age("b", 2000)
+    # reading a model makes it the most recently used one
+    self.cache.get("a")
+    self.cache.put("c", "x" * 100)
+    self.assertEqual(sorted(os.listdir(self.cache.dir)), ["a.pickle", "c.pickle"])
+
+  def test_evict_last(self):
+    self.cache.max_size = 50
+    # the model that was just added is kept, even if it alone is too large
+    self.cache.put("a", "x" * 100)
+    self.assertEqual(os.listdir(self.cache.dir), ["a.pickle"])
+
+if __name__ == '__main__':
+  unittest.main()
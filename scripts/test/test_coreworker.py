@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for the mimic-core workers (run with a stand-in for mimic-core, see fakeworker.py)
+#
+# ------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import gzip
+import time
+import select
+import shutil
+import tempfile
+import unittest
+import coreworker
+
+WORKER = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakeworker.py")]
+
+def run_job(w, job, timeout=10):
+  """Run a job on the worker w, and return what CoreWorker.handle reported."""
+  w.begin(job, timeout)
+  while True:
+    ready, _, _ = select.select([w.fileno()], [], [], 0.1)
+    res = w.handle(w.read() if len(ready) > 0 else [])
+    if res is not None:
+      return res
+
+def is_running(pid):
+  """Whether the process pid exists (and is not a zombie)."""
+  try:
+    with open("/proc/%d/stat" % pid) as fl:
+      return fl.read().rsplit(")", 1)[1].split()[0] != "Z"
+  except IOError:
+    return False
+
+class OutputTailTest(unittest.TestCase):
+  def test_short(self):
+    t = coreworker.OutputTail(3)
+    for l in ["a", "b"]:
+      t.append(l)
+    self.assertEqual(t.text(), "a\nb")
+
+  def test_bounded(self):
+    t = coreworker.OutputTail(2)
+    for i in range(5):
+      t.append("line %d" % i)
+    self.assertEqual(t.text(), "[... 3 lines omitted ...]\nline 3\nline 4")
+
+  def test_errors(self):
+    t = coreworker.OutputTail(2)
+    for l in ["a", "\x1b[31mError: first\x1b[0m", "b", "c", "Error: second", "d"]:
+      t.append(l)
+    # the errors before the tail are kept as well
+    self.assertEqual(t.text(), "[... 1 lines omitted ...]\n\x1b[31mError: first\x1b[0m\n[... 2 lines omitted ...]\nError: second\nd")
+
+  def test_long_line(self):
+    t = coreworker.OutputTail(2)
+    t.append("x" * (coreworker.max_line + 10))
+    self.assertEqual(t.text(), "x" * coreworker.max_line + "...")
+
+  def test_log(self):
+    dir = tempfile.mkdtemp()
+    try:
+      log = dir + "/attempt.log.gz"
+      t = coreworker.OutputTail(1, log)
+      for i in range(3):
+        t.append("line %d" % i)
+      t.close()
+      # the log has the complete output
+      self.assertEqual(gzip.open(log).read(), "line 0\nline 1\nline 2\n")
+    finally:
+      shutil.rmtree(dir)
+
+class CoreWorkerTest(unittest.TestCase):
+  def setUp(self):
+    self.grace = coreworker.GRACE
+    self.worker = coreworker.CoreWorker(WORKER)
+
+  def tearDown(self):
+    self.worker.stop()
+    coreworker.GRACE = self.grace
+
+  def test_warm(self):
+    status, output, msg = run_job(self.worker, {'lines': 2})
+    self.assertEqual((status, output, msg['status']), (0, "line 0\nline 1", 0))
+    pid = self.worker.pid()
+    # the worker stays alive for the next job
+    status, output, msg = run_job(self.worker, {'lines': 1})
+    self.assertEqual((status, output), (0, "line 0"))
+    self.assertEqual(self.worker.pid(), pid)
+
+  def test_progress(self):
+    reports = []
+    self.worker.begin({'progress': 2}, 10)
+    res = None
+    while res is None:
+      res = self.worker.handle(self.worker.read(), reports.append)
+    self.assertEqual([m['best'] for m in reports], [0, 1])
+
+  def test_crash(self):
+    status, output, msg = run_job(self.worker, {'lines': 1, 'exit': True})
+    self.assertEqual((status, output, msg), (3, "line 0", None))
+    # the next job gets a new worker
+    status, output, msg = run_job(self.worker, {})
+    self.assertEqual(status, 0)
+
+  def test_timeout(self):
+    coreworker.GRACE = 0
+    status, output, msg = run_job(self.worker, {'child': True, 'sleep': 60}, 0.5)
+    self.assertEqual((status, msg), (124, None))
+    self.assertFalse(self.worker.is_alive())
+    # the worker was killed together with the processes it started
+    child = int(re.match(r"child (\d+)", output).group(1))
+    end = time.time() + 5
+    while is_running(child) and time.time() < end:
+      time.sleep(0.05)
+    self.assertFalse(is_running(child))
+
+def poll_all(pool, jobs):
+  """Poll the pool until the given number of jobs is done, and return all events."""
+  events = []
+  while len([e for e in events if e[1] == "done"]) < jobs:
+    events += pool.poll(10)
+  return events
+
+class WorkerPoolTest(unittest.TestCase):
+  def tearDown(self):
+    self.pool.close()
+
+  def test_queued(self):
+    self.pool = coreworker.WorkerPool(WORKER, 1)
+    self.pool.submit("a", {'lines': 1}, 10)
+    self.pool.submit("b", {'lines': 2}, 10)
+    events = poll_all(self.pool, 2)
+    self.assertEqual([(tag, kind) for tag, kind, data in events], [("a", "started"), ("a", "done"), ("b", "started"), ("b", "done")])
+    # the second job runs on the warm worker
+    self.assertEqual(events[0][2][2], True)
+    self.assertEqual(events[2][2][:2], events[0][2][:2])
+    self.assertEqual(events[2][2][2], False)
+    self.assertEqual(events[3][2][:2], (0, "line 0\nline 1"))
+
+  def test_concurrent(self):
+    self.pool = coreworker.WorkerPool(WORKER, 2)
+    start = time.time()
+    self.pool.submit("a", {'sleep': 0.5, 'progress': 1}, 10)
+    self.pool.submit("b", {'sleep': 0.5}, 10)
+    events = poll_all(self.pool, 2)
+    # both jobs ran at the same time, on different workers
+    self.assertLess(time.time() - start, 1.5)
+    started = [data for tag, kind, data in events if kind == "started"]
+    self.assertEqual(sorted([data[0] for data in started]), [0, 1])
+    self.assertEqual([(tag, data['best']) for tag, kind, data in events if kind == "progress"], [("a", 0)])
+    self.assertEqual(sorted([tag for tag, kind, data in events if kind == "done"]), ["a", "b"])
+
+  def test_crash(self):
+    self.pool = coreworker.WorkerPool(WORKER, 1)
+    self.pool.submit("a", {'exit': True}, 10)
+    self.pool.submit("b", {}, 10)
+    events = poll_all(self.pool, 2)
+    done = dict([(tag, data) for tag, kind, data in events if kind == "done"])
+    self.assertEqual((done["a"][0], done["b"][0]), (3, 0))
+
+  def test_discard_queued(self):
+    self.pool = coreworker.WorkerPool(WORKER, 1)
+    for tag in ["a", "b", "c"]:
+      self.pool.submit(tag, {}, 10)
+    self.pool.discard_queued(lambda tag: tag == "b")
+    events = poll_all(self.pool, 2)
+    self.assertEqual([tag for tag, kind, data in events if kind == "done"], ["a", "c"])
+
+  def test_idle(self):
+    self.pool = coreworker.WorkerPool(WORKER, 1)
+    start = time.time()
+    self.assertEqual(self.pool.poll(0.2), [])
+    self.assertGreaterEqual(time.time() - start, 0.2)
+
+if __name__ == '__main__':
+  unittest.main()
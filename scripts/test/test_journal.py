@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for the journal of experiment results
+#
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+import journal
+
+class JournalTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.file = self.dir + "/" + journal.JOURNAL
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_read(self):
+    j = journal.Journal(self.file)
+    j.append({'task': 1})
+    j.append({'task': 2})
+    j.close()
+    self.assertEqual(list(journal.read(self.file)), [{'task': 1}, {'task': 2}])
+
+  def test_partial_record(self):
+    j = journal.Journal(self.file)
+    j.append({'task': 1})
+    j.close()
+    size = os.path.getsize(self.file)
+    j = journal.Journal(self.file)
+    j.append({'task': 2})
+    j.close()
+    # as if the experiment was killed while writing the second record
+    with open(self.file, "r+b") as fl:
+      fl.truncate(os.path.getsize(self.file) - 3)
+    self.assertEqual(list(journal.read(self.file)), [{'task': 1}])
+    # the partial record is dropped before new records are appended
+    j = journal.Journal(self.file)
+    self.assertEqual(os.path.getsize(self.file), size)
+    j.append({'task': 3})
+    j.close()
+    self.assertEqual(list(journal.read(self.file)), [{'task': 1}, {'task': 3}])
+
+  def test_partial_header(self):
+    j = journal.Journal(self.file)
+    j.append({'task': 1})
+    j.close()
+    with open(self.file, "ab") as fl:
+      fl.write("\0\0")
+    j = journal.Journal(self.file)
+    j.append({'task': 2})
+    j.close()
+    self.assertEqual(list(journal.read(self.file)), [{'task': 1}, {'task': 2}])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for the seed ledger
+#
+# ------------------------------------------------------------------------------
+
+import shutil
+import tempfile
+import unittest
+import ledger
+
+class Draws(object):
+  """Stands in for the random module, and draws the given seeds in order."""
+  def __init__(self, seeds):
+    self.seeds = list(seeds)
+
+  def randint(self, lo, hi):
+    return self.seeds.pop(0)
+
+class SeedLedgerTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.file = self.dir + "/ledger.json"
+    self.random = ledger.random
+
+  def tearDown(self):
+    ledger.random = self.random
+    shutil.rmtree(self.dir)
+
+  def draw(self, seeds):
+    ledger.random = Draws(seeds)
+
+  def test_unique(self):
+    l = ledger.SeedLedger()
+    self.draw([1, 1, 2, 1, 3])
+    self.assertEqual([l.next_seed(10) for i in range(3)], [1, 2, 3])
+
+  def test_successful_first(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(5, 10, "timeout", 100, 10)
+    l.record(7, 10, "success", 200, 3)
+    l.record(8, 10, "success", 100, 4)
+    l = ledger.SeedLedger(self.file)
+    self.draw([9])
+    # by the number of iterations they needed
+    self.assertEqual([l.next_seed(10) for i in range(3)], [8, 7, 9])
+
+  def test_failed(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(1, 10, "timeout", 100, 10)
+    l.record(2, 10, "stopped", 10, 4)
+    l.record(3, 10, "crash", 10, 1)
+    l = ledger.SeedLedger(self.file)
+    # a seed is only skipped for timeouts at which it is known to fail
+    self.draw([1, 2, 3, 4])
+    self.assertEqual(l.next_seed(4), 4)
+    l = ledger.SeedLedger(self.file)
+    self.draw([1, 2, 3, 4])
+    self.assertEqual(l.next_seed(10), 2)
+    l = ledger.SeedLedger(self.file)
+    self.draw([3, 1])
+    self.assertEqual(l.next_seed(20), 1)
+    # without a timeout, no seed that failed is handed out
+    l = ledger.SeedLedger(self.file)
+    self.draw([1, 2, 3, 4])
+    self.assertEqual(l.next_seed(), 4)
+
+  def test_longest_failure(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(1, 20, "timeout", 100, 20)
+    l.record(1, 10, "timeout", 100, 10)
+    self.draw([1, 2])
+    self.assertEqual(l.next_seed(15), 2)
+
+  def test_loop(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(1, 10, "success", 100, 3, 2)
+    l.record(2, 10, "timeout", 100, 10, 2)
+    l = ledger.SeedLedger(self.file)
+    # outcomes only carry over to attempts with the same loop template
+    self.draw([2, 3])
+    self.assertEqual(l.next_seed(10), 2)
+    self.draw([2, 3])
+    self.assertEqual(l.next_seed(10, 2), 1)
+    self.assertEqual(l.next_seed(10, 2), 3)
+
+  def test_no_reuse(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(1, 10, "success", 100, 3)
+    l = ledger.SeedLedger(self.file)
+    # seeds that succeeded are kept for the attempts that can reproduce them
+    self.draw([2])
+    self.assertEqual(l.next_seed(10, reuse=False), 2)
+    self.assertEqual(l.next_seed(10), 1)
+
+  def test_partial_line(self):
+    l = ledger.SeedLedger(self.file)
+    l.record(1, 10, "success", 100, 3)
+    with open(self.file, "a") as fl:
+      fl.write('{"seed": 2, "tim')
+    self.assertEqual(len(ledger.SeedLedger(self.file).entries), 1)
+
+  def test_expected_time(self):
+    l = ledger.SeedLedger(self.file)
+    self.assertEqual(l.expected_time(60), 60)
+    l.record(1, 10, "timeout", 100, 10)
+    l.record(2, 20, "success", 100, 5)
+    # the time of all attempts (10 + 20 seconds) per success, rather than the default
+    self.assertEqual(l.expected_time(60), 30.0)
+
+if __name__ == '__main__':
+  unittest.main()
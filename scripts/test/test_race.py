@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for racing the attempts of a search
+#
+# ------------------------------------------------------------------------------
+
+import unittest
+import race
+
+def report(elapsed, best, phase="main"):
+  return {'phase': phase, 'elapsed': elapsed, 'best': best}
+
+class RaceTest(unittest.TestCase):
+  def setUp(self):
+    # with a timeout of 90 seconds, the rungs are at 10 and 30 seconds
+    self.race = race.Race(3, 2, 0)
+
+  def test_halving(self):
+    self.assertIsNone(self.race.update(1, 90, report(10, 1)))
+    self.assertIsNone(self.race.update(2, 90, report(10, 2)))
+    # only the best third goes on to the next rung
+    self.assertEqual(self.race.update(3, 90, report(10, 5)), "score 5.00 at 11% of the timeout, 2 attempts did better")
+    self.assertIsNone(self.race.update(4, 90, report(10, 1.5)))
+    self.assertEqual(self.race.stopped, 1)
+
+  def test_before_rung(self):
+    for id in range(3):
+      self.assertIsNone(self.race.update(id, 90, report(5, id)))
+    self.assertEqual(self.race.scores, {})
+
+  def test_skipped_rungs(self):
+    # a report past both rungs counts for both
+    self.race.update(1, 90, report(40, 1))
+    self.assertEqual(self.race.scores, {(None, 0, "main"): [1], (None, 1, "main"): [1]})
+
+  def test_phases(self):
+    self.race.update(1, 90, report(10, 1))
+    self.race.update(2, 90, report(10, 2))
+    # the scores of another phase are not compared
+    self.assertIsNone(self.race.update(3, 90, report(10, 5, "post")))
+
+  def test_groups(self):
+    self.race.update(1, 90, report(10, 1), "a")
+    self.race.update(2, 90, report(10, 2), "a")
+    self.assertIsNone(self.race.update(3, 90, report(10, 5), "b"))
+    self.assertIsNotNone(self.race.update(4, 90, report(10, 5), "a"))
+
+  def test_cleanup(self):
+    self.race.update(1, 90, report(10, 1))
+    self.race.update(2, 90, report(10, 2))
+    self.race.update(3, 90, report(10, 3))
+    self.assertIsNone(self.race.update(4, 90, report(10, 5, "cleanup")))
+
+class StallTest(unittest.TestCase):
+  def setUp(self):
+    self.race = race.Race(3, 2, 0.5)
+
+  def test_stall(self):
+    self.assertIsNone(self.race.update(1, 10, report(1, 5)))
+    self.assertIsNone(self.race.update(1, 10, report(5, 5)))
+    self.assertEqual(self.race.update(1, 10, report(7, 5)), "no improvement over 5.00 for 6.0 seconds")
+
+  def test_improvement(self):
+    self.race.update(1, 10, report(1, 5))
+    self.assertIsNone(self.race.update(1, 10, report(5, 4)))
+    self.assertIsNone(self.race.update(1, 10, report(9, 4)))
+
+  def test_finish(self):
+    self.race.update(1, 10, report(1, 5))
+    self.race.finish(1)
+    # a new attempt with the same id starts over
+    self.assertIsNone(self.race.update(1, 10, report(7, 5)))
+
+if __name__ == '__main__':
+  unittest.main()
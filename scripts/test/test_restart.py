@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for the restart policies
+#
+# ------------------------------------------------------------------------------
+
+import unittest
+import restart
+
+def history(successes, failures, timeout):
+  """Ledger entries for attempts that succeeded after the given times, and ones that timed out."""
+  return [{'outcome': "success", 'time': t, 'timeout': timeout} for t in successes] + \
+         [{'outcome': "timeout", 'time': t, 'timeout': t} for t in failures]
+
+class LubyTest(unittest.TestCase):
+  def test_sequence(self):
+    self.assertEqual([restart.luby(i) for i in range(1, 16)], [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8])
+
+  def test_policy(self):
+    p = restart.get_policy("luby", 3, 1.1)
+    # every phase of two attempts gets the next element of the sequence
+    self.assertEqual([p.timeout(n, 2) for n in range(8)], [3, 3, 3, 3, 6, 6, 3, 3])
+
+class GeometricTest(unittest.TestCase):
+  def test_default(self):
+    p = restart.RestartPolicy(3, 1.5)
+    self.assertEqual(repr(p), "geometric")
+    self.assertEqual([p.timeout(n, 1) for n in range(4)], [3, 5, 7, 10])
+
+  def test_threads(self):
+    # the factor is scaled by the number of threads, and all attempts of a phase get the same timeout
+    p = restart.get_policy("geometric", 4, 1.5)
+    self.assertEqual([p.timeout(n, 2) for n in range(6)], [4, 4, 9, 9, 20, 20])
+
+class FixedTest(unittest.TestCase):
+  def test_policy(self):
+    p = restart.get_policy("fixed", 7, 1.5)
+    self.assertEqual(set([p.timeout(n, 4) for n in range(20)]), set([7]))
+
+class LearnedTest(unittest.TestCase):
+  def test_not_enough_history(self):
+    self.assertEqual(restart.learn_cutoff(history([5, 6], [10, 10], 10)), None)
+    self.assertEqual(repr(restart.get_policy("learned", 3, 1.5, history([5, 6], [10], 10))), "geometric")
+
+  def test_cutoff(self):
+    # stopping every attempt at 10 seconds solves 3 of 7 attempts for 70 seconds, which is
+    # better than letting them run to 500 seconds
+    h = history([10, 10, 10, 500], [600, 600, 600], 600)
+    self.assertEqual(restart.learn_cutoff(h), 11)
+    p = restart.get_policy("learned", 3, 1.5, h)
+    self.assertEqual(p.name, "learned")
+    self.assertEqual(p.timeout(5, 2), 11)
+
+  def test_censored(self):
+    # attempts that failed before a cutoff tell nothing about it
+    h = history([4, 4, 4], [2, 2, 2, 2, 2, 2], 10)
+    self.assertEqual(restart.learn_cutoff(h), 4)
+
+  def test_unknown(self):
+    self.assertRaises(ValueError, restart.get_policy, "unknown", 3, 1.5)
+
+if __name__ == '__main__':
+  unittest.main()
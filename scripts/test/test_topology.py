@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tests for placing workers on the cores of this machine
+#
+# ------------------------------------------------------------------------------
+
+import unittest
+import topology
+
+# two sockets with two cores each, with two hyperthreads per core
+CORES = [(0, 0, [0, 4]), (0, 1, [1, 5]), (1, 0, [2, 6]), (1, 1, [3, 7])]
+
+class ParseListTest(unittest.TestCase):
+  def test_ranges(self):
+    self.assertEqual(topology.parse_list("0-3,8-9\n"), [0, 1, 2, 3, 8, 9])
+
+  def test_single(self):
+    self.assertEqual(topology.parse_list("1,3"), [1, 3])
+    self.assertEqual(topology.parse_list(""), [])
+
+  def test_invalid(self):
+    self.assertRaises(ValueError, topology.parse_list, "a-b")
+
+class PlacementTest(unittest.TestCase):
+  def setUp(self):
+    self.physical_cores = topology.physical_cores
+    topology.physical_cores = lambda: CORES
+
+  def tearDown(self):
+    topology.physical_cores = self.physical_cores
+
+  def test_none(self):
+    self.assertIsNone(topology.placement(2, "none"))
+
+  def test_compact(self):
+    self.assertEqual(topology.placement(3, "compact"), [[0, 4], [1, 5], [2, 6]])
+
+  def test_spread(self):
+    self.assertEqual(topology.placement(3, "spread"), [[0, 4], [2, 6], [1, 5]])
+
+  def test_first(self):
+    # more workers than cores wrap around
+    self.assertEqual(topology.placement(3, "compact", 3), [[3, 7], [0, 4], [1, 5]])
+
+  def test_unknown(self):
+    self.assertRaises(ValueError, topology.placement, 1, "random")
+
+  def test_no_cores(self):
+    topology.physical_cores = lambda: []
+    self.assertIsNone(topology.placement(1, "compact"))
+
+  def test_machine(self):
+    # every CPU of this machine ends up in exactly one physical core
+    topology.physical_cores = self.physical_cores
+    cpus = [c for socket, core, cs in topology.physical_cores() for c in cs]
+    self.assertEqual(sorted(cpus), sorted(topology.allowed_cpus()))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# The CPU topology of this machine, and placing workers on its cores
+#
+# ------------------------------------------------------------------------------
+
+import multiprocessing
+
+SYSFS = "/sys/devices/system/cpu"
+
+# the orders in which the physical cores are handed to workers (see placement)
+ORDERS = ["none", "compact", "spread"]
+
+def parse_list(s):
+  """Parse a list of CPUs in the format of sysfs (such as '0-3,8-11')."""
+  res = []
+  for part in s.strip().split(","):
+    if part == "":
+      continue
+    if "-" in part:
+      lo, hi = part.split("-")
+      res += range(int(lo), int(hi) + 1)
+    else:
+      res.append(int(part))
+  return res
+
+def read(fn):
+  with open(fn) as fl:
+    return fl.read().strip()
+
+def allowed_cpus():
+  """The logical CPUs this process may run on (all online CPUs, unless restricted by its affinity)."""
+  try:
+    cpus = parse_list(read(SYSFS + "/online"))
+  except (IOError, ValueError):
+    cpus = range(multiprocessing.cpu_count())
+  try:
+    with open("/proc/self/status") as fl:
+      for l in fl:
+        if l.startswith("Cpus_allowed_list:"):
+          allowed = set(parse_list(l.split(":", 1)[1]))
+          cpus = [c for c in cpus if c in allowed]
+  except (IOError, ValueError):
+    pass
+  return cpus
+
+def physical_cores():
+  """
+  The physical cores available to this process, as a list of tuples (socket, core, logical
+  CPUs), sorted by socket and core.  If sysfs does not tell, every logical CPU counts as a
+  physical core.
+  """
+  cores = {}
+  for cpu in allowed_cpus():
+    d = "%s/cpu%d/topology" % (SYSFS, cpu)
+    try:
+      key = (int(read(d + "/physical_package_id")), int(read(d + "/core_id")))
+    except (IOError, ValueError):
+      key = (0, cpu)
+    cores.setdefault(key, []).append(cpu)
+  return [(socket, core, sorted(cpus)) for (socket, core), cpus in sorted(cores.items())]
+
+def ordered_cores(order):
+  """
+  The physical cores in the order in which they are handed out: 'compact' fills one socket
+  before moving on to the next, 'spread' alternates between the sockets.
+  """
+  cores = physical_cores()
+  if order == "compact":
+    return cores
+  if order == "spread":
+    sockets = []
+    for c in cores:
+      if len(sockets) == 0 or sockets[-1][0][0] != c[0]:
+        sockets.append([])
+      sockets[-1].append(c)
+    res = []
+    for i in range(max([len(s) for s in sockets])):
+      res += [s[i] for s in sockets if i < len(s)]
+    return res
+  raise ValueError("unknown order '%s' (expected one of %s)" % (order, ", ".join(ORDERS)))
+
+def placement(n, order, first=0):
+  """
+  The logical CPUs for each of n workers, such that every worker has a physical core (with all
+  its hyperthreads) to itself, as long as there are enough cores.  The cores are handed out in
+  the given order (see ordered_cores), starting with the first-th core.  Returns None for the
+  order 'none' (the workers are not pinned).
+  """
+  if order == "none":
+    return None
+  cores = ordered_cores(order)
+  if len(cores) == 0:
+    return None
+  return [cores[(first + i) % len(cores)][2] for i in range(n)]
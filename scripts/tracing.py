@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tracing where the time of a run of mimic goes (as Chrome trace events)
+#
+# ------------------------------------------------------------------------------
+
+import os
+import json
+import time
+
+class Tracer(object):
+  """
+  Collects spans (with absolute start and end times, as returned by time.time()) on a number
+  of tracks, and writes them in the Chrome trace event format (to be viewed with, e.g.,
+  chrome://tracing or Perfetto).  Every track is shown as a thread, named by its tid.
+  """
+  def __init__(self):
+    self.start = time.time()
+    self.events = []
+    self.tracks = {}
+    self.pid = os.getpid()
+
+  def track(self, tid, name):
+    """Name the track tid."""
+    if tid not in self.tracks:
+      self.tracks[tid] = name
+      self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+
+  def span(self, name, cat, begin, end, tid=0, args=None):
+    """Add a span from begin to end (both absolute times in seconds)."""
+    e = {
+      'name': name,
+      'cat': cat,
+      'ph': 'X',
+      'pid': self.pid,
+      'tid': tid,
+      'ts': self.us(begin),
+      'dur': max(0, int(round((end - begin) * 1e6))),
+    }
+    if args is not None:
+      e['args'] = args
+    self.events.append(e)
+
+  def instant(self, name, cat, t=None, tid=0, args=None):
+    e = {
+      'name': name,
+      'cat': cat,
+      'ph': 'i',
+      's': 't',
+      'pid': self.pid,
+      'tid': tid,
+      'ts': self.us(t if t is not None else time.time()),
+    }
+    if args is not None:
+      e['args'] = args
+    self.events.append(e)
+
+  def timed(self, name, cat, fn, *args, **kwargs):
+    """Call fn (with the given arguments) inside a span on the main track, and return its result."""
+    t = time.time()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      self.span(name, cat, t, time.time())
+
+  def us(self, t):
+    return int(round((t - self.start) * 1e6))
+
+  def total(self, cat, name=None):
+    """The total duration (in seconds) of all spans of a category (and name)."""
+    return sum([e['dur'] for e in self.events if e['ph'] == 'X' and e['cat'] == cat and
+                (name is None or e['name'] == name)]) / 1e6
+
+  def write(self, fn):
+    f = open(fn, 'w')
+    json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+    f.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# coding=utf-8
+
+# ------------------------------------------------------------------------------
+#
+# Tune the search parameters for this machine
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import os
+import math
+import random
+import argparse
+import common
+import status
+import jobs
+import run
+import experiment
+import hostprofile
+import topology
+
+line = "-" * 80
+argv = None # the arguments
+
+# the parameters that are tuned: (lowest value, highest value, sample on a log scale, digits to round to)
+SPACE = [
+  ('parallel_t0', (2, 32, True, 0)),
+  ('parallel_f', (1.0, 1.2, False, 3)),
+  ('beta', (5, 14, False, 1)),
+  ('gamma', (3, 9, False, 1)),
+]
+# the values without tuning (for mimic-core, see SearchConfig.DEFAULT in src/Search.ts)
+DEFAULTS = {
+  'parallel_t0': run.parallel_t0_default,
+  'parallel_f': run.parallel_f_default,
+  'beta': 9,
+  'gamma': 6,
+}
+
+# ------------------------------------------
+# main entry point
+# ------------------------------------------
+
+def main():
+  parser = argparse.ArgumentParser(description='Tune the search parameters (%s) for this machine, and write them to its profile, from which mimic takes its defaults.' % ", ".join([p for p, r in SPACE]),
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('--tests', type=str, help='The functions to tune on',
+                      default=os.path.abspath(os.path.dirname(__file__) + "/../tests/array.json"))
+  parser.add_argument('--filter', type=str, help='Only tune on some of the functions', default="")
+  parser.add_argument('--exclude', type=str, help='Exclude some of the functions', default="")
+  parser.add_argument('-n', '--configurations', metavar='<n>', type=int, help='Number of configurations to start with (including the defaults)', default=27)
+  parser.add_argument('--eta', metavar='<eta>', type=int, help='Only the best 1/eta of the configurations survive every round, and the survivors get eta times as many runs', default=3)
+  parser.add_argument('--runs', metavar='<n>', type=int, help='Number of runs per function for every configuration in the first round', default=1)
+  parser.add_argument('--cap', metavar='<seconds>', type=float, help='Stop runs that take longer than this, and count them as taking this long', default=600)
+  parser.add_argument('-j', '--jobs', type=int, help='Number of runs of mimic to do at the same time', default=1)
+  parser.add_argument('-t', '--threads', type=int, help='Number of threads per run of mimic (-1 = split the cores evenly among the jobs)', default=-1)
+  parser.add_argument('--cores', type=int, help='Number of cores that all jobs together may use', default=jobs.get_cores())
+  parser.add_argument('--placement', metavar="<order>", type=str, choices=topology.ORDERS,
+                      help='How to pin the workers of every job to physical cores of their own (see mimic --help)', default="none")
+  parser.add_argument('--dry-run', help='Don\'t write the profile', action='store_true')
+
+  global argv
+  argv = parser.parse_args()
+
+  fncs = experiment.parse_file(argv.tests, argv.filter, argv.exclude)
+  if len(fncs) == 0:
+    print "ERROR, no functions to tune on"
+    sys.exit(1)
+  threads = jobs.split_cores(argv.cores, argv.jobs, argv.threads)
+  if argv.jobs * threads > argv.cores:
+    print "ERROR, %d jobs with %d threads each do not fit into %d cores" % (argv.jobs, threads, argv.cores)
+    sys.exit(1)
+  configurations = [dict(DEFAULTS)] + [sample() for i in range(argv.configurations - 1)]
+  tuner = SuccessiveHalving(configurations, fncs, argv.runs, argv.eta, argv.cap)
+
+  print "Tuning %d configurations on %d function(s), with %d concurrent jobs of %d threads each" % (len(configurations), len(fncs), argv.jobs, threads)
+  print line
+  stat = status.get_status()
+  runner = jobs.JobRunner(argv.jobs, threads, argv.placement)
+  rnd = 0
+  while True:
+    runs = tuner.next_round()
+    if len(runs) == 0:
+      break
+    rnd += 1
+    stat.set_message("Round %d..." % rnd)
+    stat.init_progress(len(runs))
+    run_all(runner, runs, tuner, stat)
+    stat.end_progress()
+    print "Round %d (%d runs per function):" % (rnd, tuner.runs)
+    for c in sorted(tuner.alive, key=tuner.score):
+      print "  %8.2f seconds   %s" % (tuner.score(c), describe(configurations[c]))
+    tuner.finish_round()
+  runner.close()
+
+  best = tuner.alive[0]
+  print line
+  print "Best configuration: %s" % describe(configurations[best])
+  print "  mean time:        %.2f seconds (over %d runs per function)" % (tuner.score(best), tuner.runs)
+  if best != 0:
+    print "  defaults:         %.2f seconds (over %d runs per function, in round %d)" % (tuner.score(0), len(tuner.times[0][fncs[0].title]), tuner.eliminated[0])
+  if argv.dry_run:
+    return
+  profile = dict(configurations[best])
+  profile['threads'] = threads
+  profile['mean_time'] = tuner.score(best)
+  profile['functions'] = [f.title for f in fncs]
+  profile['tuned'] = common.get_time()
+  hostprofile.save(profile)
+  print "Wrote the profile '%s'" % hostprofile.get_file()
+
+def sample():
+  """A random configuration."""
+  c = {}
+  for p, (low, high, log, digits) in SPACE:
+    if log:
+      v = math.exp(random.uniform(math.log(low), math.log(high)))
+    else:
+      v = random.uniform(low, high)
+    c[p] = int(round(v)) if digits == 0 else round(v, digits)
+  return c
+
+def describe(c):
+  return ", ".join(["%s %s" % (p, c[p]) for p, r in SPACE])
+
+def run_all(runner, runs, tuner, stat):
+  """Do all runs (configuration, function), and stop the ones that take longer than the cap."""
+  lookup = {}
+  for key, (c, f) in enumerate(runs):
+    lookup[key] = (c, f)
+  keys = lookup.keys()
+  random.shuffle(keys)
+  for key in keys:
+    c, f = lookup[key]
+    opts = tuner.configurations[c]
+    runner.submit_independent(key, f, metric=0, parallel_t0=opts['parallel_t0'], parallel_f=opts['parallel_f'],
+                              core_options=dict([(p, opts[p]) for p in hostprofile.CORE_PARAMETERS]))
+  while runner.pending() > 0:
+    r = runner.next_result(1)
+    runner.cancel_overdue(tuner.cap)
+    if r is None:
+      continue
+    key, res = r
+    c, f = lookup[key]
+    stat.inc_progress(force_update=True)
+    if res is None:
+      stat.writeln("No model for %s within %d seconds (%s)" % (f.shortname, tuner.cap, describe(tuner.configurations[c])))
+    tuner.add(c, f, res.total_time if res is not None else tuner.cap)
+
+class SuccessiveHalving(object):
+  """
+  Successive halving: in every round, every configuration that is still alive gets runs
+  (configuration, function) until it has the given number of runs per function, and then only
+  the best 1/eta of the configurations (by their mean time) survive.  The number of runs per
+  function grows by a factor of eta from round to round, until a single configuration is left.
+  Runs that fail (or are stopped) count as taking cap seconds.
+  """
+  def __init__(self, configurations, fncs, runs, eta, cap):
+    self.configurations = configurations
+    self.fncs = fncs
+    self.runs = runs
+    self.eta = max(2, eta)
+    self.cap = cap
+    self.alive = range(len(configurations))
+    self.times = [dict([(f.title, []) for f in fncs]) for c in configurations]
+    self.rounds = 0
+    self.eliminated = {} # configuration -> the round in which it was eliminated
+
+  def next_round(self):
+    """The runs (configuration, function) of the next round (none once the tuning is done)."""
+    if len(self.alive) <= 1:
+      return []
+    if self.rounds > 0:
+      self.runs *= self.eta
+    self.rounds += 1
+    res = []
+    for c in self.alive:
+      for f in self.fncs:
+        res += [(c, f)] * (self.runs - len(self.times[c][f.title]))
+    return res
+
+  def add(self, c, f, t):
+    self.times[c][f.title].append(t)
+
+  def score(self, c):
+    """The mean time of a configuration (where every function counts the same)."""
+    means = [sum(ts) / len(ts) for ts in self.times[c].values() if len(ts) > 0]
+    if len(means) == 0:
+      return float("inf")
+    return sum(means) / len(means)
+
+  def finish_round(self):
+    self.alive.sort(key=self.score)
+    keep = max(1, int(math.ceil(float(len(self.alive)) / self.eta)))
+    for c in self.alive[keep:]:
+      self.eliminated[c] = self.rounds
+    del self.alive[keep:]
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+/*
+ * Copyright (c) 2014 Samsung Electronics Co., Ltd.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *        http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+/**
+ * Saving and loading the precomputed information of a search (inputs and loop proposals), so
+ * that it only needs to be computed once for many searches.  Traces are not stored, but
+ * recorded again from the inputs when loading.
+ */
+
+import Util = require('./util/Util')
+import Recorder = require('./Recorder')
+import StructureInference = require('./StructureInference')
+import Search = require('./Search')
+
+var VERSION = 1
+
+/**
+ * Return JavaScript source code that evaluates to (a copy of) the value v.  Only supports
+ * values that can be written as literals (and functions that don't close over anything).
+ */
+export function serialize(v: any): string {
+    if (v === undefined) return "undefined"
+    if (v === null) return "null"
+    var type = typeof v
+    if (type === "number") {
+        if (v !== v) return "NaN"
+        if (v === 0 && 1/v < 0) return "-0"
+        if (!isFinite(v)) return v > 0 ? "Infinity" : "-Infinity"
+        return "" + v
+    }
+    if (type === "string" || type === "boolean") {
+        return JSON.stringify(v)
+    }
+    if (type === "function") {
+        var src = v.toString()
+        Util.assert(src.indexOf("[native code]") === -1, () => "cannot serialize native function " + src)
+        return "(" + src + ")"
+    }
+    if (Array.isArray(v)) {
+        var elems = []
+        for (var i = 0; i < v.length; i++) {
+            elems.push(i in v ? serialize(v[i]) : "")
+        }
+        // a trailing hole needs an additional comma
+        var trailing = v.length > 0 && !((v.length - 1) in v) ? "," : ""
+        return "[" + elems.join(",") + trailing + "]"
+    }
+    Util.assert(type === "object" && Object.getPrototypeOf(v) === Object.prototype, () => "cannot serialize " + Util.inspect(v, false))
+    return "{" + Object.keys(v).map((k) => JSON.stringify(k) + ":" + serialize(v[k])).join(",") + "}"
+}
+
+export function save(pre: Search.Precomputed): string {
+    return JSON.stringify({
+        version: VERSION,
+        inputs: serialize(pre.inputs),
+        loops: pre.loops.map((l) => {
+            return {
+                regex: l.regex,
+                trace: pre.traces.indexOf(l.trace),
+                unrolledLen: l.unrolledLen,
+                prefixStart: l.prefixStart,
+                prefixLen: l.prefixLen,
+                thenStart: l.thenStart,
+                thenLen: l.thenLen,
+                elseStart: l.elseStart,
+                elseLen: l.elseLen,
+                worksFor: l.worksFor,
+            }
+        })
+    })
+}
+
+export function load(f: (...a: any[]) => any, s: string): Search.Precomputed {
+    var o = JSON.parse(s)
+    Util.assert(o.version === VERSION, () => "unsupported bundle version " + o.version)
+    var inputs: any[][] = eval("(" + o.inputs + ")")
+    var traces = inputs.map((i) => Recorder.record(f, i))
+    var loops = o.loops.map((l) => {
+        var p = new StructureInference.Proposal(l.regex, traces[l.trace], l.unrolledLen, l.prefixStart, l.prefixLen,
+            l.thenStart, l.thenLen, l.elseStart, l.elseLen)
+        p.worksFor = l.worksFor
+        return p
+    })
+    return new Search.Precomputed(inputs, traces, loops)
+}
@@ -29,7 +29,90 @@ var line = Util.line
  * Serialization code (stupid, but works well enough)
  */
 export class Serialize {
-
+    /** Serialize a program to a string (see parseProgram). */
+    static program(p: Program): string {
+        return JSON.stringify(Serialize.node(p.body))
+    }
+    /** Parse a program serialized with Serialize.program. */
+    static parseProgram(s: string): Program {
+        var vars = new Map<string, Var>()
+        return new Program(<Stmt>Serialize.parse(JSON.parse(s), vars))
+    }
+    private static value(v: any): any {
+        if (v === undefined) return { u: 1 }
+        if (typeof v === "number" && (v !== v || !isFinite(v) || (v === 0 && 1/v < 0))) {
+            return { n: v !== v ? "NaN" : (v === 0 ? "-0" : (v > 0 ? "Infinity" : "-Infinity")) }
+        }
+        return v
+    }
+    private static parseValue(v: any): any {
+        if (v !== null && typeof v === "object") {
+            return "u" in v ? undefined : +v.n
+        }
+        return v
+    }
+    private static node(n: Node): any {
+        var ser = (x: Node) => x === null ? null : Serialize.node(x)
+        if (n instanceof Field) return ["Field", ser(n.o), ser(n.f)]
+        if (n instanceof Argument) return ["Argument", ser(n.i)]
+        if (n instanceof Has) return ["Has", ser(n.o), ser(n.f)]
+        if (n instanceof Binary) return ["Binary", ser(n.a), n.op, ser(n.b)]
+        if (n instanceof Unary) return ["Unary", n.op, ser(n.e)]
+        if (n instanceof Var) return ["Var", n.name]
+        if (n instanceof Const) return ["Const", Serialize.value(n.val)]
+        if (n instanceof Alloc) return ["Alloc", n.isArray]
+        if (n instanceof If) return ["If", ser(n.c), ser(n.thn), ser(n.els)]
+        if (n instanceof For) return ["For", ser(n.start), ser(n.end), ser(n.inc), ser(n.body), ser(n.variable)]
+        if (n instanceof Seq) return ["Seq", n.stmts.map(ser)]
+        if (n instanceof Marker) return ["Marker"]
+        if (n instanceof Assign) return ["Assign", ser(n.lhs), ser(n.rhs), n.isDecl]
+        if (n instanceof FuncCall) return ["FuncCall", ser(n.v), ser(n.f), n.args.map(ser), ser(n.recv), n.isDecl]
+        if (n instanceof Return) return ["Return", ser(n.rhs)]
+        if (n instanceof Throw) return ["Throw", ser(n.rhs)]
+        if (n instanceof Break) return ["Break"]
+        if (n instanceof DeleteProp) return ["DeleteProp", ser(n.o), ser(n.f)]
+        if (n instanceof DefineProp) return ["DefineProp", ser(n.o), ser(n.f), ser(n.v)]
+        Util.assert(false, () => "cannot serialize " + n)
+        return null
+    }
+    private static parse(o: any, vars: Map<string, Var>): Node {
+        if (o === null) return null
+        var p = (x: any) => Serialize.parse(x, vars)
+        switch (o[0]) {
+            case "Field": return new Field(<Expr>p(o[1]), <Expr>p(o[2]))
+            case "Argument": return new Argument(<Expr>p(o[1]))
+            case "Has": return new Has(<Expr>p(o[1]), <Expr>p(o[2]))
+            case "Binary": return new Binary(<Expr>p(o[1]), o[2], <Expr>p(o[3]))
+            case "Unary": return new Unary(o[1], <Expr>p(o[2]))
+            case "Var":
+                // variables are shared between the statements that use them
+                if (!vars.has(o[1])) {
+                    vars.set(o[1], new Var(o[1], true))
+                    // make sure fresh variables don't get the same name
+                    var m = /^([a-z]+)([0-9]*)$/.exec(o[1])
+                    if (m !== null) {
+                        var next = m[2] === "" ? 1 : +m[2] + 1
+                        Var._count[m[1]] = Math.max(Var._count[m[1]] || 0, next)
+                    }
+                }
+                return vars.get(o[1])
+            case "Const": return new Const(Serialize.parseValue(o[1]))
+            case "Alloc": return new Alloc(o[1])
+            case "If": return new If(<Expr>p(o[1]), <Stmt>p(o[2]), <Stmt>p(o[3]))
+            case "For": return new For(<Expr>p(o[1]), <Expr>p(o[2]), <Expr>p(o[3]), <Stmt>p(o[4]), <Var>p(o[5]))
+            case "Seq": return new Seq(o[1].map(p))
+            case "Marker": return new Marker()
+            case "Assign": return new Assign(<Expr>p(o[1]), <Expr>p(o[2]), o[3])
+            case "FuncCall": return new FuncCall(<Var>p(o[1]), <Expr>p(o[2]), o[3].map(p), <Expr>p(o[4]), o[5])
+            case "Return": return new Return(<Expr>p(o[1]))
+            case "Throw": return new Throw(<Expr>p(o[1]))
+            case "Break": return new Break()
+            case "DeleteProp": return new DeleteProp(<Expr>p(o[1]), <Expr>p(o[2]))
+            case "DefineProp": return new DefineProp(<Expr>p(o[1]), <Expr>p(o[2]), <Expr>p(o[3]))
+        }
+        Util.assert(false, () => "cannot parse " + JSON.stringify(o))
+        return null
+    }
 }
 
 
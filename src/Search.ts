@@ -59,9 +59,18 @@ export function runSearch(f, a, config: SearchConfig = new SearchConfig()) {
 }
 
 /**
- * Search for a model of a given function.
+ * The information computed before the actual search starts, which only depends on the function
+ * and its initial inputs (and can thus be shared between searches, see Bundle).
  */
-export function search(f: (...a: any[]) => any, args: any[][], config: SearchConfig): SearchResult {
+export class Precomputed {
+    constructor(public inputs: any[][], public traces: Data.Trace[], public loops: StructureInference.Proposal[]) {
+    }
+}
+
+/**
+ * Generate inputs, record their traces and infer possible loop structures.
+ */
+export function precompute(f: (...a: any[]) => any, args: any[][], config: SearchConfig): Precomputed {
     if (config.debug) Ansi.Gray("Recording original execution...")
     var trace = Recorder.record(f, args[0])
     if (config.debug) print(trace)
@@ -73,9 +82,54 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
 
     if (config.debug) Ansi.Gray("Loop inference...")
     var loops = StructureInference.infer(traces)
+    return new Precomputed(inputs, traces, loops)
+}
+
+/**
+ * A snapshot of a running search, as reported periodically (see SearchConfig.progress).
+ */
+export class Progress {
+    constructor(public phase: string, public iterations: number, public score: number, public best: number,
+                public loopIndex: number) {
+    }
+}
+
+/**
+ * The best program of a search that timed out, from which a later search can continue.  The loop
+ * index refers to the loop proposals of the function that was searched (-1 if there is no loop, or
+ * if the program comes from the search for a different function).
+ */
+export class Checkpoint {
+    constructor(public program: Data.Program, public score: number, public phase: string, public loopIndex: number) {
+    }
+}
+
+/**
+ * Search for a model of a given function.  If the precomputed information is not given, it is
+ * computed first.  If a reporter is given, it is called with the progress of the search every
+ * config.progress seconds.  If a checkpoint is given, the search continues from its program
+ * (and loop), rather than starting from the program compiled from a trace.
+ */
+export function search(f: (...a: any[]) => any, args: any[][], config: SearchConfig, pre: Precomputed = null,
+                       reporter: (p: Progress) => void = null, resume: Checkpoint = null): SearchResult {
+    var deadline = config.timeout > 0 ? Util.start() + config.timeout * 1000 : 0
+    if (config.progress <= 0) {
+        reporter = null
+    }
+    if (pre === null) {
+        pre = precompute(f, args, config)
+    }
+    var inputs = pre.inputs
+    var traces = pre.traces
+    var loops = pre.loops
     var loop = null
     var loopindex = -1
-    if (config.loopIndex != -1) {
+    if (resume !== null) {
+        if (resume.loopIndex >= 0) {
+            loopindex = resume.loopIndex
+            loop = loops[loopindex]
+        }
+    } else if (config.loopIndex != -1) {
         if (config.loopIndex >= 0) {
             loopindex = config.loopIndex
             loop = loops[loopindex]
@@ -99,10 +153,12 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
     if (config.debug && loop != null) Ansi.Gray("Using this loop [" + loopindex + "]: " + loop)
 
     if (config.debug) Ansi.Gray("Input categorization...")
-    var categories = InputGen.categorize(inputs, traces, loop)
+    var categories = resume === null ? InputGen.categorize(inputs, traces, loop) : []
     if (config.debug) Ansi.Gray("Found " + categories.length + " categories of inputs.")
 
-    function straightLineSearch(f: (...a: any[]) => any, inputs: any[][], iterations: number, loop: StructureInference.Proposal, p?: Data.Program) {
+    // loopIndex is the index of the loop of the program that is searched (for progress reports and checkpoints)
+    function straightLineSearch(f: (...a: any[]) => any, inputs: any[][], iterations: number, loop: StructureInference.Proposal,
+                                loopIndex: number, phase: string, p?: Data.Program) {
         if (!p) {
             var t = Recorder.record(f, inputs[0])
             p = Compile.compileTrace(t, loop)
@@ -130,7 +186,11 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
             iterations: iterations,
             randomChange: (pp) => ProgramGen.randomChange(mutationInfo, pp),
             base: config,
-            only_better: false
+            only_better: false,
+            deadline: deadline,
+            phase: phase,
+            loopIndex: loopIndex,
+            reporter: reporter
         })
         result.executions = inputs.length * result.iterations
 
@@ -142,7 +202,12 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
     var p: Data.Program
     var mainSearch = SearchResult.Empty
     if (config.debug) Ansi.Gray(Util.linereturn())
-    if (categories.length > 1) {
+    if (resume !== null) {
+        if (config.debug) Ansi.Gray("Continuing from a checkpoint with score " + resume.score.toFixed(2) + ".")
+        mainSearch = straightLineSearch(f, inputs, config.iterations, loop, loopindex, "main", resume.program)
+        p = mainSearch.result
+        if (config.debug) Ansi.Gray(Util.linereturn())
+    } else if (categories.length > 1) {
         var res: SearchResult[] = []
         var iterations = Math.ceil(0.8*config.iterations/categories.length)
         for (var i = 0; i < categories.length; i++) {
@@ -150,17 +215,19 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
             if (i > 0) {
                 loop = null
             }
-            res[i] = straightLineSearch(f, categories[i].inputs, iterations, loop)
+            res[i] = straightLineSearch(f, categories[i].inputs, iterations, loop, loop === null ? -1 : loopindex,
+                "category " + (i+1) + "/" + categories.length)
             mainSearch = mainSearch.combine(res[i])
             if (config.debug) Ansi.Gray(Util.linereturn())
         }
         if (config.debug) Ansi.Gray("Searching a program for all " + inputs.length + " inputs.")
         p = new Data.Program(combinePrograms(res.map((p) => p.result.body)))
-        mainSearch = straightLineSearch(f, inputs, 0.2*iterations, null, p).combine(mainSearch)
+        // the combined program has the loop of the first category (if any)
+        mainSearch = straightLineSearch(f, inputs, 0.2*iterations, null, loopindex, "main", p).combine(mainSearch)
         p = mainSearch.result
     } else {
         if (config.debug) Ansi.Gray("Searching a program for all " + inputs.length + " inputs.")
-        mainSearch = straightLineSearch(f, inputs, config.iterations, loop)
+        mainSearch = straightLineSearch(f, inputs, config.iterations, loop, loopindex, "main")
         p = mainSearch.result
         if (config.debug) Ansi.Gray(Util.linereturn())
     }
@@ -187,7 +254,11 @@ export function search(f: (...a: any[]) => any, args: any[][], config: SearchCon
             iterations: config.cleanupIterations,
             randomChange: (pp) => ProgramGen.randomChange(mutationInfo, pp),
             base: config,
-            only_better: true
+            only_better: true,
+            deadline: deadline,
+            phase: "cleanup",
+            loopIndex: loopindex,
+            reporter: reporter
         })
         secondarySearch.executions = cleanupInputs.length * secondarySearch.iterations
         p = secondarySearch.result
@@ -356,9 +427,23 @@ export class SearchResult {
     }
 }
 
+/**
+ * Thrown when a search runs past the timeout given in its configuration, with the best program
+ * found so far.
+ */
+export class SearchTimeout {
+    constructor(public iterations: number, public checkpoint: Checkpoint) {
+    }
+    toString() {
+        return "Search timed out after " + this.iterations + " iterations"
+    }
+}
+
 export class SearchConfig {
     static DEFAULT = {
         iterations: 50000,
+        timeout: 0,
+        progress: 0,
         cleanupIterations: 0,
         debug: 0,
         loopIndex: -1,
@@ -372,6 +457,8 @@ export class SearchConfig {
     }
     constructor(o: SearchConfig = SearchConfig.DEFAULT) {
         this.iterations = o.iterations
+        this.timeout = o.timeout
+        this.progress = o.progress
         this.cleanupIterations = o.cleanupIterations
         this.debug = o.debug
         this.loopIndex = o.loopIndex
@@ -385,6 +472,10 @@ export class SearchConfig {
         Util.assert(!(this.alwaysAcceptEqualCost && this.neverAcceptEqualCost))
     }
     iterations: number
+    /** Timeout in seconds for the whole search (0 for no timeout). */
+    timeout: number
+    /** Interval in seconds between progress reports (0 for no reports). */
+    progress: number
     cleanupIterations: number
     debug: number
     loopIndex: number
@@ -403,6 +494,7 @@ export class SearchConfig {
                 ", and alphaloop " + this.alphaloop +
                 ", and beta " + this.beta +
                 ", and gamma " + this.gamma +
+                (this.timeout > 0 ? ", and timeout " + this.timeout + "s" : "") +
                 (this.alwaysAcceptEqualCost ? ", and always accept equal cost" : "") +
                 (this.neverAcceptEqualCost ? ", and never accept equal cost" : "")
     }
@@ -414,12 +506,27 @@ interface CoreSearchConfig {
     randomChange: (p: Data.Program) => Data.Program
     base: SearchConfig
     only_better: boolean
+    /** Absolute time (in milliseconds) after which the search is aborted, or 0. */
+    deadline: number
+    /** The name of this part of the search, for progress reports. */
+    phase: string
+    loopIndex: number
+    /** Called with the progress every base.progress seconds (if not null). */
+    reporter: (p: Progress) => void
 }
 
 function core_search(p: Data.Program, config: CoreSearchConfig): SearchResult {
     var start = Util.start()
     var badness = config.metric(p)
     var n = config.iterations
+    var best = badness
+    var bestp = p
+    var report = (i: number) => config.reporter(new Progress(config.phase, i, badness, best, config.loopIndex))
+    var nextReport = 0
+    if (config.reporter !== null) {
+        report(0)
+        nextReport = start + config.base.progress * 1000
+    }
     var i
     for (i = 0; i < n; i++) {
         if (badness === 0) {
@@ -427,6 +534,16 @@ function core_search(p: Data.Program, config: CoreSearchConfig): SearchResult {
             break;
         }
         if (p.body.numberOfStmts() === 0) break;
+        if (i % 100 === 0 && (config.deadline > 0 || config.reporter !== null)) {
+            var now = Util.start()
+            if (config.deadline > 0 && now > config.deadline) {
+                throw new SearchTimeout(i, new Checkpoint(bestp, best, config.phase, config.loopIndex))
+            }
+            if (config.reporter !== null && now >= nextReport) {
+                report(i)
+                nextReport = now + config.base.progress * 1000
+            }
+        }
         var newp = config.randomChange(p)
         var newbadness = config.metric(newp)
         var str = null//"result = result+n1"
@@ -444,6 +561,10 @@ function core_search(p: Data.Program, config: CoreSearchConfig): SearchResult {
             Util.assert(p.toString() != newp.toString())
             p = newp
             badness = newbadness
+            if (badness < best) {
+                best = badness
+                bestp = p
+            }
         } else if (!config.only_better) {
             var alpha = Math.min(1, Math.exp(-base.beta * (newbadness - badness) - base.gamma))
             if (base.alwaysAcceptEqualCost || (!base.neverAcceptEqualCost && maybe(alpha))) {
@@ -29,26 +29,252 @@ import Data = require('./Data')
 import Search = require('./Search')
 import Recorder = require('./Recorder')
 import StructureInference = require('./StructureInference')
+import Bundle = require('./Bundle')
 var fs = require('fs')
 
 var log = Util.log
 var print = Util.print
 var line = Util.line
 
-var commands = ["synth", "record"]
+var commands = ["synth", "record", "precompute", "worker"]
 
 function error(message) {
     print(Ansi.red("Error: " + message))
     Util.exit(2)
 }
 
+/**
+ * An error in the input provided by the user (as opposed to a failure of the search).
+ */
+class InputError {
+    constructor(public message: string) {
+    }
+    toString() {
+        return this.message
+    }
+}
+
+/** Parse the opaque function from its argument names (comma-separated) and its body. */
+function parseFunction(argnames: string, body: string): (...a: any[]) => any {
+    var fstr = argnames.split(",")
+    fstr.push(body)
+    try {
+        return Function.apply(null, fstr)
+    } catch (e) {
+        throw new InputError("Could not parse function '"+fstr+"'\n  " + e)
+    }
+}
+
+/** Parse a list of initial inputs, each given as a comma-separated list of arguments. */
+function parseArguments(strs: string[]): any[][] {
+    var args = []
+    for (var i = 0; i < strs.length; i++) {
+        try {
+            var arg = strs[i]
+            args.push(eval("[" + arg + "]"))
+        } catch (e) {
+            throw new InputError("Error: Could not parse argument " + (i) + " '"+arg+"':\n  " + e)
+        }
+    }
+    return args
+}
+
+/** Build the search configuration from the (parsed) command line options. */
+function parseConfig(argv): Search.SearchConfig {
+    var config = new Search.SearchConfig()
+    if ("cleanup" in argv) {
+        config.cleanupIterations = argv.cleanup
+    }
+    if ("iterations" in argv) {
+        config.iterations = argv.iterations
+    }
+    if ("timeout" in argv) {
+        config.timeout = +argv.timeout
+    }
+    if ("progress" in argv) {
+        config.progress = +argv.progress
+    }
+    if ("loop" in argv) {
+        config.loopIndex = argv.loop
+    }
+    if ("metric" in argv) {
+        config.metric = +argv.metric
+    }
+    if ("verbose" in argv) {
+        config.debug = 1
+    }
+    if ("alwaysAcceptEqualCost" in argv) {
+        config.alwaysAcceptEqualCost = true
+    }
+    if ("neverAcceptEqualCost" in argv) {
+        config.neverAcceptEqualCost = true
+    }
+    if ("beta" in argv) {
+        config.beta = +argv.beta
+    }
+    if ("gamma" in argv) {
+        config.gamma = +argv.gamma
+    }
+    if ("alpha" in argv) {
+        config.alpha = +argv.alpha
+    }
+    if ("alphaloop" in argv) {
+        config.alphaloop = +argv.alphaloop
+    }
+    return config
+}
+
+/** Load the precomputed information for f from a file written by the `precompute' subcommand. */
+function loadBundle(f: (...a: any[]) => any, file: string): Search.Precomputed {
+    try {
+        return Bundle.load(f, fs.readFileSync(file, "utf8"))
+    } catch (e) {
+        throw new InputError("Could not load bundle '" + file + "':\n  " + e)
+    }
+}
+
+/** Write a checkpoint of a search that timed out to a file (see `loadCheckpoint'). */
+function saveCheckpoint(file: string, c: Search.Checkpoint) {
+    fs.writeFileSync(file, JSON.stringify({
+        version: 1,
+        score: c.score,
+        phase: c.phase,
+        loop: c.loopIndex,
+        program: Data.Serialize.program(c.program),
+    }) + "\n")
+}
+
+/**
+ * Load a checkpoint written by `saveCheckpoint'.  If it was written by the search for a different
+ * function (foreign), its loop index refers to the loop proposals of that function, and is dropped.
+ */
+function loadCheckpoint(file: string, foreign: boolean = false): Search.Checkpoint {
+    try {
+        var o = JSON.parse(fs.readFileSync(file, "utf8"))
+        Util.assert(o.version === 1, () => "unsupported checkpoint version " + o.version)
+        return new Search.Checkpoint(Data.Serialize.parseProgram(o.program), o.score, o.phase, foreign ? -1 : o.loop)
+    } catch (e) {
+        throw new InputError("Could not load checkpoint '" + file + "':\n  " + e)
+    }
+}
+
+/** Send a message to the process driving a worker (see the `worker' subcommand). */
+function send(msg: any) {
+    process.stdout.write("@mimic " + JSON.stringify(msg) + "\n")
+}
+
+/**
+ * Returns a reporter that sends the progress of a search as a message (see `send'), with the
+ * time elapsed since start.
+ */
+function progressReporter(id: any, start: number): (p: Search.Progress) => void {
+    return (p: Search.Progress) => {
+        send({
+            type: "progress",
+            id: id,
+            phase: p.phase,
+            iterations: p.iterations,
+            score: p.score,
+            best: p.best,
+            loop_index: p.loopIndex >= 0 ? p.loopIndex + 1 : -1,
+            elapsed: Util.stop(start) / 1000
+        })
+    }
+}
+
+/**
+ * Run as a long-lived worker: read synthesis jobs (one JSON object per line) from stdin,
+ * and report the outcome of each one on stdout as a line starting with "@mimic".  A job
+ * contains the function ("argnames", "function", "arguments"), and may override any of
+ * the options the worker was started with (e.g., "seed", "metric", "loop", "timeout", "out").
+ * With the "progress" option, the worker also reports the progress of the search periodically.
+ * With the "checkpoint" option, the best program of a search that times out is written to the
+ * given file, and the "resume" option continues the search from such a file.  With the "foreign"
+ * option, that file comes from the search for a different function, and its loop does not apply.
+ * With the "program" option, the model found is also written to a file in the same format.
+ */
+function worker(base) {
+    // bundles are only loaded once per worker
+    var bundles = new Map<string, Search.Precomputed>()
+    var readline = require('readline')
+    var rl = readline.createInterface({ input: process.stdin, terminal: false })
+    rl.on('line', (l: string) => {
+        if (l.trim() === "") return
+        var start = Util.start()
+        var msg: any = { type: "result", status: 1 }
+        try {
+            var job = JSON.parse(l)
+            var opts: any = {}
+            for (var k in base) opts[k] = base[k]
+            for (var k in job) opts[k] = job[k]
+            msg.id = opts.id
+            if ('seed' in opts) {
+                msg.seed = +opts.seed
+            }
+            Random.resetRandomness('seed' in opts ? +opts.seed : -1)
+            var f = parseFunction(opts.argnames, opts.function)
+            var args = parseArguments(opts.arguments)
+            var config = parseConfig(opts)
+            var pre: Search.Precomputed = null
+            if ("bundle" in opts) {
+                if (!bundles.has(opts.bundle)) {
+                    bundles.set(opts.bundle, loadBundle(f, opts.bundle))
+                }
+                pre = bundles.get(opts.bundle)
+            }
+            var resume = "resume" in opts ? loadCheckpoint(opts.resume, "foreign" in opts) : null
+            Ansi.Gray("Configuration: " + config.toString())
+            var res = Search.search(f, args, config, pre, progressReporter(msg.id, start), resume)
+            Ansi.Gray("Found in " + res.iterations + " iterations and " + (res.time / 1000).toFixed(3) + " seconds:")
+            Ansi.Gray(Util.indent(res.getStats()))
+            msg.iterations = res.iterations
+            msg.time = res.time / 1000
+            msg.score = res.score
+            msg.loop_index = res.loopIndex >= 0 ? res.loopIndex + 1 : -1
+            if (res.score === 0) {
+                msg.status = 0
+                if ("out" in opts) {
+                    fs.writeFileSync(opts.out, res.result.toFullProgram("f") + "\n");
+                }
+                if ("program" in opts) {
+                    saveCheckpoint(opts.program, new Search.Checkpoint(res.result, 0, "done", res.loopIndex))
+                }
+            }
+        } catch (e) {
+            if (e instanceof Search.SearchTimeout) {
+                msg.status = 124
+                msg.iterations = e.iterations
+                if ("checkpoint" in opts) {
+                    saveCheckpoint(opts.checkpoint, e.checkpoint)
+                    msg.checkpoint = { score: e.checkpoint.score, phase: e.checkpoint.phase, loop: e.checkpoint.loopIndex }
+                }
+            } else {
+                msg.status = e instanceof InputError ? 2 : 1
+                msg.error = "" + e
+                print(Ansi.red("Error: " + e))
+            }
+        }
+        msg.elapsed = Util.stop(start) / 1000
+        send(msg)
+    })
+    rl.on('close', () => Util.exit(0))
+}
+
 var argc = Util.argvlength();
-if (argc < 6) {
+if (Util.argv(2) === "worker") {
+    var argv = require('minimist')(process.argv.slice(3))
+    if ('colors' in argv && argv.colors == '0') {
+        Ansi.set_use_color(false)
+    }
+    worker(argv)
+} else if (argc < 6) {
     print("Usage: mimic (" + commands.join("|") + ") arg-names function-body args0 [args1 [args2 ...]]")
     print('Example: mimic synth "x,y" "return x+1" "1"')
     print("")
     print("  synth   synthesize a model for a given function")
     print("  record  record a trace for a given function")
+    print("  precompute  compute the inputs and loop proposals for a given function once (see --bundle)")
+    print("  worker  synthesize models for jobs read from stdin (one JSON object per line)")
     Util.exit(2)
 } else {
     var subcommand = Util.argv(2)
@@ -66,60 +292,33 @@ if (argc < 6) {
         Ansi.set_use_color(false)
     }
 
-    var fstr = argv._[0].split(",")
-    fstr.push(argv._[1])
     try {
-        var f = Function.apply(null, fstr)
+        var f = parseFunction(argv._[0], argv._[1])
+        var args = parseArguments(argv._.slice(2))
     } catch (e) {
-        error("Could not parse function '"+fstr+"'\n  " + e)
-    }
-    var args = []
-    for (var i = 0; i < argv._.length - 2; i++) {
-        try {
-            var arg = argv._[2+i]
-            args.push(eval("[" + arg + "]"))
-        } catch (e) {
-            error("Error: Could not parse argument " + (i) + " '"+arg+"':\n  " + e)
-        }
+        error(e.message)
     }
 
     if (subcommand === "synth") {
-        var config = new Search.SearchConfig()
-        if ("cleanup" in argv) {
-            config.cleanupIterations = argv.cleanup
-        }
-        if ("iterations" in argv) {
-            config.iterations = argv.iterations
-        }
-        if ("loop" in argv) {
-            config.loopIndex = argv.loop
-        }
-        if ("metric" in argv) {
-            config.metric = +argv.metric
-        }
-        if ("verbose" in argv) {
-            config.debug = 1
-        }
-        if ("alwaysAcceptEqualCost" in argv) {
-            config.alwaysAcceptEqualCost = true
-        }
-        if ("neverAcceptEqualCost" in argv) {
-            config.neverAcceptEqualCost = true
-        }
-        if ("beta" in argv) {
-            config.beta = +argv.beta
-        }
-        if ("gamma" in argv) {
-            config.gamma = +argv.gamma
-        }
-        if ("alpha" in argv) {
-            config.alpha = +argv.alpha
-        }
-        if ("alphaloop" in argv) {
-            config.alphaloop = +argv.alphaloop
-        }
+        var config = parseConfig(argv)
         Ansi.Gray("Configuration: " + config.toString())
-        var res = Search.search(f, args, config)
+        try {
+            var pre = "bundle" in argv ? loadBundle(f, argv.bundle) : null
+            var resume = "resume" in argv ? loadCheckpoint(argv.resume, "foreign" in argv) : null
+            var res = Search.search(f, args, config, pre, progressReporter(null, Util.start()), resume)
+        } catch (e) {
+            if (e instanceof Search.SearchTimeout) {
+                Ansi.Red(e.toString())
+                if ("checkpoint" in argv) {
+                    saveCheckpoint(argv.checkpoint, e.checkpoint)
+                }
+                Util.exit(124)
+            }
+            if (e instanceof InputError) {
+                error(e.message)
+            }
+            throw e
+        }
         Ansi.Gray("Found in " + res.iterations + " iterations and " + (res.time / 1000).toFixed(3) + " seconds:")
         Ansi.Gray(Util.indent(res.getStats()))
         var exit = 1
@@ -131,6 +330,9 @@ if (argc < 6) {
             if ("out" in argv) {
                 fs.writeFileSync(argv.out, res.result.toFullProgram("f") + "\n");
             }
+            if ("program" in argv) {
+                saveCheckpoint(argv.program, new Search.Checkpoint(res.result, 0, "done", res.loopIndex))
+            }
         }
         print(res.result.toFullProgram("f"))
         Util.exit(exit)
@@ -142,6 +344,18 @@ if (argc < 6) {
             error("No arguments provided.")
         }
         var trace = Recorder.record(f, args[0])
-        print(trace)
+        if ("skeleton" in argv) {
+            // just the kinds of events (see Data.Trace.getSkeletonShort)
+            print(trace.getSkeletonShort())
+        } else {
+            print(trace)
+        }
+    } else if (subcommand === "precompute") {
+        var bundle = Bundle.save(Search.precompute(f, args, parseConfig(argv)))
+        if ("out" in argv) {
+            fs.writeFileSync(argv.out, bundle + "\n")
+        } else {
+            print(bundle)
+        }
     }
 }
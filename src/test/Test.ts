@@ -36,6 +36,7 @@ import Recorder = require('../Recorder')
 import ProgramGen = require('../ProgramGen')
 import StructureInference = require('../StructureInference')
 import Search = require('../Search')
+import Bundle = require('../Bundle')
 
 var print = Util.print
 var log = Util.log
@@ -218,12 +219,42 @@ function search_test(f, a, a0, name, oracle, k) {
     })
 }
 
+function serialize_test(f, a, a0, name, oracle) {
+    it('should serialize the program for ' + name, () => {
+        var p = Compile.compileTrace(Recorder.record(f, a0))
+        var p1 = Data.Serialize.parseProgram(Data.Serialize.program(p))
+        ass.equal(p1.toString(), p.toString())
+    })
+}
+
+function bundle_test(f, a, a0, name, oracle) {
+    it('should save and load the bundle for ' + name, () => {
+        var config = new Search.SearchConfig()
+        config.debug = 0
+        var pre = Search.precompute(f, a, config)
+        var pre1 = Bundle.load(f, Bundle.save(pre))
+        ass.equal(Bundle.serialize(pre1.inputs), Bundle.serialize(pre.inputs))
+        ass.equal(pre1.traces.length, pre.traces.length)
+        ass.equal(pre1.loops.length, pre.loops.length)
+        for (var i = 0; i < pre.loops.length; i++) {
+            var l = pre.loops[i]
+            var l1 = pre1.loops[i]
+            ass.equal(l1.regex, l.regex)
+            ass.equal(pre1.traces.indexOf(l1.trace), pre.traces.indexOf(l.trace))
+            ass.deepEqual([l1.unrolledLen, l1.prefixStart, l1.prefixLen, l1.thenStart, l1.thenLen, l1.elseStart, l1.elseLen],
+                [l.unrolledLen, l.prefixStart, l.prefixLen, l.thenStart, l.thenLen, l.elseStart, l.elseLen])
+            ass.deepEqual(l1.worksFor, l.worksFor)
+        }
+    })
+}
 
 var tests = [
     ["Recorder", recorder_test],
     ["InputGen.categorize", inputgen_test],
     ["Compile", compile_test],
     ["Search", search_test],
+    ["Data.Serialize", serialize_test],
+    ["Bundle", bundle_test],
 ]
 
 for (var k = 0; k < tests.length; k++) {
@@ -316,3 +347,54 @@ describe("Search.combinePrograms2", () => {
         Util.assert((<Data.Assign>p.allStmts()[1]).isDecl, () => "should be a decl")
     })
 })
+
+describe("Data.Serialize", () => {
+    var v = new Data.Var()
+    var p = new Data.Program(new Data.Seq([
+        <Data.Stmt>new Data.Assign(v, new Data.Const(NaN), true),
+        <Data.Stmt>new Data.Assign(new Data.Var(), new Data.Const(-0), true),
+        <Data.Stmt>new Data.Assign(new Data.Var(), new Data.Const(-Infinity), true),
+        <Data.Stmt>new Data.Assign(new Data.Field(new Data.Argument(new Data.Const(0)), new Data.Const("f")), new Data.Const(undefined)),
+        <Data.Stmt>new Data.Return(v),
+    ]))
+    var p1 = Data.Serialize.parseProgram(Data.Serialize.program(p))
+    var stmts = p1.body.allStmts()
+    var value = (i: number) => (<Data.Const>(<Data.Assign>stmts[i]).rhs).val
+
+    it("should keep special numbers and undefined", () => {
+        Util.assert(value(0) !== value(0), () => "should be NaN")
+        ass.equal(1 / value(1), -Infinity)
+        ass.equal(value(2), -Infinity)
+        ass.equal(value(3), undefined)
+    })
+
+    it("should share variables between statements", () => {
+        ass.equal((<Data.Return>stmts[4]).rhs, (<Data.Assign>stmts[0]).lhs)
+        ass.equal(p1.toString(), p.toString())
+    })
+})
+
+describe("Bundle.serialize", () => {
+    var roundtrip = (v: any) => eval("(" + Bundle.serialize(v) + ")")
+
+    it("should keep special values", () => {
+        var v = roundtrip([NaN, -0, Infinity, undefined, null, "a\"b", true])
+        Util.assert(v[0] !== v[0], () => "should be NaN")
+        ass.equal(1 / v[1], -Infinity)
+        ass.equal(v[2], Infinity)
+        Util.assert(3 in v && v[3] === undefined, () => "should be undefined")
+        ass.deepEqual(v.slice(4), [null, "a\"b", true])
+    })
+
+    it("should keep holes in arrays", () => {
+        var v = roundtrip([1, , 3, , ])
+        ass.equal(v.length, 4)
+        Util.assert(!(1 in v) && !(3 in v), () => "should be holes")
+    })
+
+    it("should keep objects and functions", () => {
+        var v = roundtrip({a: [1, {b: "c"}], f: (x) => x + 1})
+        ass.deepEqual(v.a, [1, {b: "c"}])
+        ass.equal(v.f(1), 2)
+    })
+})